@@ -0,0 +1,160 @@
+"""合成基准语料生成器
+
+按固定随机种子生成中文小说（带 `第N章` 标题）与 `storyboards -> scripts` 剧本，
+同一参数多次生成的内容完全一致，用于性能基准对比。
+"""
+
+from __future__ import annotations
+
+import random
+from typing import Any
+
+NARRATION_SPEAKER = "旁白"
+
+_NUMERALS = "零一二三四五六七八九"
+
+_NAMES = ["沈砚", "顾行舟", "魏伯", "林晚", "周叙", "许青禾", "陆迟", "白露"]
+_PLACES = ["旧渡口", "栈桥", "档案室", "木屋", "暗河入口", "警局走廊", "书店后院", "废弃船坞", "河岸", "码头"]
+_TIMES = ["雨夜", "清晨", "黄昏", "深夜", "黎明", "暮色里", "薄雾中"]
+_ACTIONS = [
+    "翻开泛黄的卷宗",
+    "把账本推到桌角",
+    "盯着水面上的灯影",
+    "压低声音说出那个名字",
+    "在潮湿的台阶上停住脚步",
+    "听见铜铃在风里轻响",
+    "摸到木门上新刻的划痕",
+    "发现船舱里还留着余温",
+]
+# 景物描写由“景物 + 状态”两半随机组合：整句固定的描写会让小说切出的旁白候选大量近重复
+_SCENERY_SUBJECTS = ["雨水", "河面", "炉火", "冷风", "灯芯", "潮气", "铜铃", "石板路", "远处的汽笛", "墙上的影子"]
+_SCENERY_STATES = [
+    "顺着屋檐滴落",
+    "泛着冷光",
+    "浮着一层薄雾",
+    "噼啪作响",
+    "从缝隙里钻进来",
+    "爆出一点火星",
+    "贴着衣领往里渗",
+    "时断时续",
+    "被拉得很长",
+    "在风里轻轻摇晃",
+]
+_TWISTS = ["突然", "就在这时", "他终于发现", "真相被揭示时", "转折来得毫无征兆"]
+_DIALOGUES = [
+    "你早就知道了，对吧？",
+    "别回头，继续往前走。",
+    "这本账不是他写的。",
+    "天亮之前必须离开这里。",
+    "我只想知道那天晚上发生了什么。",
+    "船还在，人却不见了。",
+    "再等等，灯还没灭。",
+    "你听，水下有声音。",
+]
+# 剧本对白：称呼 + 带地点/数字的半句 + 固定台词。数字把公共部分隔成不足 20 字（相似度窗口）的片段，
+# 生成的对白绝大多数互不相似，避免批量触发 DUPLICATE_TEXT
+_DIALOGUE_TAILS = [
+    "我在{place}等了{n}天",
+    "{place}那边的仓库是第{n}号",
+    "卷宗在{place}第{n}页",
+    "在{place}碰头的时间是{n}点",
+    "{place}的灯灭过{n}次",
+    "那条船在{place}停了{n}夜",
+]
+
+
+def chapter_numeral(n: int) -> str:
+    """章节序号：100 以内用中文数字，更大的序号用阿拉伯数字（规划器标题正则不识别“零/千”）"""
+    if n < 10:
+        return _NUMERALS[n]
+    if n < 100:
+        tens, ones = divmod(n, 10)
+        return ("" if tens == 1 else _NUMERALS[tens]) + "十" + (_NUMERALS[ones] if ones else "")
+    return str(n)
+
+
+def _scenery(rng: random.Random) -> str:
+    return rng.choice(_SCENERY_SUBJECTS) + rng.choice(_SCENERY_STATES)
+
+
+def _sentence(rng: random.Random) -> str:
+    kind = rng.random()
+    if kind < 0.35:
+        return f"{rng.choice(_TIMES)}，{rng.choice(_NAMES)}在{rng.choice(_PLACES)}{rng.choice(_ACTIONS)}。"
+    if kind < 0.7:
+        return f"{_scenery(rng)}，{rng.choice(_NAMES)}{rng.choice(_ACTIONS)}。"
+    if kind < 0.85:
+        return f"{rng.choice(_TWISTS)}，{rng.choice(_NAMES)}{rng.choice(_ACTIONS)}，{_scenery(rng)}。"
+    return f"“{rng.choice(_DIALOGUES)}”{rng.choice(_NAMES)}说。"
+
+
+def _dialogue(rng: random.Random) -> str:
+    tail = rng.choice(_DIALOGUE_TAILS).format(place=rng.choice(_PLACES), n=rng.randint(1, 999))
+    return f"{rng.choice(_NAMES)}，{tail}。{rng.choice(_DIALOGUES)}"
+
+
+def _script_narration(rng: random.Random) -> str:
+    """剧本旁白：时刻把时间与“人物在地点做什么”隔开，后者不足 20 字，不会与小说原句或彼此判为重复"""
+    return (
+        f"{rng.choice(_TIMES)}{rng.randint(1, 12)}点{rng.randint(0, 59)}分，"
+        f"{rng.choice(_NAMES)}在{rng.choice(_PLACES)}{rng.choice(_ACTIONS)}。"
+    )
+
+
+def _paragraph(rng: random.Random, min_sentences: int = 2, max_sentences: int = 6) -> str:
+    return "".join(_sentence(rng) for _ in range(rng.randint(min_sentences, max_sentences)))
+
+
+def generate_novel(chapter_count: int, paragraphs_per_chapter: int = 8, seed: int = 0) -> str:
+    """生成带 `### 第N章 标题` 的合成小说全文"""
+    rng = random.Random(seed)
+    parts: list[str] = []
+    for i in range(1, chapter_count + 1):
+        title = f"{rng.choice(_TIMES)}{rng.choice(_PLACES)}"
+        parts.append(f"### 第{chapter_numeral(i)}章 {title}")
+        for _ in range(paragraphs_per_chapter):
+            parts.append(_paragraph(rng))
+    return "\n\n".join(parts) + "\n"
+
+
+def generate_script(segment_count: int, segments_per_storyboard: int = 10, seed: int = 0) -> dict[str, Any]:
+    """生成约 `segment_count` 个段落的合成剧本（旁白占比约 30%，需要补强）"""
+    rng = random.Random(seed)
+    storyboards: list[dict[str, Any]] = []
+    seg_no = 0
+    sb_count = max(1, segment_count // segments_per_storyboard)
+    for sb_index in range(1, sb_count + 1):
+        scripts: list[dict[str, Any]] = []
+        for _ in range(segments_per_storyboard):
+            if seg_no >= segment_count:
+                break
+            seg_no += 1
+            if rng.random() < 0.3:
+                speaker = NARRATION_SPEAKER
+                text = _script_narration(rng) + (_script_narration(rng) if rng.random() < 0.3 else "")
+                image = None
+            else:
+                speaker = rng.choice(_NAMES)
+                text = _dialogue(rng)
+                image = f"assets/char_{speaker}.png"
+            scripts.append(
+                {
+                    "id": f"s{seg_no}",
+                    "speaker": speaker,
+                    "text": text,
+                    "character_image": image,
+                    "effect": "typewriter",
+                    "speed": 55,
+                }
+            )
+        if not scripts:
+            break
+        storyboards.append(
+            {
+                "id": f"sb{sb_index}",
+                "title": f"第{chapter_numeral(sb_index)}章 {rng.choice(_TIMES)}{rng.choice(_PLACES)}",
+                "background": {"image": f"assets/scene_{sb_index}.png"},
+                "scripts": scripts,
+            }
+        )
+    return {"shared": {"pipeline_state": {"stage": "benchmark"}}, "storyboards": storyboards}
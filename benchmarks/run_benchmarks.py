@@ -0,0 +1,152 @@
+"""引擎性能基准
+
+在合成语料上计时规划、质检、旁白补强、结构修复与多轮修复，结果写入基线 JSON 并与之对比；
+任一用例相对基线变慢超过阈值时返回非零。
+
+默认只跑小规模（几秒内完成）；1 万与 10 万段落的中、大规模用例需显式加 `--large`。
+
+示例：
+    python benchmarks/run_benchmarks.py --save-baseline
+    python benchmarks/run_benchmarks.py --threshold 0.25
+    python benchmarks/run_benchmarks.py --large --repeat 1
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from benchmarks.corpus import generate_novel, generate_script
+from engine.novel_corpus import NovelCorpus
+from engine.script_quality import analyze_script_quality, enrich_narration_with_novel, normalize_and_repair_script
+from engine.script_refiner import refine_script_until_pass
+from engine.storyboard_planner import build_storyboard_drafts
+
+DEFAULT_SIZES = "300,1000"
+LARGE_SIZES = (10000, 100000)
+DEFAULT_BASELINE = ROOT / "benchmarks" / "baseline.json"
+TARGET_RATIO = 0.45
+
+
+def _corpus(size: int, seed: int) -> tuple[dict[str, Any], str]:
+    script = generate_script(size, seed=seed)
+    # 小说规模随剧本规模增长：每 20 个段落约一章，旁白候选足以把剧本补到目标占比
+    novel = generate_novel(max(6, size // 20), seed=seed)
+    # 与分镜规划器的输出一致，每个分镜记录取材章节的原文区间，补强时就近取材
+    spans = NovelCorpus.from_text(novel).chapter_spans()
+    storyboards = script["storyboards"]
+    for i, sb in enumerate(storyboards):
+        sb["source_span"] = list(spans[i * len(spans) // len(storyboards)])
+    return script, novel
+
+
+def _cases(script: dict[str, Any], novel: str) -> dict[str, Callable[[], Any]]:
+    storyboard_count = len(script["storyboards"])
+    return {
+        "build_storyboard_drafts": lambda: build_storyboard_drafts(novel, target_count=storyboard_count),
+        "analyze_script_quality": lambda: analyze_script_quality(script, min_narration_ratio=TARGET_RATIO),
+        "enrich_narration_with_novel": lambda: enrich_narration_with_novel(script, novel, target_ratio=TARGET_RATIO),
+        "normalize_and_repair_script": lambda: normalize_and_repair_script(script),
+        "refine_script_until_pass": lambda: refine_script_until_pass(script, novel, min_narration_ratio=TARGET_RATIO),
+    }
+
+
+def _time(fn: Callable[[], Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run(sizes: list[int], only: set[str], repeat: int, seed: int) -> dict[str, float]:
+    results: dict[str, float] = {}
+    for size in sizes:
+        script, novel = _corpus(size, seed)
+        for name, fn in _cases(script, novel).items():
+            if only and name not in only:
+                continue
+            key = f"{name}@{size}"
+            results[key] = _time(fn, repeat)
+            print(f"{key:<40} {results[key] * 1000:>10.1f} ms", flush=True)
+    return results
+
+
+def compare(results: dict[str, float], baseline: dict[str, float], threshold: float, min_delta: float) -> list[str]:
+    """返回回归用例描述；变慢比例超过 threshold 且绝对差值超过 min_delta 才算回归"""
+    regressions: list[str] = []
+    for key, seconds in results.items():
+        base = baseline.get(key)
+        if base is None:
+            continue
+        change = (seconds - base) / base if base > 0 else 0.0
+        marker = ""
+        if change > threshold and seconds - base > min_delta:
+            regressions.append(f"{key}: {base * 1000:.1f} ms -> {seconds * 1000:.1f} ms ({change:+.0%})")
+            marker = "  REGRESSION"
+        print(f"{key:<40} base={base * 1000:>10.1f} ms  now={seconds * 1000:>10.1f} ms  {change:+.0%}{marker}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark engine hot paths on a synthetic corpus")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"Comma separated segment counts (default {DEFAULT_SIZES})")
+    parser.add_argument("--large", action="store_true", help=f"Also run the {'/'.join(map(str, LARGE_SIZES))}-segment corpora (slow)")
+    parser.add_argument("--only", action="append", default=[], help="Run only this benchmark (repeatable)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark; the fastest run is recorded (default 3)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE), help="Baseline JSON path")
+    parser.add_argument("--save-baseline", action="store_true", help="Write results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Allowed slowdown ratio before failing (default 0.25)")
+    parser.add_argument("--min-delta", type=float, default=0.005, help="Ignore slowdowns smaller than this many seconds")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    if args.large:
+        sizes.extend(n for n in LARGE_SIZES if n not in sizes)
+    results = run(sizes, set(args.only), max(1, args.repeat), args.seed)
+
+    baseline_path = Path(args.baseline)
+    if args.save_baseline:
+        payload = {
+            "meta": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "seed": args.seed,
+                "repeat": args.repeat,
+            },
+            "results": results,
+        }
+        if baseline_path.is_file():
+            # 合并保留本次未运行的用例
+            previous = json.loads(baseline_path.read_text(encoding="utf-8")).get("results", {})
+            payload["results"] = {**previous, **results}
+        baseline_path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"baseline={baseline_path}")
+        return 0
+
+    if not baseline_path.is_file():
+        print(f"no baseline at {baseline_path}; run with --save-baseline first")
+        return 0
+
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8")).get("results", {})
+    regressions = compare(results, baseline, args.threshold, args.min_delta)
+    if regressions:
+        print("regressions:")
+        for line in regressions:
+            print(f"  {line}")
+        return 1
+    print("no regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,75 @@
+"""多关键词一次扫描匹配（Aho-Corasick）
+
+`KeywordAutomaton` 把一组关键词编译为一个确定性自动机，对文本只扫描一遍即可得到全部命中的关键词，
+耗时与关键词数量无关。自动机字母表之外的字符必然把状态打回根节点，扫描时用正则
+（C 层）直接跳过这些字符，只在由字母表字符组成的片段上逐字推进。
+"""
+
+from __future__ import annotations
+
+import re
+from collections import deque
+from typing import Iterable
+
+
+class KeywordAutomaton:
+    """Aho-Corasick 自动机
+
+    Attributes:
+        keywords: 关键词列表，命中结果为其下标
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords = list(keywords)
+        # 空关键词与 `"" in text` 口径一致：对任意文本都算命中
+        self._always = frozenset(i for i, kw in enumerate(self.keywords) if not kw)
+
+        goto: list[dict[str, int]] = [{}]
+        outputs: list[set[int]] = [set()]
+        for kw_id, keyword in enumerate(self.keywords):
+            state = 0
+            for ch in keyword:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = goto[state][ch] = len(goto)
+                    goto.append({})
+                    outputs.append(set())
+                state = nxt
+            if keyword:
+                outputs[state].add(kw_id)
+
+        # 按 BFS 顺序补全失败转移，得到完整的状态转移表（缺省转移回根节点）
+        fail = [0] * len(goto)
+        delta: list[dict[str, int]] = [dict(goto[0])]
+        delta.extend({} for _ in range(len(goto) - 1))
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            delta[state] = dict(delta[fail[state]])
+            outputs[state] |= outputs[fail[state]]
+            for ch, nxt in goto[state].items():
+                fail[nxt] = delta[fail[state]].get(ch, 0)
+                delta[state][ch] = nxt
+                queue.append(nxt)
+        self._delta = delta
+        self._outputs = [frozenset(out) for out in outputs]
+
+        alphabet = sorted({ch for keyword in self.keywords for ch in keyword})
+        self._runs = re.compile("[" + "".join(re.escape(ch) for ch in alphabet) + "]+") if alphabet else None
+
+    def __len__(self) -> int:
+        return len(self.keywords)
+
+    def find_all(self, text: str) -> set[int]:
+        """返回 `text` 中出现的全部关键词下标"""
+        hits = set(self._always)
+        if self._runs is None or not text:
+            return hits
+        delta, outputs = self._delta, self._outputs
+        for run in self._runs.finditer(text):
+            state = 0
+            for ch in run.group():
+                state = delta[state].get(ch, 0)
+                if outputs[state]:
+                    hits |= outputs[state]
+        return hits
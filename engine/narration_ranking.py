@@ -0,0 +1,133 @@
+"""旁白候选相关性排序（字符 bigram BM25）
+
+对小说切出的全部旁白候选建立 BM25 词项权重（CSR 稀疏存储），
+再把各分镜的“标题 + 摘要 + 对白”作为查询，按候选分块做一次稠密矩阵乘法批量打分，
+每个分镜取 top-k 相关候选。依赖 numpy（可选依赖，未安装时构建排序器会报错）。
+"""
+
+from __future__ import annotations
+
+from collections import Counter
+from typing import Any, Iterable, Sequence
+
+from engine.text_similarity import clean_similarity_text
+
+try:
+    import numpy as np
+except ImportError:  # 可选依赖：仅 BM25 排序需要
+    np = None
+
+# 单个稠密分块的元素上限（查询词表宽 × 候选数），控制批量打分的峰值内存
+_BLOCK_CELLS = 1 << 22
+
+
+def _bigrams(text: str) -> list[str]:
+    clean = clean_similarity_text(text)
+    if len(clean) < 2:
+        return [clean] if clean else []
+    return [clean[i:i + 2] for i in range(len(clean) - 1)]
+
+
+class Bm25Ranker:
+    """候选文本的 BM25 打分器（字符 bigram）
+
+    Attributes:
+        size: 候选数量
+    """
+
+    def __init__(self, texts: Iterable[str], k1: float = 1.5, b: float = 0.75):
+        if np is None:
+            raise RuntimeError("BM25 排序需要 numpy，请先执行 pip install numpy")
+
+        vocab: dict[str, int] = {}
+        indptr = [0]
+        indices: list[int] = []
+        tfs: list[int] = []
+        lengths: list[int] = []
+        for text in texts:
+            counts = Counter(_bigrams(text))
+            for term, tf in counts.items():
+                indices.append(vocab.setdefault(term, len(vocab)))
+                tfs.append(tf)
+            indptr.append(len(indices))
+            lengths.append(sum(counts.values()))
+
+        self.size = len(lengths)
+        self._vocab = vocab
+        term_ids = np.asarray(indices, dtype=np.int64)
+        tf = np.asarray(tfs, dtype=np.float64)
+        doc_len = np.asarray(lengths, dtype=np.float64)
+        avg_len = float(doc_len.mean()) if self.size else 0.0
+
+        df = np.bincount(term_ids, minlength=len(vocab)).astype(np.float64)
+        idf = np.log1p((self.size - df + 0.5) / (df + 0.5))
+        doc_ids = np.repeat(np.arange(self.size, dtype=np.int64), np.diff(np.asarray(indptr, dtype=np.int64)))
+        norm = k1 * (1.0 - b + b * doc_len / (avg_len or 1.0))
+
+        # CSR 形式的 (候选, 词项) -> BM25 权重，按候选编号有序
+        self._doc_ids = doc_ids
+        self._term_ids = term_ids
+        self._weights = idf[term_ids] * tf * (k1 + 1.0) / (tf + norm[doc_ids])
+
+    def score(self, queries: Sequence[str]) -> Any:
+        """批量打分，返回 (查询数 × 候选数) 的 float64 矩阵"""
+        columns: dict[int, int] = {}
+        rows: list[Counter[int]] = []
+        for query in queries:
+            counts: Counter[int] = Counter()
+            for term in _bigrams(query):
+                term_id = self._vocab.get(term)
+                if term_id is not None:
+                    counts[columns.setdefault(term_id, len(columns))] += 1
+            rows.append(counts)
+
+        scores = np.zeros((len(queries), self.size), dtype=np.float64)
+        if not columns or not self.size:
+            return scores
+
+        query_matrix = np.zeros((len(queries), len(columns)), dtype=np.float64)
+        for r, counts in enumerate(rows):
+            for c, qtf in counts.items():
+                query_matrix[r, c] = qtf
+
+        # 只保留查询词表内的权重项，并映射到查询矩阵的列号
+        column_of = np.full(len(self._vocab), -1, dtype=np.int64)
+        column_of[np.fromiter(columns.keys(), dtype=np.int64)] = np.fromiter(columns.values(), dtype=np.int64)
+        cols = column_of[self._term_ids]
+        keep = cols >= 0
+        doc_ids, cols, weights = self._doc_ids[keep], cols[keep], self._weights[keep]
+
+        # 候选分块：每块展开为稠密矩阵，与查询矩阵做一次矩阵乘法
+        block = max(1, _BLOCK_CELLS // len(columns))
+        for start in range(0, self.size, block):
+            stop = min(self.size, start + block)
+            lo, hi = np.searchsorted(doc_ids, [start, stop])
+            dense = np.zeros((stop - start, len(columns)), dtype=np.float64)
+            dense[doc_ids[lo:hi] - start, cols[lo:hi]] = weights[lo:hi]
+            scores[:, start:stop] = query_matrix @ dense.T
+        return scores
+
+    def top_k(self, queries: Sequence[str], k: int) -> list[list[int]]:
+        """每个查询得分最高（且 > 0）的至多 k 个候选编号；同分按候选编号升序"""
+        out: list[list[int]] = []
+        # 查询同样分批，得分矩阵不超过一个分块的大小
+        batch = max(1, _BLOCK_CELLS // max(1, self.size))
+        for start in range(0, len(queries), batch):
+            out.extend(self._top_k_rows(self.score(queries[start:start + batch]), k))
+        return out
+
+    @staticmethod
+    def _top_k_rows(scores: Any, k: int) -> list[list[int]]:
+        out: list[list[int]] = []
+        for row in scores:
+            hits = np.flatnonzero(row > 0)
+            if len(hits) > k:
+                # 第 k 大分值处的并列项按编号取前者，保证结果确定
+                values = row[hits]
+                kth = np.partition(values, len(values) - k)[len(values) - k]
+                above = hits[values > kth]
+                tied = hits[values == kth][: k - len(above)]
+                hits = np.concatenate([above, tied])
+            order = np.lexsort((hits, -row[hits]))
+            out.append(hits[order].tolist())
+        return out
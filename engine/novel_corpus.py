@@ -0,0 +1,342 @@
+"""小说语料索引
+
+`NovelCorpus` 对一份 `novel_full.md` 只解析一次：段落、章节与旁白候选块的位置保存为紧凑偏移数组，
+并落盘为侧车索引文件（`<小说目录>/.cache/<文件名>.idx`），再次加载时通过 mmap 直接映射，
+供分镜规划（`build_storyboard_drafts`）与旁白补强（`enrich_narration_with_novel`）共享。
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import mmap
+import re
+import struct
+import sys
+from array import array
+from collections import deque
+from pathlib import Path
+from typing import Any
+
+from engine.script_quality import (
+    NARRATION_FALLBACK_TEXT,
+    REPORT_CACHE_DIR,
+    NarrationCandidateIndex,
+    chunk_many,
+)
+from engine.storyboard_planner import CHAPTER_HEADING_RE
+
+INDEX_MAGIC = b"NVCIDX1\n"
+INDEX_VERSION = 2
+_LEN_STRUCT = struct.Struct("<Q")
+# 标题行必含“章”，扫描章节时只对这些行做完整匹配
+_CHAPTER_LINE_RE = re.compile(r"^.*章.*$", re.M)
+_ARRAY_NAMES = (
+    "para_starts",
+    "para_ends",
+    "chap_starts",
+    "chap_ends",
+    "chunk_starts",
+    "chunk_ends",
+    "chunk_paras",
+)
+
+
+def _normalize(text: str) -> str:
+    return text.replace("\r\n", "\n")
+
+
+def _stripped_span(text: str, start: int, end: int) -> tuple[int, int]:
+    piece = text[start:end]
+    stripped = piece.strip()
+    if not stripped:
+        return start, start
+    lead = len(piece) - len(piece.lstrip())
+    return start + lead, start + lead + len(stripped)
+
+
+def _scan_paragraphs(text: str) -> tuple[array, array]:
+    """与 `_split_paragraphs` 一致：按空行切分并去除首尾空白，跳过空段"""
+    starts, ends = array("q"), array("q")
+    pos = 0
+    while True:
+        sep = text.find("\n\n", pos)
+        end = len(text) if sep == -1 else sep
+        a, b = _stripped_span(text, pos, end)
+        if b > a:
+            starts.append(a)
+            ends.append(b)
+        if sep == -1:
+            return starts, ends
+        pos = sep + 2
+
+
+def _scan_chapters(text: str) -> tuple[list[str], array, array]:
+    """与 `_split_chapters` 一致：标题行之间的正文去首尾空白后非空才保留"""
+    titles: list[str] = []
+    starts, ends = array("q"), array("q")
+    current_title = ""
+    body_start = 0
+
+    def close(body_end: int) -> None:
+        a, b = _stripped_span(text, body_start, body_end)
+        if b > a:
+            titles.append(current_title)
+            starts.append(a)
+            ends.append(b)
+
+    for line in _CHAPTER_LINE_RE.finditer(text):
+        match = CHAPTER_HEADING_RE.match(line.group().strip())
+        if match:
+            if current_title:
+                close(max(body_start, line.start() - 1))
+            current_title = f"{match.group(1)} {match.group(2).strip()}"
+            body_start = line.end() + 1
+
+    if current_title:
+        close(len(text))
+    return titles, starts, ends
+
+
+class NovelCorpus:
+    """一次解析、多处复用的小说语料
+
+    Attributes:
+        text: 规整换行后的小说全文
+        content_hash: 原始文件内容的 sha256（用于校验侧车索引）
+    """
+
+    def __init__(
+        self,
+        text: str,
+        content_hash: str,
+        titles: list[str],
+        arrays: dict[str, Any],
+        chunk_blob: Any = None,
+        mapped: mmap.mmap | None = None,
+    ):
+        self.text = text
+        self.content_hash = content_hash
+        self._titles = titles
+        # 段落区间（para_*）与旁白候选（chunk_* 与 `chunk_blob`）缺省时在首次需要时才切分，
+        # 只按章节做分镜规划的调用方无需付出这部分开销
+        self._arrays = arrays
+        self._chunk_blob = chunk_blob
+        self._mmap = mapped
+        self._chunks: list[str] | None = None
+        self._candidate_index: NarrationCandidateIndex | None = None
+
+    # ---- 构建与持久化 ----
+
+    @classmethod
+    def from_text(cls, novel_text: str) -> NovelCorpus:
+        raw = novel_text.encode("utf-8")
+        return cls._build(_normalize(novel_text), hashlib.sha256(raw).hexdigest())
+
+    @classmethod
+    def _build(cls, text: str, content_hash: str) -> NovelCorpus:
+        """只扫描章节；段落与旁白候选由 `_ensure_paragraphs` / `_ensure_chunks` 按需切分"""
+        titles, chap_starts, chap_ends = _scan_chapters(text)
+        return cls(text, content_hash, titles, {"chap_starts": chap_starts, "chap_ends": chap_ends})
+
+    def _ensure_paragraphs(self) -> None:
+        if "para_starts" not in self._arrays:
+            para_starts, para_ends = _scan_paragraphs(self.text)
+            self._arrays.update(para_starts=para_starts, para_ends=para_ends)
+
+    def _ensure_chunks(self) -> None:
+        if self._chunk_blob is not None:
+            return
+        self._ensure_paragraphs()
+        # 旁白候选：逐段落分句打包，编码后拼接为一个字节块，按字节偏移索引
+        chunk_starts, chunk_ends, chunk_paras = array("q"), array("q"), array("q")
+        blob = bytearray()
+        text = self.text
+        paragraphs = (text[a:b] for a, b in zip(self._arrays["para_starts"], self._arrays["para_ends"]))
+        for para_idx, chunks in enumerate(chunk_many(paragraphs, 80)):
+            for chunk in chunks:
+                if chunk:
+                    encoded = chunk.encode("utf-8")
+                    chunk_starts.append(len(blob))
+                    blob.extend(encoded)
+                    chunk_ends.append(len(blob))
+                    chunk_paras.append(para_idx)
+        self._arrays.update(chunk_starts=chunk_starts, chunk_ends=chunk_ends, chunk_paras=chunk_paras)
+        self._chunk_blob = bytes(blob)
+
+    @staticmethod
+    def index_path_for(novel_path: str | Path) -> Path:
+        novel_path = Path(novel_path)
+        return novel_path.parent / REPORT_CACHE_DIR / f"{novel_path.name}.idx"
+
+    @classmethod
+    def load(cls, novel_path: str | Path, index_path: str | Path | None = None) -> NovelCorpus:
+        """加载小说；侧车索引与文件内容一致时直接 mmap 复用，否则重建并写回索引"""
+        novel_path = Path(novel_path)
+        raw = novel_path.read_bytes()
+        content_hash = hashlib.sha256(raw).hexdigest()
+        text = _normalize(raw.decode("utf-8"))
+        idx_path = Path(index_path) if index_path else cls.index_path_for(novel_path)
+
+        corpus = cls._open_index(idx_path, text, content_hash)
+        if corpus is not None:
+            return corpus
+
+        corpus = cls._build(text, content_hash)
+        try:
+            corpus.save_index(idx_path)
+        except OSError:
+            pass  # 索引不可写时退化为仅内存使用
+        return corpus
+
+    def save_index(self, index_path: str | Path) -> None:
+        self._ensure_chunks()
+        index_path = Path(index_path)
+        index_path.parent.mkdir(parents=True, exist_ok=True)
+        header = {
+            "version": INDEX_VERSION,
+            "sha256": self.content_hash,
+            "byteorder": sys.byteorder,
+            "titles": self._titles,
+            "counts": {name: len(self._arrays[name]) for name in _ARRAY_NAMES},
+        }
+        header_bytes = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        header_bytes += b" " * (-(len(INDEX_MAGIC) + _LEN_STRUCT.size + len(header_bytes)) % 8)
+
+        tmp_path = index_path.with_name(index_path.name + ".tmp")
+        with tmp_path.open("wb") as fh:
+            fh.write(INDEX_MAGIC)
+            fh.write(_LEN_STRUCT.pack(len(header_bytes)))
+            fh.write(header_bytes)
+            for name in _ARRAY_NAMES:
+                fh.write(array("q", self._arrays[name]).tobytes())
+            fh.write(bytes(self._chunk_blob))
+        tmp_path.replace(index_path)
+
+    @classmethod
+    def _open_index(cls, index_path: Path, text: str, content_hash: str) -> NovelCorpus | None:
+        if not index_path.is_file():
+            return None
+        try:
+            with index_path.open("rb") as fh:
+                mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        views: list[memoryview] = []
+        try:
+            view = memoryview(mapped)
+            views.append(view)
+            if bytes(view[: len(INDEX_MAGIC)]) != INDEX_MAGIC:
+                raise ValueError("bad magic")
+            offset = len(INDEX_MAGIC)
+            (header_len,) = _LEN_STRUCT.unpack_from(view, offset)
+            offset += _LEN_STRUCT.size
+            header = json.loads(bytes(view[offset:offset + header_len]).decode("utf-8"))
+            offset += header_len
+            if (
+                header.get("version") != INDEX_VERSION
+                or header.get("sha256") != content_hash
+                or header.get("byteorder") != sys.byteorder
+            ):
+                raise ValueError("stale index")
+
+            arrays: dict[str, Any] = {}
+            for name in _ARRAY_NAMES:
+                count = int(header["counts"][name])
+                arrays[name] = view[offset:offset + count * 8].cast("q")
+                views.append(arrays[name])
+                offset += count * 8
+            blob = view[offset:]
+            titles = list(header["titles"])
+        except (ValueError, KeyError, TypeError, struct.error):
+            for v in reversed(views):
+                v.release()
+            mapped.close()
+            return None
+        view.release()
+        return cls(text, content_hash, titles, arrays, blob, mapped)
+
+    def close(self) -> None:
+        """释放 mmap（释放后不可再读取候选块）"""
+        if self._mmap is not None:
+            for name in list(self._arrays):
+                self._arrays[name].release()
+            self._chunk_blob.release()
+            self._mmap.close()
+            self._mmap = None
+
+    def __enter__(self) -> NovelCorpus:
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    # ---- 查询 ----
+
+    @property
+    def paragraph_count(self) -> int:
+        self._ensure_paragraphs()
+        return len(self._arrays["para_starts"])
+
+    @property
+    def chapter_count(self) -> int:
+        return len(self._titles)
+
+    def paragraphs(self) -> list[str]:
+        """等价于 `_split_paragraphs(novel_text)`"""
+        self._ensure_paragraphs()
+        text = self.text
+        return [text[a:b] for a, b in zip(self._arrays["para_starts"], self._arrays["para_ends"])]
+
+    def chapters(self) -> list[tuple[str, str]]:
+        """等价于 `_split_chapters(novel_text)`"""
+        text = self.text
+        spans = zip(self._arrays["chap_starts"], self._arrays["chap_ends"])
+        return [(title, text[a:b]) for title, (a, b) in zip(self._titles, spans)]
+
+    def paragraph_spans(self) -> list[tuple[int, int]]:
+        """各段落在 `text` 中的字符区间 [start, end)"""
+        self._ensure_paragraphs()
+        return list(zip(self._arrays["para_starts"], self._arrays["para_ends"]))
+
+    def chapter_spans(self) -> list[tuple[int, int]]:
+        """各章节正文在 `text` 中的字符区间 [start, end)"""
+        return list(zip(self._arrays["chap_starts"], self._arrays["chap_ends"]))
+
+    def chunk_offsets(self) -> list[int]:
+        """各旁白候选块所在段落的起始字符偏移"""
+        self._ensure_chunks()
+        para_starts = self._arrays["para_starts"]
+        return [para_starts[p] for p in self._arrays["chunk_paras"]]
+
+    def chunks(self) -> list[str]:
+        """全部旁白候选块（按出现顺序）；首次调用时从索引解码并缓存"""
+        if self._chunks is None:
+            self._ensure_chunks()
+            blob = self._chunk_blob
+            self._chunks = [
+                bytes(blob[a:b]).decode("utf-8")
+                for a, b in zip(self._arrays["chunk_starts"], self._arrays["chunk_ends"])
+            ]
+        return self._chunks
+
+    def narration_candidates(self) -> deque[str]:
+        """等价于 `_extract_narration_candidates(novel_text)`"""
+        out: deque[str] = deque(self.chunks())
+        if not out:
+            out.append(NARRATION_FALLBACK_TEXT)
+        return out
+
+    def candidate_index(self) -> NarrationCandidateIndex:
+        """旁白候选倒排索引；每个语料只构建一次"""
+        if self._candidate_index is None:
+            # 有章节时按章节分区、否则按段落分区，供补强按分镜原文区间就近取材
+            offsets = self.chunk_offsets() or [0]
+            sections = self._arrays["chap_starts"] if self.chapter_count else self._arrays["para_starts"]
+            self._candidate_index = NarrationCandidateIndex(
+                self.narration_candidates(),
+                offsets=offsets,
+                section_starts=list(sections),
+            )
+        return self._candidate_index
@@ -1,18 +1,43 @@
 from __future__ import annotations
 
 import copy
+import hashlib
 import json
 import math
 import re
+import time
+from bisect import bisect_right
 from collections import deque
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, field
 from pathlib import Path
-from typing import Any
+from typing import TYPE_CHECKING, Any, Iterable, Iterator
+
+from engine.narration_ranking import Bm25Ranker
+from engine.text_similarity import (
+    SimilarityIndex,
+    TextFingerprint,
+    fingerprint_similarity,
+    fingerprint_text,
+)
+
+if TYPE_CHECKING:
+    from engine.novel_corpus import NovelCorpus
 
 NARRATION_SPEAKER = "旁白"
 DEFAULT_TYPEWRITER_SPEED = 55
+NARRATION_RANKINGS = ("theme", "bm25")
+NARRATION_TOP_K = 50
+NARRATION_FALLBACK_TEXT = "雨声贴着棚檐滑落，空气里浮着潮湿的铁锈味。"
+DEFAULT_SPEAKER_ALIASES = {"我": "盲眼法医"}
+# 旁白占比低于该值时无论门禁阈值如何都判为 error
+NARRATION_RATIO_ERROR_FLOOR = 0.45
+
+# 规则、报告格式或缓存文件命名变化时递增，用于使磁盘上的报告缓存自动失效
+ANALYZER_VERSION = "2"
+REPORT_CACHE_DIR = ".cache"
 
 CHAPTER_HEADING_LINE_RE = re.compile(r"^\s*(?:#{1,6}\s*)?第[一二三四五六七八九十百0-9]+章\s+.+$", re.IGNORECASE)
+TITLE_CHAPTER_PREFIX_RE = re.compile(r"^第[一二三四五六七八九十百千0-9]+章\s*")
 LEADING_STAGE_DIR_RE = re.compile(r"^\s*(?:（[^）]{1,12}）|\([^)]{1,12}\))\s*")
 
 
@@ -38,6 +63,7 @@ class QualityReport:
     passed: bool
     stats: QualityStats
     issues: list[QualityIssue]
+    rule_timings: dict[str, float] = field(default_factory=dict)  # 规则名 -> 累计耗时（秒），不写入 to_dict
 
     def to_dict(self) -> dict[str, Any]:
         return {
@@ -46,6 +72,14 @@ class QualityReport:
             "issues": [asdict(i) for i in self.issues],
         }
 
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> QualityReport:
+        return cls(
+            passed=bool(data["passed"]),
+            stats=QualityStats(**data["stats"]),
+            issues=[QualityIssue(**i) for i in data["issues"]],
+        )
+
 
 def load_json(path: str | Path) -> dict[str, Any]:
     return json.loads(Path(path).read_text(encoding="utf-8"))
@@ -55,6 +89,103 @@ def save_json(path: str | Path, data: dict[str, Any]) -> None:
     Path(path).write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
 
 
+_JSON_WS_RE = re.compile(r"[ \t\n\r]*")
+_JSON_SCALAR_END_RE = re.compile(r"[ \t\n\r,\]}]")
+
+
+class _JsonStreamReader:
+    """按块读取文件的增量 JSON 读取器，只在内存中保留当前值所需的文本"""
+
+    def __init__(self, fh, chunk_size: int):
+        self._fh = fh
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        if self._eof:
+            return False
+        # 读取量随未消费文本增长，保证超大值的重试解析总开销为线性
+        chunk = self._fh.read(max(self._chunk_size, len(self._buf) - self._pos))
+        if not chunk:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            self._pos = _JSON_WS_RE.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, ch: str) -> None:
+        found = self.peek()
+        if found != ch:
+            raise json.JSONDecodeError(f"Expecting {ch!r}", self._buf, self._pos)
+        self._pos += 1
+
+    def value(self) -> Any:
+        if self.peek() not in '{["':
+            # 数字/字面量没有闭合符，被块边界截断时仍可能“解析成功”，需先读到分隔符
+            while not _JSON_SCALAR_END_RE.search(self._buf, self._pos) and self._fill():
+                pass
+        while True:
+            try:
+                obj, end = self._decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            self._pos = end
+            return obj
+
+
+def iter_storyboards(path: str | Path, chunk_size: int = 1 << 16) -> Iterator[dict[str, Any]]:
+    """流式读取 script.json 顶层 `storyboards`，逐个产出分镜
+
+    其余顶层字段（如 `shared`）逐个解析后丢弃；内存占用与单个分镜（或单个其他顶层字段）成正比，
+    而不是整个文件。`storyboards` 缺失或不是数组时不产出任何分镜。
+    """
+    with Path(path).open(encoding="utf-8") as fh:
+        reader = _JsonStreamReader(fh, chunk_size)
+        reader.expect("{")
+        if reader.peek() == "}":
+            return
+        while True:
+            key = reader.value()
+            reader.expect(":")
+            if key == "storyboards" and reader.peek() == "[":
+                reader.expect("[")
+                if reader.peek() == "]":
+                    reader.expect("]")
+                else:
+                    while True:
+                        yield reader.value()
+                        if reader.peek() == ",":
+                            reader.expect(",")
+                            continue
+                        reader.expect("]")
+                        break
+            else:
+                reader.value()
+            if reader.peek() == ",":
+                reader.expect(",")
+                continue
+            reader.expect("}")
+            return
+
+
+# 句末标点（含英文标点与换行）；每个“句子”是到下一个句末标点（含）为止的一段
+SENTENCE_END_CHARS = "。！？；,.!?;\n"
+_SENTENCE_RE = re.compile(rf"[^{re.escape(SENTENCE_END_CHARS)}]*[{re.escape(SENTENCE_END_CHARS)}]|[^{re.escape(SENTENCE_END_CHARS)}]+")
+
+
 def _chunk_text(text: str, max_len: int = 80) -> list[str]:
     text = (text or "").strip()
     if not text:
@@ -63,42 +194,47 @@ def _chunk_text(text: str, max_len: int = 80) -> list[str]:
         return [text]
 
     # 先按标点切句，再按长度约束组装，最后做硬切分兜底。
-    sentence_buf = ""
-    sentences: list[str] = []
-    for ch in text:
-        sentence_buf += ch
-        if ch in "。！？；,.!?;\n":
-            s = sentence_buf.strip()
-            if s:
-                sentences.append(s)
-            sentence_buf = ""
-    if sentence_buf.strip():
-        sentences.append(sentence_buf.strip())
+    sentences = [s for s in (m.strip() for m in _SENTENCE_RE.findall(text)) if s]
 
     packed: list[str] = []
-    cur = ""
+    cur: list[str] = []
+    cur_len = 0
     for s in sentences:
-        if not cur:
-            cur = s
+        if cur and cur_len + len(s) <= max_len:
+            cur.append(s)
+            cur_len += len(s)
             continue
-        if len(cur) + len(s) <= max_len:
-            cur += s
-        else:
-            packed.append(cur)
-            cur = s
+        if cur:
+            packed.append("".join(cur))
+        cur = [s]
+        cur_len = len(s)
     if cur:
-        packed.append(cur)
+        packed.append("".join(cur))
 
     out: list[str] = []
     for block in packed:
-        while len(block) > max_len:
-            out.append(block[:max_len].strip())
-            block = block[max_len:]
-        if block.strip():
-            out.append(block.strip())
+        start = 0
+        while len(block) - start > max_len:
+            out.append(block[start:start + max_len].strip())
+            start += max_len
+        tail = block[start:].strip()
+        if tail:
+            out.append(tail)
     return out or [text[:max_len]]
 
 
+def chunk_many(texts: Iterable[str], max_len: int = 80) -> list[list[str]]:
+    """批量分句，结果与逐条调用 `_chunk_text` 一致；批内重复文本只切分一次"""
+    cache: dict[str, list[str]] = {}
+    out: list[list[str]] = []
+    for text in texts:
+        parts = cache.get(text)
+        if parts is None:
+            parts = cache[text] = _chunk_text(text, max_len)
+        out.append(list(parts))
+    return out
+
+
 def _iter_scripts(data: dict[str, Any]):
     for sb_index, sb in enumerate(data.get("storyboards", [])):
         scripts = sb.get("scripts", []) if isinstance(sb, dict) else []
@@ -122,207 +258,655 @@ def _normalize_segment_text(speaker: str, text: str) -> str:
 
 
 def _calculate_similarity(text1: str, text2: str) -> float:
-    """计算两个文本的相似度（简单的字符重叠率）"""
-    if not text1 or not text2:
-        return 0.0
-
-    # 移除空格和标点进行比较
-    clean1 = re.sub(r'[\s，。！？：；、""''（）]', '', text1)
-    clean2 = re.sub(r'[\s，。！？：；、""''（）]', '', text2)
-
-    if not clean1 or not clean2:
-        return 0.0
+    """计算两个文本的相似度（简单的字符重叠率）
 
-    # 计算最长公共子序列长度
-    len1, len2 = len(clean1), len(clean2)
-    if len1 == 0 or len2 == 0:
+    需要反复比较同一文本时，优先预先调用 `fingerprint_text` 并使用 `fingerprint_similarity`。
+    """
+    if not text1 or not text2:
         return 0.0
+    return fingerprint_similarity(fingerprint_text(text1), fingerprint_text(text2))
+
+
+class _DuplicateDetector:
+    """按出现顺序逐段检测重复文本，每段只与索引召回的候选做精确比较"""
+
+    def __init__(self, threshold: float = 0.85, use_index: bool = True):
+        self.threshold = threshold
+        self._locations: list[str] = []
+        self._fingerprints: list[TextFingerprint] = []
+        self._index = SimilarityIndex() if use_index else None
+
+    def _find_previous(self, fp: TextFingerprint) -> tuple[int, float] | None:
+        # 候选按出现顺序比较，保证命中的是最早的相似段落
+        if self._index is not None:
+            return self._index.find_similar(fp, self.threshold)
+        for i, prev_fp in enumerate(self._fingerprints):
+            similarity = fingerprint_similarity(fp, prev_fp)
+            if similarity >= self.threshold:
+                return i, similarity
+        return None
+
+    def check(self, fp: TextFingerprint, location: str) -> QualityIssue | None:
+        found: QualityIssue | None = None
+        match = self._find_previous(fp)
+        if match is not None:
+            prev_id, similarity = match
+            found = QualityIssue(
+                level="error",
+                code="DUPLICATE_TEXT",
+                message=f"文本与 {self._locations[prev_id]} 高度相似（{similarity:.1%}）",
+                location=location
+            )
 
-    # 使用滑动窗口计算重叠字符数
-    overlap = 0
-    window_size = min(len1, len2, 20)  # 限制窗口大小避免性能问题
+        self._locations.append(location)
+        if self._index is not None:
+            self._index.add(fp)
+        else:
+            self._fingerprints.append(fp)
+        return found
 
-    for i in range(len1 - window_size + 1):
-        substr = clean1[i:i+window_size]
-        if substr in clean2:
-            overlap += window_size
 
-    # 相似度 = 重叠字符数 / 平均长度
-    avg_len = (len1 + len2) / 2
-    similarity = overlap / avg_len if avg_len > 0 else 0.0
+def _duplicate_check_text(sc: dict[str, Any]) -> str:
+    text = str(sc.get("text", "")).strip()
+    if not text or len(text) < 10:  # 跳过过短文本
+        return ""
+    return text
 
-    return min(similarity, 1.0)  # 限制在 0.0-1.0 之间
 
+def _check_duplicate_text(
+    data: dict[str, Any],
+    threshold: float = 0.85,
+    use_index: bool = True,
+) -> list[QualityIssue]:
+    """检测重复或高度相似的段落
 
-def _check_duplicate_text(data: dict[str, Any], threshold: float = 0.85) -> list[QualityIssue]:
-    """检测重复或高度相似的段落"""
+    Args:
+        data: 剧本数据
+        threshold: 相似度阈值
+        use_index: 是否使用 shingle 候选索引（默认True）
+                   - True: 只对索引召回的候选做精确比较，结果与全量比较一致
+                   - False: 与所有已出现段落逐一比较（O(n²)，用于对照验证）
+    """
     issues: list[QualityIssue] = []
-    texts: list[tuple[str, str]] = []  # (text, location)
-
+    detector = _DuplicateDetector(threshold, use_index)
     for sb_idx, sb in enumerate(data.get("storyboards", [])):
         for sc_idx, sc in enumerate(sb.get("scripts", [])):
-            text = sc.get("text", "").strip()
-            if not text or len(text) < 10:  # 跳过过短文本
+            text = _duplicate_check_text(sc)
+            if not text:
                 continue
+            issue = detector.check(fingerprint_text(text), f"storyboards[{sb_idx}].scripts[{sc_idx}]")
+            if issue:
+                issues.append(issue)
+    return issues
 
-            location = f"storyboards[{sb_idx}].scripts[{sc_idx}]"
 
-            # 与已有文本比较相似度
-            for prev_text, prev_loc in texts:
-                similarity = _calculate_similarity(text, prev_text)
-                if similarity >= threshold:
-                    issues.append(QualityIssue(
-                        level="error",
-                        code="DUPLICATE_TEXT",
-                        message=f"文本与 {prev_loc} 高度相似（{similarity:.1%}）",
-                        location=location
-                    ))
-                    break  # 找到一个重复就够了，不需要继续比较
+# ---------------------------------------------------------------------------
+# 规则引擎：每条检查注册为一个规则，按分镜/段落访问者挂载，全部规则在一次遍历中执行。
+# ---------------------------------------------------------------------------
 
-            texts.append((text, location))
 
-    return issues
+class RuleContext:
+    """规则执行上下文，由引擎在遍历过程中维护
 
+    Attributes:
+        min_narration_ratio: 旁白占比告警阈值
+        sb_loc / sc_loc: 当前分镜/段落的 location 字符串
+        speaker / text: 当前段落已规整的 speaker 与 text
+        sb_script_count / sb_narration_count: 当前分镜段落数/旁白数（分镜结束时完整）
+        script_count / narration_count: 全剧本段落数/旁白数（遍历结束时完整）
+    """
+
+    def __init__(self, min_narration_ratio: float):
+        self.min_narration_ratio = min_narration_ratio
+        self.issues: list[QualityIssue] = []
+        self.sb_loc = ""
+        self.sc_loc = ""
+        self.speaker = ""
+        self.text = ""
+        self.sb_script_count = 0
+        self.sb_narration_count = 0
+        self.script_count = 0
+        self.narration_count = 0
+
+    def emit(self, level: str, code: str, message: str, location: str) -> None:
+        self.issues.append(QualityIssue(level, code, message, location))
+
+
+class QualityRule:
+    """质量规则基类
+
+    子类按需覆写访问者方法；所有方法默认什么都不做。
+
+    Attributes:
+        name: 规则名（用于计时与开关）
+        codes: 规则可能产出的 issue code
+        scope: "storyboard" 表示结果只依赖当前分镜内容（可被增量分析缓存）；
+               "global" 表示依赖全剧本状态（每次分析都会执行）
+        expensive: 是否为高开销规则（快速检查模式下跳过）
+    """
+
+    name = ""
+    codes: tuple[str, ...] = ()
+    scope = "storyboard"
+    expensive = False
+
+    def begin(self, ctx: RuleContext) -> None:
+        pass
+
+    def visit_storyboard(self, ctx: RuleContext, sb: dict[str, Any], scripts: list[dict[str, Any]] | None) -> None:
+        """分镜开始时调用；scripts 为空或非法时传 None，且不会再访问其段落"""
+
+    def visit_segment(self, ctx: RuleContext, sc: dict[str, Any]) -> None:
+        pass
+
+    def end_storyboard(self, ctx: RuleContext, sb: dict[str, Any]) -> None:
+        """分镜段落全部访问后调用（scripts 为空的分镜不调用）"""
+
+    def finish(self, ctx: RuleContext) -> None:
+        pass
 
-def analyze_script_quality(data: dict[str, Any], min_narration_ratio: float = 0.50) -> QualityReport:
-    issues: list[QualityIssue] = []
 
-    storyboards = data.get("storyboards")
-    if not isinstance(storyboards, list) or not storyboards:
-        issues.append(QualityIssue("error", "STORYBOARDS_EMPTY", "storyboards 为空或不存在", "storyboards"))
-        stats = QualityStats(0, 0, 0, 0.0, 0)
-        return QualityReport(False, stats, issues)
+_RULE_REGISTRY: dict[str, type[QualityRule]] = {}
 
-    sb_ids: set[str] = set()
-    seg_ids: set[str] = set()
-    total = 0
-    narr = 0
-    max_text_len = 0
 
-    for sb_index, sb in enumerate(storyboards):
-        sb_loc = f"storyboards[{sb_index}]"
+def register_rule(rule_cls: type[QualityRule]) -> type[QualityRule]:
+    """注册质量规则（可用作类装饰器）；执行顺序即注册顺序"""
+    if not rule_cls.name:
+        raise ValueError(f"rule {rule_cls.__name__} 缺少 name")
+    _RULE_REGISTRY[rule_cls.name] = rule_cls
+    return rule_cls
+
+
+def registered_rules() -> list[str]:
+    return list(_RULE_REGISTRY)
+
+
+def expensive_rules() -> list[str]:
+    return [name for name, cls in _RULE_REGISTRY.items() if cls.expensive]
+
+
+@register_rule
+class StoryboardIdRule(QualityRule):
+    name = "sb_id"
+    codes = ("SB_ID_MISSING", "SB_ID_DUP")
+    scope = "global"
+
+    def begin(self, ctx: RuleContext) -> None:
+        self._seen: set[str] = set()
+
+    def visit_storyboard(self, ctx: RuleContext, sb: dict[str, Any], scripts: list[dict[str, Any]] | None) -> None:
         sb_id = str(sb.get("id", "")).strip()
         if not sb_id:
-            issues.append(QualityIssue("error", "SB_ID_MISSING", "分镜缺少 id", sb_loc))
-        elif sb_id in sb_ids:
-            issues.append(QualityIssue("error", "SB_ID_DUP", f"重复分镜 id: {sb_id}", sb_loc))
+            ctx.emit("error", "SB_ID_MISSING", "分镜缺少 id", ctx.sb_loc)
+        elif sb_id in self._seen:
+            ctx.emit("error", "SB_ID_DUP", f"重复分镜 id: {sb_id}", ctx.sb_loc)
         else:
-            sb_ids.add(sb_id)
+            self._seen.add(sb_id)
 
-        scripts = sb.get("scripts")
-        if not isinstance(scripts, list) or not scripts:
-            issues.append(QualityIssue("error", "SCRIPTS_EMPTY", "分镜 scripts 为空", sb_loc + ".scripts"))
-            continue
 
-        sb_total = 0
-        sb_narr = 0
-        first_speaker = str(scripts[0].get("speaker", "")).strip() if scripts else ""
-        if first_speaker != NARRATION_SPEAKER:
-            issues.append(QualityIssue("error", "SB_NOT_START_WITH_NARRATION", "分镜未以旁白开头", sb_loc + ".scripts[0]"))
+@register_rule
+class ScriptsEmptyRule(QualityRule):
+    name = "scripts_empty"
+    codes = ("SCRIPTS_EMPTY",)
 
-        for sc_index, sc in enumerate(scripts):
-            sc_loc = f"{sb_loc}.scripts[{sc_index}]"
-            seg_id = str(sc.get("id", "")).strip()
-            speaker = str(sc.get("speaker", "")).strip()
-            text = str(sc.get("text", ""))
-            max_text_len = max(max_text_len, len(text))
-
-            if not seg_id:
-                issues.append(QualityIssue("error", "SEG_ID_MISSING", "段落缺少 id", sc_loc))
-            elif seg_id in seg_ids:
-                issues.append(QualityIssue("error", "SEG_ID_DUP", f"重复段落 id: {seg_id}", sc_loc))
-            else:
-                seg_ids.add(seg_id)
+    def visit_storyboard(self, ctx: RuleContext, sb: dict[str, Any], scripts: list[dict[str, Any]] | None) -> None:
+        if scripts is None:
+            ctx.emit("error", "SCRIPTS_EMPTY", "分镜 scripts 为空", ctx.sb_loc + ".scripts")
 
-            if not speaker:
-                issues.append(QualityIssue("error", "SPEAKER_MISSING", "段落缺少 speaker", sc_loc))
 
-            if len(text) > 100:
-                issues.append(QualityIssue("error", "TEXT_TOO_LONG", f"text 长度 {len(text)} > 100（严重超标）", sc_loc))
-            elif len(text) > 80:
-                issues.append(QualityIssue("warn", "TEXT_TOO_LONG", f"text 长度 {len(text)} > 80", sc_loc))
+@register_rule
+class StartWithNarrationRule(QualityRule):
+    name = "sb_start_narration"
+    codes = ("SB_NOT_START_WITH_NARRATION",)
 
-            if CHAPTER_HEADING_LINE_RE.match(text.strip()):
-                issues.append(QualityIssue("warn", "TEXT_CHAPTER_HEADING", "text 疑似章节标题泄漏", sc_loc))
+    def visit_storyboard(self, ctx: RuleContext, sb: dict[str, Any], scripts: list[dict[str, Any]] | None) -> None:
+        if scripts and str(scripts[0].get("speaker", "")).strip() != NARRATION_SPEAKER:
+            ctx.emit("error", "SB_NOT_START_WITH_NARRATION", "分镜未以旁白开头", ctx.sb_loc + ".scripts[0]")
 
-            if speaker and speaker != NARRATION_SPEAKER and LEADING_STAGE_DIR_RE.match(text):
-                issues.append(QualityIssue("warn", "DIALOGUE_STAGE_PREFIX", "对话包含前置括号舞台提示", sc_loc))
 
-            if speaker == NARRATION_SPEAKER:
-                sb_narr += 1
-                if sc.get("character_image") not in (None, "", "null"):
-                    issues.append(QualityIssue("warn", "NARRATION_HAS_IMAGE", "旁白不应配置立绘", sc_loc))
-            else:
-                if not sc.get("character_image"):
-                    issues.append(QualityIssue("warn", "DIALOGUE_NO_IMAGE", "对话缺少 character_image", sc_loc))
+@register_rule
+class SegmentIdRule(QualityRule):
+    name = "seg_id"
+    codes = ("SEG_ID_MISSING", "SEG_ID_DUP")
+    scope = "global"
+
+    def begin(self, ctx: RuleContext) -> None:
+        self._seen: set[str] = set()
 
-            if str(sc.get("effect", "typewriter")).lower() == "typewriter" and int(sc.get("speed", 55)) != 55:
-                issues.append(QualityIssue("warn", "TYPEWRITER_SPEED", "typewriter 段落 speed 应为 55", sc_loc))
+    def visit_segment(self, ctx: RuleContext, sc: dict[str, Any]) -> None:
+        seg_id = str(sc.get("id", "")).strip()
+        if not seg_id:
+            ctx.emit("error", "SEG_ID_MISSING", "段落缺少 id", ctx.sc_loc)
+        elif seg_id in self._seen:
+            ctx.emit("error", "SEG_ID_DUP", f"重复段落 id: {seg_id}", ctx.sc_loc)
+        else:
+            self._seen.add(seg_id)
+
+
+@register_rule
+class SpeakerMissingRule(QualityRule):
+    name = "speaker_missing"
+    codes = ("SPEAKER_MISSING",)
+
+    def visit_segment(self, ctx: RuleContext, sc: dict[str, Any]) -> None:
+        if not ctx.speaker:
+            ctx.emit("error", "SPEAKER_MISSING", "段落缺少 speaker", ctx.sc_loc)
+
+
+@register_rule
+class TextTooLongRule(QualityRule):
+    name = "text_too_long"
+    codes = ("TEXT_TOO_LONG",)
+
+    def visit_segment(self, ctx: RuleContext, sc: dict[str, Any]) -> None:
+        length = len(ctx.text)
+        if length > 100:
+            ctx.emit("error", "TEXT_TOO_LONG", f"text 长度 {length} > 100（严重超标）", ctx.sc_loc)
+        elif length > 80:
+            ctx.emit("warn", "TEXT_TOO_LONG", f"text 长度 {length} > 80", ctx.sc_loc)
+
+
+@register_rule
+class ChapterHeadingRule(QualityRule):
+    name = "chapter_heading"
+    codes = ("TEXT_CHAPTER_HEADING",)
+
+    def visit_segment(self, ctx: RuleContext, sc: dict[str, Any]) -> None:
+        if CHAPTER_HEADING_LINE_RE.match(ctx.text.strip()):
+            ctx.emit("warn", "TEXT_CHAPTER_HEADING", "text 疑似章节标题泄漏", ctx.sc_loc)
+
+
+@register_rule
+class DialogueStagePrefixRule(QualityRule):
+    name = "dialogue_stage_prefix"
+    codes = ("DIALOGUE_STAGE_PREFIX",)
+
+    def visit_segment(self, ctx: RuleContext, sc: dict[str, Any]) -> None:
+        if ctx.speaker and ctx.speaker != NARRATION_SPEAKER and LEADING_STAGE_DIR_RE.match(ctx.text):
+            ctx.emit("warn", "DIALOGUE_STAGE_PREFIX", "对话包含前置括号舞台提示", ctx.sc_loc)
+
+
+@register_rule
+class NarrationImageRule(QualityRule):
+    name = "narration_has_image"
+    codes = ("NARRATION_HAS_IMAGE",)
 
-            sb_total += 1
-            total += 1
+    def visit_segment(self, ctx: RuleContext, sc: dict[str, Any]) -> None:
+        if ctx.speaker == NARRATION_SPEAKER and sc.get("character_image") not in (None, "", "null"):
+            ctx.emit("warn", "NARRATION_HAS_IMAGE", "旁白不应配置立绘", ctx.sc_loc)
 
-        sb_ratio = (sb_narr / sb_total) if sb_total else 0.0
-        narr += sb_narr
-        if sb_ratio < 0.45:
+
+@register_rule
+class DialogueImageRule(QualityRule):
+    name = "dialogue_no_image"
+    codes = ("DIALOGUE_NO_IMAGE",)
+
+    def visit_segment(self, ctx: RuleContext, sc: dict[str, Any]) -> None:
+        if ctx.speaker != NARRATION_SPEAKER and not sc.get("character_image"):
+            ctx.emit("warn", "DIALOGUE_NO_IMAGE", "对话缺少 character_image", ctx.sc_loc)
+
+
+@register_rule
+class TypewriterSpeedRule(QualityRule):
+    name = "typewriter_speed"
+    codes = ("TYPEWRITER_SPEED",)
+
+    def visit_segment(self, ctx: RuleContext, sc: dict[str, Any]) -> None:
+        if str(sc.get("effect", "typewriter")).lower() == "typewriter" and int(sc.get("speed", 55)) != 55:
+            ctx.emit("warn", "TYPEWRITER_SPEED", "typewriter 段落 speed 应为 55", ctx.sc_loc)
+
+
+@register_rule
+class StoryboardNarrationRatioRule(QualityRule):
+    name = "sb_narration_ratio"
+    codes = ("SB_NARRATION_RATIO_LOW",)
+
+    def end_storyboard(self, ctx: RuleContext, sb: dict[str, Any]) -> None:
+        sb_total = ctx.sb_script_count
+        sb_ratio = (ctx.sb_narration_count / sb_total) if sb_total else 0.0
+        if sb_ratio < NARRATION_RATIO_ERROR_FLOOR:
             # 严重不达标（<45%）升级为 error
-            issues.append(
-                QualityIssue(
-                    "error",
-                    "SB_NARRATION_RATIO_LOW",
-                    f"分镜旁白占比 {sb_ratio:.2f} < 0.45（严重不足）",
-                    sb_loc,
-                )
+            ctx.emit(
+                "error",
+                "SB_NARRATION_RATIO_LOW",
+                f"分镜旁白占比 {sb_ratio:.2f} < {NARRATION_RATIO_ERROR_FLOOR:.2f}（严重不足）",
+                ctx.sb_loc,
             )
-        elif sb_ratio < min_narration_ratio:
-            issues.append(
-                QualityIssue(
-                    "warn",
-                    "SB_NARRATION_RATIO_LOW",
-                    f"分镜旁白占比 {sb_ratio:.2f} < {min_narration_ratio:.2f}",
-                    sb_loc,
-                )
+        elif sb_ratio < ctx.min_narration_ratio:
+            ctx.emit(
+                "warn",
+                "SB_NARRATION_RATIO_LOW",
+                f"分镜旁白占比 {sb_ratio:.2f} < {ctx.min_narration_ratio:.2f}",
+                ctx.sb_loc,
             )
 
-    ratio = (narr / total) if total else 0.0
-    if ratio < 0.45:
-        # 严重不达标（<45%）升级为 error
-        issues.append(
-            QualityIssue(
+
+@register_rule
+class GlobalNarrationRatioRule(QualityRule):
+    name = "global_narration_ratio"
+    codes = ("GLOBAL_NARRATION_RATIO_LOW",)
+    scope = "global"
+
+    def finish(self, ctx: RuleContext) -> None:
+        total = ctx.script_count
+        ratio = (ctx.narration_count / total) if total else 0.0
+        if ratio < NARRATION_RATIO_ERROR_FLOOR:
+            # 严重不达标（<45%）升级为 error
+            ctx.emit(
                 "error",
                 "GLOBAL_NARRATION_RATIO_LOW",
-                f"全局旁白占比 {ratio:.2f} < 0.45（严重不足）",
+                f"全局旁白占比 {ratio:.2f} < {NARRATION_RATIO_ERROR_FLOOR:.2f}（严重不足）",
                 "storyboards",
             )
-        )
-    elif ratio < min_narration_ratio:
-        issues.append(
-            QualityIssue(
+        elif ratio < ctx.min_narration_ratio:
+            ctx.emit(
                 "warn",
                 "GLOBAL_NARRATION_RATIO_LOW",
-                f"全局旁白占比 {ratio:.2f} < {min_narration_ratio:.2f}",
+                f"全局旁白占比 {ratio:.2f} < {ctx.min_narration_ratio:.2f}",
                 "storyboards",
             )
-        )
 
-    # 检测重复文本
-    duplicate_issues = _check_duplicate_text(data, threshold=0.85)
-    issues.extend(duplicate_issues)
 
-    passed = not any(i.level == "error" for i in issues)
-    stats = QualityStats(len(storyboards), total, narr, ratio, max_text_len)
-    return QualityReport(passed, stats, issues)
+@register_rule
+class DuplicateTextRule(QualityRule):
+    """跨分镜重复检测：遍历时逐段比对，结束时统一输出（保持报告中重复问题位于末尾）"""
+
+    name = "duplicate_text"
+    codes = ("DUPLICATE_TEXT",)
+    scope = "global"
+    expensive = True
+
+    def __init__(self) -> None:
+        # 指纹按文本缓存，跨多次分析复用（增量分析时未改动的段落无需重新计算）
+        self._fingerprints: dict[str, TextFingerprint] = {}
+
+    def begin(self, ctx: RuleContext) -> None:
+        self._detector = _DuplicateDetector(threshold=0.85)
+        self._pending: list[QualityIssue] = []
+        self._seen: dict[str, TextFingerprint] = {}
+
+    def visit_segment(self, ctx: RuleContext, sc: dict[str, Any]) -> None:
+        text = _duplicate_check_text(sc)
+        if not text:
+            return
+        fp = self._seen.get(text) or self._fingerprints.get(text)
+        if fp is None:
+            fp = fingerprint_text(text)
+        self._seen[text] = fp
+        issue = self._detector.check(fp, ctx.sc_loc)
+        if issue:
+            self._pending.append(issue)
+
+    def finish(self, ctx: RuleContext) -> None:
+        ctx.issues.extend(self._pending)
+        self._fingerprints = self._seen
+
+
+@dataclass
+class _StoryboardRecord:
+    """分镜局部规则（scope="storyboard"）的输出缓存，location 相对分镜书写"""
+
+    issues: dict[tuple[Any, int], list[QualityIssue]]  # (槽位, 规则序号) -> issues
+
+
+def _storyboard_digest(sb: Any) -> str:
+    payload = json.dumps(sb, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+class QualityRuleEngine:
+    """单次遍历执行所有已启用规则，并记录每条规则的累计耗时
+
+    Args:
+        min_narration_ratio: 旁白占比告警阈值
+        skip_rules: 需要关闭的规则名（如快速预检时关闭 `expensive_rules()`）
+        incremental: 是否按分镜内容哈希缓存局部规则结果，供同一实例反复分析时复用
+    """
+
+    def __init__(
+        self,
+        min_narration_ratio: float = 0.50,
+        skip_rules: Iterable[str] = (),
+        incremental: bool = False,
+    ):
+        skipped = set(skip_rules)
+        unknown = skipped - set(_RULE_REGISTRY)
+        if unknown:
+            raise ValueError(f"未知规则: {', '.join(sorted(unknown))}")
+        self.min_narration_ratio = min_narration_ratio
+        self.rules: list[QualityRule] = [cls() for name, cls in _RULE_REGISTRY.items() if name not in skipped]
+        self.incremental = incremental
+        self._cache: dict[str, _StoryboardRecord] = {}
+        self.last_recomputed = 0
+
+    def analyze(self, data: dict[str, Any] | Iterable[dict[str, Any]]) -> QualityReport:
+        """分析剧本；data 可以是完整剧本 dict，也可以是分镜迭代器（如 `iter_storyboards`）"""
+        if isinstance(data, dict):
+            storyboards = data.get("storyboards")
+            if not isinstance(storyboards, list) or not storyboards:
+                return _empty_storyboards_report()
+        else:
+            storyboards = data
+
+        rules = self.rules
+        timings = [0.0] * len(rules)
+        ctx = RuleContext(self.min_narration_ratio)
+        issues = ctx.issues
+        cache: dict[str, _StoryboardRecord] = {}
+        recomputed = 0
+        max_text_len = 0
+        clock = time.perf_counter
+
+        # 只调用覆写了对应访问者的规则，减少逐段遍历时的空调用
+        def overriding(hook: str) -> list[tuple[int, QualityRule]]:
+            base = getattr(QualityRule, hook)
+            return [(i, rule) for i, rule in enumerate(rules) if getattr(type(rule), hook) is not base]
+
+        sb_rules = overriding("visit_storyboard")
+        seg_rules = overriding("visit_segment")
+        end_rules = overriding("end_storyboard")
+
+        def run(
+            slot: Any,
+            hook_rules: list[tuple[int, QualityRule]],
+            record: _StoryboardRecord | None,
+            fresh: bool,
+            call,
+        ) -> None:
+            # 局部规则命中缓存时直接回放；否则执行并（增量模式下）记录输出
+            t0 = clock()
+            for i, rule in hook_rules:
+                if record is not None and not fresh and rule.scope == "storyboard":
+                    cached = record.issues.get((slot, i))
+                    if cached:
+                        issues.extend(_relocate(issue, ctx.sb_loc) for issue in cached)
+                else:
+                    start = len(issues)
+                    call(rule)
+                    if record is not None and rule.scope == "storyboard" and len(issues) > start:
+                        record.issues[(slot, i)] = [_relative(issue, ctx.sb_loc) for issue in issues[start:]]
+                t1 = clock()
+                timings[i] += t1 - t0
+                t0 = t1
+
+        t0 = clock()
+        for i, rule in enumerate(rules):
+            rule.begin(ctx)
+            t1 = clock()
+            timings[i] += t1 - t0
+            t0 = t1
+
+        sb_count = 0
+        for sb_index, sb in enumerate(storyboards):
+            sb_count += 1
+            record: _StoryboardRecord | None = None
+            fresh = True
+            if self.incremental:
+                digest = _storyboard_digest(sb)
+                record = cache.get(digest) or self._cache.get(digest)
+                fresh = record is None
+                if record is None:
+                    record = _StoryboardRecord({})
+                cache[digest] = record
+            if fresh:
+                recomputed += 1
+
+            ctx.sb_loc = f"storyboards[{sb_index}]"
+            scripts = sb.get("scripts")
+            if not isinstance(scripts, list) or not scripts:
+                scripts = None
+            run("head", sb_rules, record, fresh, lambda rule: rule.visit_storyboard(ctx, sb, scripts))
+            if scripts is None:
+                continue
+
+            ctx.sb_script_count = 0
+            ctx.sb_narration_count = 0
+            for sc_index, sc in enumerate(scripts):
+                ctx.sc_loc = f"{ctx.sb_loc}.scripts[{sc_index}]"
+                ctx.speaker = str(sc.get("speaker", "")).strip()
+                ctx.text = str(sc.get("text", ""))
+                max_text_len = max(max_text_len, len(ctx.text))
+                ctx.sb_script_count += 1
+                if ctx.speaker == NARRATION_SPEAKER:
+                    ctx.sb_narration_count += 1
+                run(sc_index, seg_rules, record, fresh, lambda rule: rule.visit_segment(ctx, sc))
+
+            ctx.script_count += ctx.sb_script_count
+            ctx.narration_count += ctx.sb_narration_count
+            run("tail", end_rules, record, fresh, lambda rule: rule.end_storyboard(ctx, sb))
+
+        if sb_count == 0:
+            return _empty_storyboards_report()
+
+        t0 = clock()
+        for i, rule in enumerate(rules):
+            rule.finish(ctx)
+            t1 = clock()
+            timings[i] += t1 - t0
+            t0 = t1
+
+        if self.incremental:
+            # 只保留本次出现的分镜，避免缓存随编辑历史无限增长
+            self._cache = cache
+        self.last_recomputed = recomputed
+
+        total = ctx.script_count
+        narr = ctx.narration_count
+        ratio = (narr / total) if total else 0.0
+        passed = not any(i.level == "error" for i in issues)
+        stats = QualityStats(sb_count, total, narr, ratio, max_text_len)
+        rule_timings = {rule.name: timings[i] for i, rule in enumerate(rules)}
+        return QualityReport(passed, stats, issues, rule_timings)
+
+
+def _empty_storyboards_report() -> QualityReport:
+    issues = [QualityIssue("error", "STORYBOARDS_EMPTY", "storyboards 为空或不存在", "storyboards")]
+    stats = QualityStats(0, 0, 0, 0.0, 0)
+    return QualityReport(False, stats, issues)
+
+
+def _relocate(issue: QualityIssue, prefix: str) -> QualityIssue:
+    return QualityIssue(issue.level, issue.code, issue.message, prefix + issue.location)
+
+
+def _relative(issue: QualityIssue, prefix: str) -> QualityIssue:
+    location = issue.location[len(prefix):] if issue.location.startswith(prefix) else issue.location
+    return QualityIssue(issue.level, issue.code, issue.message, location)
+
+
+class IncrementalQualityAnalyzer(QualityRuleEngine):
+    """增量质量分析器
+
+    按分镜内容哈希缓存分镜局部规则的结果；再次分析时只重算内容变化的分镜，
+    全局规则（分镜/段落 id 唯一性、全局旁白占比、跨分镜重复）每次重新执行。
+    适用于同一剧本被反复编辑、反复检查的场景（如 `refine_script_until_pass`）。
+    """
+
+    def __init__(self, min_narration_ratio: float = 0.50, skip_rules: Iterable[str] = ()):
+        super().__init__(min_narration_ratio, skip_rules, incremental=True)
+
+
+def analyze_script_quality(
+    data: dict[str, Any] | Iterable[dict[str, Any]],
+    min_narration_ratio: float = 0.50,
+    skip_rules: Iterable[str] = (),
+) -> QualityReport:
+    """检查剧本质量；data 传分镜迭代器时逐个分镜处理，不要求整个剧本常驻内存"""
+    return QualityRuleEngine(min_narration_ratio, skip_rules).analyze(data)
+
+
+def _file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _report_cache_path(path: Path, content_hash: str, min_narration_ratio: float, skip_rules: list[str]) -> Path:
+    """`quality_v<版本>_<脚本+参数键>_<内容键>.json`：同一脚本、同一参数的缓存共享前缀，便于替换旧内容的条目"""
+    slot_src = "\n".join([path.name, repr(float(min_narration_ratio)), ",".join(skip_rules)])
+    slot = hashlib.sha256(slot_src.encode("utf-8")).hexdigest()[:16]
+    return path.parent / REPORT_CACHE_DIR / f"quality_v{ANALYZER_VERSION}_{slot}_{content_hash[:32]}.json"
+
+
+def _write_report_cache(cache_path: Path, report: QualityReport) -> None:
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        slot_prefix = cache_path.name.rsplit("_", 1)[0] + "_"
+        # 清理旧版本分析器留下的缓存，以及同一脚本、同一参数下旧内容的缓存
+        for stale in cache_path.parent.glob("quality_v*.json"):
+            if stale == cache_path:
+                continue
+            if not stale.name.startswith(f"quality_v{ANALYZER_VERSION}_") or stale.name.startswith(slot_prefix):
+                stale.unlink()
+        save_json(cache_path, report.to_dict())
+    except OSError:
+        pass  # 缓存不可写时不影响检查结果
+
+
+def analyze_script_file(
+    path: str | Path,
+    min_narration_ratio: float = 0.50,
+    skip_rules: Iterable[str] = (),
+    use_cache: bool = False,
+) -> QualityReport:
+    """读取并检查单个 script.json（供命令行与多进程批量检查复用）
+
+    Args:
+        path: script.json 路径
+        min_narration_ratio: 旁白占比告警阈值
+        skip_rules: 需要关闭的规则名
+        use_cache: 是否使用磁盘报告缓存（`<剧本目录>/.cache/`）
+                   - 缓存键：文件内容哈希 + `ANALYZER_VERSION` + min_narration_ratio + 关闭的规则
+                   - 命中时直接返回缓存报告，不解析 JSON（`rule_timings` 为空）
+
+    未命中缓存时通过 `iter_storyboards` 流式读取，内存占用与单个分镜成正比。
+    """
+    path = Path(path)
+    skipped = sorted(set(skip_rules))
+    if not use_cache:
+        return analyze_script_quality(iter_storyboards(path), min_narration_ratio=min_narration_ratio, skip_rules=skipped)
+
+    cache_path = _report_cache_path(path, _file_sha256(path), min_narration_ratio, skipped)
+    if cache_path.is_file():
+        try:
+            return QualityReport.from_dict(load_json(cache_path))
+        except (OSError, ValueError, KeyError, TypeError):
+            pass  # 缓存损坏时重新分析并覆盖
+
+    report = analyze_script_quality(iter_storyboards(path), min_narration_ratio=min_narration_ratio, skip_rules=skipped)
+    _write_report_cache(cache_path, report)
+    return report
 
 
 def _extract_narration_candidates(novel_text: str) -> deque[str]:
     blocks = [b.strip() for b in novel_text.replace("\r\n", "\n").split("\n\n") if b.strip()]
     out: deque[str] = deque()
-    for block in blocks:
-        for chunk in _chunk_text(block, 80):
-            if chunk:
-                out.append(chunk)
+    for chunks in chunk_many(blocks, 80):
+        out.extend(chunk for chunk in chunks if chunk)
     if not out:
-        out.append("雨声贴着棚檐滑落，空气里浮着潮湿的铁锈味。")
+        out.append(NARRATION_FALLBACK_TEXT)
     return out
 
 
@@ -342,7 +926,7 @@ def _extract_keywords(text: str) -> list[str]:
         关键词列表（如["雨", "夜", "回访"]）
     """
     # 移除常见标题前缀
-    text = re.sub(r"^第[一二三四五六七八九十百千0-9]+章\s*", "", text).strip()
+    text = TITLE_CHAPTER_PREFIX_RE.sub("", text).strip()
 
     # 简单分词：按字符切分（适用于中文）
     # 过滤掉单字且为常见虚词的字符
@@ -352,176 +936,521 @@ def _extract_keywords(text: str) -> list[str]:
     return keywords[:10]  # 最多返回10个关键词
 
 
-def _filter_candidates_by_theme(
-    candidates: deque[str],
-    storyboard_title: str,
-    max_relevant: int = 50,
-) -> deque[str]:
-    """根据分镜主题筛选相关旁白候选
+class NarrationCandidateIndex:
+    """旁白候选池 + 字符倒排索引
 
-    Args:
-        candidates: 全部旁白候选池
-        storyboard_title: 分镜标题（如"第一章 雨夜回访"）
-        max_relevant: 最多保留多少个相关候选
+    每部小说只构建一次：`_extract_keywords` 产出的关键词都是单字，因此“候选包含任一关键词”
+    等价于各关键词倒排表的并集。按分镜主题排序时只返回候选编号，不复制候选文本；
+    候选指纹也按编号缓存，在各分镜、各轮补强间复用。
 
-    Returns:
-        筛选后的候选池（相关候选在前，其他候选在后）
+    给出候选偏移与分区（章节/段落）起点时，还可按分镜原文区间就近分组（见 `section_rings`）。
+
+    Attributes:
+        texts: 全部旁白候选（按出现顺序）
     """
-    if not storyboard_title:
-        return candidates
-
-    # 提取主题关键词
-    keywords = _extract_keywords(storyboard_title)
-    if not keywords:
-        return candidates
-
-    # 将候选分为相关和无关两类
-    relevant: deque[str] = deque()
-    others: deque[str] = deque()
-
-    for text in candidates:
-        # 检查候选文本是否包含任一关键词
-        if any(kw in text for kw in keywords):
-            relevant.append(text)
-            if len(relevant) >= max_relevant:
-                break  # 相关候选已足够
+
+    def __init__(
+        self,
+        texts: Iterable[str],
+        offsets: Iterable[int] | None = None,
+        section_starts: Iterable[int] = (),
+    ):
+        self.texts: list[str] = list(texts)
+        self._section_starts = list(section_starts)
+        self._by_section: dict[int, list[int]] | None = None
+        if offsets is not None:
+            # 分区编号 -1 表示第一个分区之前的文本（如章节前的序言）；章节标题行不参与就近取材
+            self._by_section = {}
+            for cid, offset in enumerate(offsets):
+                if CHAPTER_HEADING_LINE_RE.match(self.texts[cid]):
+                    continue
+                section = bisect_right(self._section_starts, offset) - 1
+                self._by_section.setdefault(section, []).append(cid)
+        self._postings: dict[str, list[int]] = {}
+        for cid, text in enumerate(self.texts):
+            for ch in set(text):
+                self._postings.setdefault(ch, []).append(cid)
+        self._fingerprints: list[TextFingerprint | None] = [None] * len(self.texts)
+        self._ranker: Bm25Ranker | None = None
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def fingerprint(self, cid: int) -> TextFingerprint:
+        fp = self._fingerprints[cid]
+        if fp is None:
+            fp = self._fingerprints[cid] = fingerprint_text(self.texts[cid])
+        return fp
+
+    def rank_by_theme(
+        self,
+        storyboard_title: str,
+        max_relevant: int = NARRATION_TOP_K,
+        ids: list[int] | None = None,
+    ) -> list[int]:
+        """根据分镜主题排列候选编号
+
+        Args:
+            storyboard_title: 分镜标题（如"第一章 雨夜回访"）
+            max_relevant: 最多保留多少个相关候选
+            ids: 只在这些候选中排序（就近取材时的窗口）；为 None 时对全部候选排序
+
+        Returns:
+            候选编号列表：相关候选在前，其他候选在后（兜底）。对全部候选排序且相关候选已足够时，
+            只保留出现在第 `max_relevant` 个相关候选之前的无关候选。
+        """
+        total = len(self.texts)
+        keywords = _extract_keywords(storyboard_title) if storyboard_title else []
+        matched: set[int] = set()
+        for kw in set(keywords):
+            matched.update(self._postings.get(kw, ()))
+
+        if ids is not None:
+            return [cid for cid in ids if cid in matched] + [cid for cid in ids if cid not in matched]
+        if not matched:
+            return list(range(total))
+
+        relevant = sorted(matched)
+        if len(relevant) >= max_relevant:
+            relevant = relevant[:max_relevant]
+            cutoff = relevant[-1]
         else:
-            others.append(text)
+            cutoff = total
+        others = [cid for cid in range(cutoff) if cid not in matched]
+        return relevant + others
+
+    def section_rings(self, span: tuple[int, int]) -> Iterator[list[int]] | None:
+        """按分镜原文区间 [start, end) 逐层给出候选编号
+
+        第一组是区间覆盖的分区内的候选，之后每组向两侧各扩展一个相邻分区，直到覆盖全部分区。
+        未记录候选偏移时返回 None。
+        """
+        if self._by_section is None:
+            return None
+        starts = self._section_starts
+        start, end = span
+        lo = bisect_right(starts, start) - 1
+        hi = max(lo, bisect_right(starts, max(start, end - 1)) - 1)
+        by_section = self._by_section
+
+        def rings() -> Iterator[list[int]]:
+            yield [cid for section in range(lo, hi + 1) for cid in by_section.get(section, ())]
+            first, last = min(by_section, default=-1), max(by_section, default=-1)
+            distance = 1
+            while lo - distance >= first or hi + distance <= last:
+                yield by_section.get(lo - distance, []) + by_section.get(hi + distance, [])
+                distance += 1
+
+        return rings()
+
+    def rank_by_relevance(self, queries: list[str], top_k: int = NARRATION_TOP_K) -> list[list[int]]:
+        """按 BM25 相关性批量排列候选编号（需要 numpy）
+
+        每个查询一次性取得分最高的 `top_k` 个候选排在前面，其余候选按出现顺序兜底；
+        与任何候选都没有共同 bigram 的查询退化为原始顺序。
+        """
+        if self._ranker is None:
+            self._ranker = Bm25Ranker(self.texts)
+        ranked: list[list[int]] = []
+        for top in self._ranker.top_k(queries, top_k):
+            chosen = set(top)
+            ranked.append(top + [cid for cid in range(len(self.texts)) if cid not in chosen])
+        return ranked
+
+
+def _storyboard_source_span(sb: dict[str, Any]) -> tuple[int, int] | None:
+    """分镜对应小说原文的字符区间（由分镜规划器写入 `source_span`），缺失或非法时返回 None"""
+    span = sb.get("source_span")
+    if not isinstance(span, (list, tuple)) or len(span) != 2:
+        return None
+    start, end = span
+    if not isinstance(start, int) or not isinstance(end, int) or isinstance(start, bool) or isinstance(end, bool):
+        return None
+    if start < 0 or end <= start:
+        return None
+    return start, end
+
+
+def _storyboard_query_text(sb: dict[str, Any]) -> str:
+    """BM25 排序用的分镜查询：标题（去章节前缀）+ 摘要 + 对白正文"""
+    parts = [TITLE_CHAPTER_PREFIX_RE.sub("", str(sb.get("title", "")).strip()), str(sb.get("summary") or "")]
+    for sc in sb.get("scripts", []):
+        if str(sc.get("speaker", "")).strip() != NARRATION_SPEAKER:
+            parts.append(str(sc.get("text", "")))
+    return "\n".join(p for p in parts if p)
+
+
+def _narration_segment(text: str) -> dict[str, Any]:
+    return {
+        "id": "",
+        "speaker": NARRATION_SPEAKER,
+        "text": text,
+        "character_image": None,
+        "effect": "typewriter",
+        "speed": DEFAULT_TYPEWRITER_SPEED,
+    }
+
+
+class _SpliceGaps:
+    """把“按当前下标逐个插入”换算为“插在第 j 个原始段落之前”的缝隙记录
+
+    原始段落 j 在当前列表中的下标为 j + (缝隙 0..j 的已插入数)，用树状数组维护前缀和，
+    单次定位 O(log² n)，无需真的对列表做 `insert`。
+    """
 
-    # 相关候选在前，其他候选在后（兜底）
-    relevant.extend(others)
-    return relevant
+    def __init__(self, size: int):
+        self.size = size
+        self.gaps: dict[int, list[dict[str, Any]]] = {}
+        self._tree = [0] * (size + 2)
+
+    def _inserted_upto(self, gap: int) -> int:
+        total = 0
+        i = gap + 1
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def insert(self, pos: int, segment: dict[str, Any]) -> None:
+        # 找到最小的原始段落 j，使其当前下标 >= pos；找不到则落在末尾缝隙
+        lo, hi = 0, self.size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if mid + self._inserted_upto(mid) >= pos:
+                hi = mid
+            else:
+                lo = mid + 1
+        gap = lo
+        gap_start = 0 if gap == 0 else gap + self._inserted_upto(gap - 1)
+        items = self.gaps.setdefault(gap, [])
+        items.insert(min(max(0, pos - gap_start), len(items)), segment)
+
+        i = gap + 1
+        while i < len(self._tree):
+            self._tree[i] += 1
+            i += i & -i
+
+    def first_is_inserted(self) -> bool:
+        return bool(self.gaps.get(0))
+
+    def final_positions(self) -> Iterator[tuple[int, dict[str, Any]]]:
+        """按最终下标升序给出 (下标, 新段落)"""
+        inserted = 0
+        for gap in sorted(self.gaps):
+            for segment in self.gaps[gap]:
+                yield gap + inserted, segment
+                inserted += 1
 
 
-def enrich_narration_with_novel(
+@dataclass
+class NarrationInsertion:
+    storyboard_index: int
+    index: int  # 计划应用后该段落在分镜 scripts 中的下标
+    segment: dict[str, Any]
+
+
+@dataclass
+class EnrichmentPlan:
+    """旁白补强的拼接计划：按分镜、按最终下标升序排列的插入项"""
+
+    insertions: list[NarrationInsertion] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.insertions)
+
+    def apply(self, data: dict[str, Any]) -> dict[str, Any]:
+        """线性重建被修改的分镜，返回新剧本（不修改 `data`）
+
+        未被修改的分镜、原有段落与 `data` 共享对象；需要独立副本时由调用方自行深拷贝
+        （`normalize_and_repair_script` 本身即返回深拷贝）。
+        """
+        result = dict(data)
+        if not self.insertions:
+            return result
+
+        storyboards = list(data.get("storyboards", []))
+        by_storyboard: dict[int, list[NarrationInsertion]] = {}
+        for ins in self.insertions:
+            by_storyboard.setdefault(ins.storyboard_index, []).append(ins)
+
+        for sb_idx, items in by_storyboard.items():
+            sb = storyboards[sb_idx]
+            originals = iter(sb.get("scripts", []))
+            scripts: list[dict[str, Any]] = []
+            for ins in items:
+                while len(scripts) < ins.index:
+                    scripts.append(next(originals))
+                scripts.append(dict(ins.segment))
+            scripts.extend(originals)
+            storyboards[sb_idx] = {**sb, "scripts": scripts}
+
+        result["storyboards"] = storyboards
+        return result
+
+    def to_json_patch(self) -> list[dict[str, Any]]:
+        """导出为 JSON Patch（RFC 6902）`add` 操作列表，按顺序应用即可得到补强结果"""
+        return [
+            {
+                "op": "add",
+                "path": f"/storyboards/{ins.storyboard_index}/scripts/{ins.index}",
+                "value": ins.segment,
+            }
+            for ins in self.insertions
+        ]
+
+
+def plan_narration_enrichment(
     data: dict[str, Any],
-    novel_text: str,
+    novel_text: str | NovelCorpus,
     target_ratio: float = 0.50,
-) -> dict[str, Any]:
-    result = copy.deepcopy(data)
-    candidates = _extract_narration_candidates(novel_text)
+    ranking: str = "theme",
+    storyboard_indexes: Iterable[int] | None = None,
+    predict_repair: bool = False,
+) -> EnrichmentPlan:
+    """规划旁白补强（只读 `data`），返回拼接计划
 
-    # 收集全剧本已有段落文本，用于重复检测
-    existing_texts: list[str] = []
-    for sb in result.get("storyboards", []):
+    Args:
+        ranking: 候选排序方式。`theme` 按标题关键词筛选（默认，无额外依赖）；
+            `bm25` 按标题/摘要/对白与候选的 bigram BM25 相关性批量取 top-k（需要 numpy）
+        storyboard_indexes: 只为这些分镜补强（默认全部）；重复检测仍覆盖全剧本
+        predict_repair: 闭式求解模式。按 `normalize_and_repair_script` 修复后的分句数计算缺口与插入收益
+            （超长段落拆分、清洗后为空的段落与候选都计入），补强并修复一次即可达标，无需多轮迭代
+    """
+    if ranking not in NARRATION_RANKINGS:
+        raise ValueError(f"unknown ranking: {ranking!r} (expected one of {NARRATION_RANKINGS})")
+    if isinstance(novel_text, str):
+        from engine.novel_corpus import NovelCorpus  # 避免循环导入
+
+        novel_text = NovelCorpus.from_text(novel_text)
+    candidate_index = novel_text.candidate_index()
+    candidate_texts = candidate_index.texts
+
+    storyboards = data.get("storyboards", [])
+
+    # 收集全剧本已有段落，建立可增量更新的近重复索引
+    existing_texts = SimilarityIndex()
+    for sb in storyboards:
         for sc in sb.get("scripts", []):
             text = str(sc.get("text", "")).strip()
             if text:
-                existing_texts.append(text)
-
-    for sb in result.get("storyboards", []):
+                existing_texts.add(text)
+
+    # 计算各分镜需要补充的旁白数量
+    scope = range(len(storyboards)) if storyboard_indexes is None else sorted(set(storyboard_indexes))
+    needs: dict[int, int] = {}
+    starts_with_narration: dict[int, bool] = {}
+    for sb_idx in scope:
+        sb = storyboards[sb_idx]
         scripts = sb.get("scripts", [])
         if not isinstance(scripts, list) or not scripts:
             continue
-
-        # 计算当前分镜需要补充的旁白数量
-        narr = sum(1 for s in scripts if str(s.get("speaker", "")).strip() == NARRATION_SPEAKER)
-        total = len(scripts)
+        if predict_repair:
+            counts = _repaired_part_counts(scripts, DEFAULT_SPEAKER_ALIASES)
+            total = sum(parts for _, parts in counts)
+            narr = sum(parts for is_narr, parts in counts if is_narr)
+            # 修复后的首段是第一个未被删除的段落
+            starts_with_narration[sb_idx] = next((is_narr for is_narr, parts in counts if parts), False)
+        else:
+            total = len(scripts)
+            narr = sum(1 for s in scripts if str(s.get("speaker", "")).strip() == NARRATION_SPEAKER)
+            starts_with_narration[sb_idx] = str(scripts[0].get("speaker", "")).strip() == NARRATION_SPEAKER
         need = _required_insertions(total, narr, target_ratio)
-        if need <= 0:
-            continue
+        if need > 0 or not starts_with_narration[sb_idx]:
+            # 占比已达标、但（修复后）不以旁白开头的分镜也要补开头旁白
+            needs[sb_idx] = need
+
+    gain_cache: dict[int, int] = {}
+
+    def _gain(cid: int) -> int:
+        """插入候选 cid 在修复后贡献的旁白段数"""
+        if not predict_repair:
+            return 1
+        gain = gain_cache.get(cid)
+        if gain is None:
+            text = _normalize_segment_text(NARRATION_SPEAKER, candidate_texts[cid])
+            gain = gain_cache[cid] = len(_chunk_text(text, 80)) if text else 0
+        return gain
+
+    relevance: dict[int, list[int]] = {}
+    if ranking == "bm25" and needs:
+        # 所有待补强分镜一次批量打分
+        queries = [_storyboard_query_text(storyboards[sb_idx]) for sb_idx in needs]
+        relevance = dict(zip(needs, candidate_index.rank_by_relevance(queries)))
+
+    plan = EnrichmentPlan()
+    for sb_idx, need in needs.items():
+        sb = storyboards[sb_idx]
+        scripts = sb["scripts"]
 
-        # 【Phase 2.4新增】根据分镜标题筛选主题相关的候选
         sb_title = str(sb.get("title", "")).strip()
-        sb_candidates = _filter_candidates_by_theme(copy.deepcopy(candidates), sb_title)
+        if ranking == "bm25":
+            sb_order = relevance[sb_idx]
+        else:
+            # 【Phase 2.4新增】根据分镜标题筛选主题相关的候选
+            sb_order = candidate_index.rank_by_theme(sb_title)
+
+        # 分镜记录了原文区间时就近取材：先在所在章节内选，候选用尽再逐层扩展到相邻章节
+        span = _storyboard_source_span(sb)
+        rings = candidate_index.section_rings(span) if span else None
+        rank_of: dict[int, int] = {}
+        if rings is not None and ranking == "bm25":
+            rank_of = {cid: i for i, cid in enumerate(sb_order)}
+
+        def _widen() -> list[int] | None:
+            if rings is None:
+                return None
+            for ids in rings:
+                if ids:
+                    if ranking == "bm25":
+                        return sorted(ids, key=rank_of.__getitem__)
+                    return candidate_index.rank_by_theme(sb_title, ids=ids)
+            return None
+
+        sb_candidates = _widen() if rings is not None else sb_order
+        if not sb_candidates:
+            continue
+        cursor = 0  # 循环取候选，等价于对候选队列逐次 rotate(-1)
 
         insert_positions = [i for i, s in enumerate(scripts) if str(s.get("speaker", "")).strip() != NARRATION_SPEAKER]
         if not insert_positions:
             continue
 
+        splice = _SpliceGaps(len(scripts))
         inserted = 0
+        gained = 0
         pos_cursor = 0
-        max_retries = len(sb_candidates)  # 防止无限循环
         retries = 0
 
-        while inserted < need and retries < max_retries:
-            candidate_text = sb_candidates[0]
-            sb_candidates.rotate(-1)
-            retries += 1
-
-            # 前置重复检测：跳过与已有段落高度相似的候选
-            is_duplicate = False
-            for existing in existing_texts:
-                if _calculate_similarity(candidate_text, existing) >= 0.85:
-                    is_duplicate = True
+        while gained < need:
+            if retries >= len(sb_candidates):
+                # 当前窗口整轮都重复（已插入文本只增不减，之后也不会再可用），扩展到相邻章节
+                wider = _widen()
+                if wider is None:
                     break
+                sb_candidates, cursor, retries = wider, 0, 0
+
+            cid = sb_candidates[cursor % len(sb_candidates)]
+            cursor += 1
+            retries += 1
 
-            if is_duplicate:
+            # 前置重复检测：跳过与已有段落高度相似的候选（求解模式下也跳过修复后会被删除的候选）
+            gain = _gain(cid)
+            if gain == 0:
+                continue
+            candidate_fp = candidate_index.fingerprint(cid)
+            if existing_texts.has_similar(candidate_fp, 0.85):
                 continue  # 跳过重复候选，尝试下一个
 
-            # 插入旁白
+            # 插入旁白（下标口径与逐次 list.insert 一致）
             pos = insert_positions[pos_cursor % len(insert_positions)] + inserted
-            scripts.insert(
-                pos,
-                {
-                    "id": "",
-                    "speaker": NARRATION_SPEAKER,
-                    "text": candidate_text,
-                    "character_image": None,
-                    "effect": "typewriter",
-                    "speed": DEFAULT_TYPEWRITER_SPEED,
-                },
-            )
-            existing_texts.append(candidate_text)  # 记录已插入文本
+            splice.insert(pos, _narration_segment(candidate_texts[cid]))
+            existing_texts.add(candidate_fp)  # 记录已插入文本
             inserted += 1
+            gained += gain
             pos_cursor += 1
             retries = 0  # 成功插入后重置重试计数
 
-        if str(scripts[0].get("speaker", "")).strip() != NARRATION_SPEAKER:
+        if not splice.first_is_inserted() and not starts_with_narration[sb_idx]:
             # 为分镜开头补充旁白（同样使用主题筛选）
-            first_narration = None
-            for _ in range(len(sb_candidates)):
-                candidate = sb_candidates[0]
-                sb_candidates.rotate(-1)
-
-                is_duplicate = False
-                for existing in existing_texts:
-                    if _calculate_similarity(candidate, existing) >= 0.85:
-                        is_duplicate = True
+            while sb_candidates is not None:
+                found = False
+                for _ in range(len(sb_candidates)):
+                    cid = sb_candidates[cursor % len(sb_candidates)]
+                    cursor += 1
+
+                    if _gain(cid) == 0:
+                        continue
+                    candidate_fp = candidate_index.fingerprint(cid)
+                    if not existing_texts.has_similar(candidate_fp, 0.85):
+                        splice.insert(0, _narration_segment(candidate_texts[cid]))
+                        existing_texts.add(candidate_fp)
+                        found = True
                         break
-
-                if not is_duplicate:
-                    first_narration = candidate
+                if found:
                     break
+                sb_candidates, cursor = _widen(), 0
 
-            if first_narration:
-                scripts.insert(
-                    0,
-                    {
-                        "id": "",
-                        "speaker": NARRATION_SPEAKER,
-                        "text": first_narration,
-                        "character_image": None,
-                        "effect": "typewriter",
-                        "speed": DEFAULT_TYPEWRITER_SPEED,
-                    },
-                )
-                existing_texts.append(first_narration)
+        plan.insertions.extend(
+            NarrationInsertion(sb_idx, index, segment) for index, segment in splice.final_positions()
+        )
+
+    return plan
+
+
+def enrich_narration_with_novel(
+    data: dict[str, Any],
+    novel_text: str | NovelCorpus,
+    target_ratio: float = 0.50,
+    ranking: str = "theme",
+    storyboard_indexes: Iterable[int] | None = None,
+    predict_repair: bool = False,
+) -> dict[str, Any]:
+    """按拼接计划补充旁白；返回的新剧本与 `data` 共享未修改的分镜与段落"""
+    plan = plan_narration_enrichment(data, novel_text, target_ratio, ranking, storyboard_indexes, predict_repair)
+    return plan.apply(data)
 
-    return result
+
+def _clean_segment(sc: dict[str, Any], aliases: dict[str, str]) -> tuple[str, str]:
+    """修复时对单段的说话人映射与文本清洗，返回 (speaker, text)；text 为空表示该段会被删除"""
+    speaker = str(sc.get("speaker", "")).strip()
+    speaker = aliases.get(speaker, speaker)
+    return speaker, _normalize_segment_text(speaker, str(sc.get("text", "")))
+
+
+def _repaired_part_counts(scripts: list[dict[str, Any]], aliases: dict[str, str]) -> list[tuple[bool, int]]:
+    """预测 `normalize_and_repair_script` 修复后每段的 (是否旁白, 分句数)，分句数为 0 表示被删除"""
+    cleaned = [_clean_segment(sc, aliases) for sc in scripts]
+    chunked = chunk_many(text for _, text in cleaned)
+    return [
+        (speaker == NARRATION_SPEAKER, len(parts) if text else 0)
+        for (speaker, text), parts in zip(cleaned, chunked)
+    ]
 
 
 def normalize_and_repair_script(
     data: dict[str, Any],
     speaker_aliases: dict[str, str] | None = None,
+    in_place: bool = False,
+    storyboard_indexes: Iterable[int] | None = None,
 ) -> dict[str, Any]:
-    aliases = speaker_aliases or {"我": "盲眼法医"}
-    result = copy.deepcopy(data)
+    """清洗文本、分句、分配稳定段落 id 并重建 `asset_manifest`
+
+    段落 id 由 `SegmentIdAllocator` 分配：未拆分的段落保留原 id，拆分后首句沿用原 id、
+    其余派生为 `<原id>_2`…；本次的新旧 id 映射写入 `shared.pipeline_state.segment_id_map`。
 
-    for sb in result.get("storyboards", []):
+    Args:
+        in_place: 为 True 时直接修改并返回 `data`，省去整份剧本的深拷贝
+            （适用于调用方独占 `data` 的场景，如补强后的中间结果）
+        storyboard_indexes: 只修复这些分镜（默认全部），资产清单随之增量更新；
+            其余分镜应已修复过，id 分配仍避开全剧本已有 id
+    """
+    aliases = speaker_aliases or DEFAULT_SPEAKER_ALIASES
+    result = data if in_place else copy.deepcopy(data)
+    storyboards = result.get("storyboards", [])
+    allocator = SegmentIdAllocator(
+        str(sc.get("id", "")).strip() for sb in storyboards for sc in sb.get("scripts", [])
+    )
+    scope = range(len(storyboards)) if storyboard_indexes is None else sorted(set(storyboard_indexes))
+
+    for sb_idx in scope:
+        sb = storyboards[sb_idx]
         scripts = sb.get("scripts", [])
         repaired: list[dict[str, Any]] = []
 
+        cleaned: list[tuple[dict[str, Any], str, str]] = []
         for sc in scripts:
-            speaker = str(sc.get("speaker", "")).strip()
-            speaker = aliases.get(speaker, speaker)
-            text = _normalize_segment_text(speaker, str(sc.get("text", "")))
-            if not text:
-                continue
-            parts = _chunk_text(text, 80)
-            for part in parts:
+            speaker, text = _clean_segment(sc, aliases)
+            if text:
+                cleaned.append((sc, speaker, text))
+            else:
+                allocator.assign(str(sc.get("id", "")).strip(), 0)
+
+        chunked = chunk_many((text for _, _, text in cleaned), 80)
+        for (sc, speaker, _), parts in zip(cleaned, chunked):
+            part_ids = allocator.assign(str(sc.get("id", "")).strip(), len(parts))
+            for seg_id, part in zip(part_ids, parts):
                 item = {
-                    "id": "",
+                    "id": seg_id,
                     "speaker": speaker,
                     "text": part,
                     "character_image": sc.get("character_image"),
@@ -534,64 +1463,233 @@ def normalize_and_repair_script(
 
         sb["scripts"] = repaired
 
-    _reindex_segment_ids(result, preserve_existing=True)
-    rebuild_asset_manifest(result)
+    shared = result.setdefault("shared", {})
+    shared.setdefault("pipeline_state", {})["segment_id_map"] = allocator.id_map()
+    if storyboard_indexes is None:
+        rebuild_asset_manifest(result)
+    else:
+        update_asset_manifest(result, scope)
     return result
 
 
-def _reindex_segment_ids(data: dict[str, Any], preserve_existing: bool = True) -> None:
-    """重新编号段落ID，可选保留已有ID
+SEGMENT_ID_RE = re.compile(r"^s(\d+)$")
 
-    Args:
-        data: 剧本数据
-        preserve_existing: 是否保留已有ID（默认True）
-                          - True: 只为缺失ID的段落分配新ID，已有ID保持不变
-                          - False: 全部重新编号
+
+class SegmentIdAllocator:
+    """稳定的段落 id 分配器
+
+    - 原 id 保留；一段被拆成多句时首句沿用原 id，其余依次派生为 `<原id>_2`、`<原id>_3`…
+    - 无 id（如新插入的旁白）或与前文重复的段落，从 `s{现有最大编号+1}` 起分配新 id
+    - 派生 id 跳过剧本中已出现的 id，不会与其它段落冲突
+
+    分配过程同时记录新旧 id 映射（见 `id_map`），模块3据此只重绑实际变化的段落。
     """
-    if preserve_existing:
-        # 收集已存在的ID
-        existing_ids: set[int] = set()
-        for sb in data.get("storyboards", []):
-            for sc in sb.get("scripts", []):
-                sid_str = str(sc.get("id", "")).strip()
-                if sid_str and sid_str.startswith("s"):
-                    try:
-                        existing_ids.add(int(sid_str[1:]))
-                    except ValueError:
-                        pass  # 忽略无效ID
-
-        # 从最大ID+1开始分配新ID
-        next_id = max(existing_ids, default=0) + 1
-    else:
-        next_id = 1
 
-    # 只为缺失ID的段落分配新ID
-    for sb in data.get("storyboards", []):
-        for sc in sb.get("scripts", []):
-            current_id = str(sc.get("id", "")).strip()
-            if not current_id or current_id == "":
-                sc["id"] = f"s{next_id}"
-                next_id += 1
-            elif not preserve_existing:
-                # 强制重新编号模式
-                sc["id"] = f"s{next_id}"
-                next_id += 1
+    def __init__(self, existing_ids: Iterable[str] = ()):
+        self._reserved = {seg_id for seg_id in existing_ids if seg_id}
+        self._claimed: set[str] = set()
+        serials = (int(m.group(1)) for m in map(SEGMENT_ID_RE.match, self._reserved) if m)
+        self._next_serial = max(serials, default=0) + 1
+        self.renamed: dict[str, list[str]] = {}
+        self.added: list[str] = []
+
+    def _claim(self, seg_id: str) -> str:
+        self._claimed.add(seg_id)
+        return seg_id
+
+    def _fresh(self) -> str:
+        seg_id = f"s{self._next_serial}"
+        self._next_serial += 1
+        return self._claim(seg_id)
+
+    def assign(self, old_id: str, part_count: int) -> list[str]:
+        """为原 id 为 `old_id` 的段落拆出的 `part_count` 句分配 id（0 表示该段被删除）"""
+        parent = old_id if old_id and old_id not in self._claimed else ""
+        if part_count <= 0:
+            if parent:
+                self.renamed[parent] = []
+            return []
+
+        ids = [self._claim(parent) if parent else self._fresh()]
+        suffix = 2
+        while len(ids) < part_count:
+            seg_id = f"{ids[0]}_{suffix}"
+            suffix += 1
+            if seg_id not in self._reserved and seg_id not in self._claimed:
+                ids.append(self._claim(seg_id))
+
+        if not parent:
+            self.added.extend(ids)
+        elif len(ids) > 1:
+            self.renamed[parent] = list(ids)
+        else:
+            # 同 id 的前一段被删除时，该 id 仍由本段沿用
+            self.renamed.pop(parent, None)
+        return ids
 
+    def id_map(self) -> dict[str, Any]:
+        """本次分配的 id 映射：`renamed` 为 原id -> 新id 列表（拆分或删除），`added` 为新增段落 id"""
+        return {"renamed": dict(self.renamed), "added": list(self.added)}
 
-def rebuild_asset_manifest(data: dict[str, Any]) -> None:
-    manifest: list[dict[str, Any]] = []
-    for sb in data.get("storyboards", []):
-        bg = ((sb.get("background") or {}).get("image"))
-        for sc in sb.get("scripts", []):
-            manifest.append(
-                {
-                    "segment_id": sc.get("id"),
-                    "background_image": bg,
-                    "character_image": sc.get("character_image"),
-                }
-            )
 
+def merge_segment_id_maps(earlier: dict[str, Any], later: dict[str, Any]) -> dict[str, Any]:
+    """把先后两次 `segment_id_map` 合成为一次（原始 id -> 最终 id）"""
+    later_renamed: dict[str, list[str]] = later.get("renamed", {})
+
+    def forward(ids: Iterable[str]) -> list[str]:
+        return [new_id for seg_id in ids for new_id in later_renamed.get(seg_id, [seg_id])]
+
+    renamed: dict[str, list[str]] = {}
+    produced: set[str] = set(earlier.get("added", []))
+    for old_id, ids in earlier.get("renamed", {}).items():
+        produced.update(ids)
+        renamed[old_id] = forward(ids)
+    for old_id, ids in later_renamed.items():
+        if old_id not in produced:
+            renamed.setdefault(old_id, list(ids))
+
+    return {
+        "renamed": {old_id: ids for old_id, ids in renamed.items() if ids != [old_id]},
+        "added": forward(earlier.get("added", [])) + list(later.get("added", [])),
+    }
+
+
+ASSET_INDEX_VERSION = 1
+
+
+class _AssetTable:
+    """`shared.asset_index` 的唯一资产表：按 (类别, 路径) 去重并维护引用计数"""
+
+    def __init__(self, assets: list[dict[str, Any]]):
+        self.assets = assets
+        self._refs: dict[tuple[str, str], int] = {
+            (item["kind"], self._key(item["path"])): i for i, item in enumerate(assets)
+        }
+
+    @staticmethod
+    def _key(path: Any) -> str:
+        return path if isinstance(path, str) else json.dumps(path, ensure_ascii=False, sort_keys=True)
+
+    def acquire(self, kind: str, path: Any, count: int) -> int | None:
+        if path is None:
+            return None
+        key = (kind, self._key(path))
+        ref = self._refs.get(key)
+        if ref is None:
+            ref = self._refs[key] = len(self.assets)
+            self.assets.append({"kind": kind, "path": path, "refs": 0})
+        self.assets[ref]["refs"] += count
+        return ref
+
+    def release(self, ref: int | None, count: int) -> None:
+        if ref is not None:
+            self.assets[ref]["refs"] -= count
+
+    def dead_count(self) -> int:
+        return sum(1 for item in self.assets if item["refs"] <= 0)
+
+
+def _background_refs(segment_count: int) -> int:
+    # 没有段落的分镜仍在使用背景，至少计 1 次引用，避免模块3按 refs == 0 跳过
+    return max(1, segment_count)
+
+
+def _index_storyboard(table: _AssetTable, sb: dict[str, Any]) -> dict[str, Any]:
+    scripts = sb.get("scripts", [])
+    bg_ref = table.acquire("background", (sb.get("background") or {}).get("image"), _background_refs(len(scripts)))
+    segments = [
+        [sc.get("id"), table.acquire("character", sc.get("character_image"), 1)]
+        for sc in scripts
+    ]
+    return {"id": sb.get("id"), "background": bg_ref, "segments": segments}
+
+
+def _release_storyboard(table: _AssetTable, entry: dict[str, Any]) -> None:
+    table.release(entry["background"], _background_refs(len(entry["segments"])))
+    for _, char_ref in entry["segments"]:
+        table.release(char_ref, 1)
+
+
+def _manifest_rows(assets: list[dict[str, Any]], entry: dict[str, Any]) -> list[dict[str, Any]]:
+    """单个分镜在兼容视图中的行（每段一条 `segment_id/background_image/character_image`）"""
+    bg_ref = entry["background"]
+    bg = assets[bg_ref]["path"] if bg_ref is not None else None
+    return [
+        {
+            "segment_id": segment_id,
+            "background_image": bg,
+            "character_image": assets[char_ref]["path"] if char_ref is not None else None,
+        }
+        for segment_id, char_ref in entry["segments"]
+    ]
+
+
+def _expand_asset_manifest(index: dict[str, Any]) -> list[dict[str, Any]]:
+    """由紧凑索引展开兼容视图"""
+    assets = index["assets"]
+    return [row for entry in index["storyboards"] for row in _manifest_rows(assets, entry)]
+
+
+def _store_asset_manifest(data: dict[str, Any], index: dict[str, Any], manifest: list[dict[str, Any]] | None = None) -> None:
+    if manifest is None:
+        manifest = _expand_asset_manifest(index)
     shared = data.setdefault("shared", {})
+    shared["asset_index"] = index
     shared["asset_manifest"] = manifest
     pipeline_state = shared.setdefault("pipeline_state", {})
     pipeline_state["asset_manifest_count"] = len(manifest)
+
+
+def rebuild_asset_manifest(data: dict[str, Any]) -> None:
+    """全量重建资产清单
+
+    - `shared.asset_index`：紧凑索引。`assets` 为去重后的资产表（`kind`/`path`/`refs`），
+      `storyboards[i]` 记录分镜背景引用与各段落的 `[segment_id, 立绘引用]`，引用为资产表下标或 null。
+      模块3直接遍历 `assets` 即可拿到去重后的待生成资产。
+    - `shared.asset_manifest`：兼容视图，每段一条，由紧凑索引展开。
+    """
+    table = _AssetTable([])
+    entries = [_index_storyboard(table, sb) for sb in data.get("storyboards", [])]
+    _store_asset_manifest(data, {"version": ASSET_INDEX_VERSION, "assets": table.assets, "storyboards": entries})
+
+
+def update_asset_manifest(data: dict[str, Any], storyboard_indexes: Iterable[int]) -> None:
+    """只按指定分镜增量更新资产清单（如模块3回写了部分分镜的立绘/背景后）
+
+    兼容视图 `asset_manifest` 只替换这些分镜对应的行。分镜数量变化、索引或兼容视图缺失/不一致、
+    版本不符时退化为全量重建；更新后引用计数为 0 的资产过多时压缩资产表。
+    """
+    storyboards = data.get("storyboards", [])
+    shared = data.get("shared") or {}
+    index = shared.get("asset_index")
+    manifest = shared.get("asset_manifest")
+    if (
+        not isinstance(index, dict)
+        or index.get("version") != ASSET_INDEX_VERSION
+        or len(index.get("storyboards", [])) != len(storyboards)
+        or not isinstance(manifest, list)
+    ):
+        rebuild_asset_manifest(data)
+        return
+
+    entries = index["storyboards"]
+    # 各分镜在兼容视图中的起始行（按更新前的段落数）
+    starts = [0]
+    for entry in entries:
+        starts.append(starts[-1] + len(entry["segments"]))
+    if starts[-1] != len(manifest):
+        rebuild_asset_manifest(data)
+        return
+
+    table = _AssetTable(index["assets"])
+    # 从后往前替换，前面分镜的起始行不受段落数变化影响
+    for sb_idx in sorted(set(storyboard_indexes), reverse=True):
+        old_count = len(entries[sb_idx]["segments"])
+        _release_storyboard(table, entries[sb_idx])
+        entries[sb_idx] = _index_storyboard(table, storyboards[sb_idx])
+        manifest[starts[sb_idx]:starts[sb_idx] + old_count] = _manifest_rows(table.assets, entries[sb_idx])
+
+    if table.dead_count() * 2 > len(table.assets):
+        rebuild_asset_manifest(data)
+        return
+    _store_asset_manifest(data, index, manifest)
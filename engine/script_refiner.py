@@ -1,23 +1,40 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+import copy
+import re
+import time
+from dataclasses import dataclass, field
 from typing import Any
 
+from engine.novel_corpus import NovelCorpus
 from engine.script_quality import (
+    NARRATION_RATIO_ERROR_FLOOR,
+    IncrementalQualityAnalyzer,
+    QualityIssue,
     QualityReport,
-    analyze_script_quality,
     enrich_narration_with_novel,
+    merge_segment_id_maps,
     normalize_and_repair_script,
-    rebuild_asset_manifest,
 )
 
 
+STORYBOARD_LOCATION_RE = re.compile(r"^storyboards\[(\d+)\]")
+# 补旁白 + 结构修复能消除的问题：除下列不可修复项外的 error，以及旁白相关的告警
+REFINABLE_WARN_CODES = frozenset({"SB_NARRATION_RATIO_LOW", "SB_NOT_START_WITH_NARRATION", "GLOBAL_NARRATION_RATIO_LOW"})
+UNREFINABLE_ERROR_CODES = frozenset({"DUPLICATE_TEXT"})
+REFINE_SOLVERS = ("iterative", "closed_form")
+
+
 @dataclass
 class RefinementRound:
     round_index: int
     narration_ratio: float
     script_count: int
     issue_count: int
+    refined_storyboards: list[int] = field(default_factory=list)  # 本轮补强/修复的分镜下标
+    analyze_seconds: float = 0.0
+    enrich_seconds: float = 0.0
+    repair_seconds: float = 0.0
 
 
 @dataclass
@@ -34,35 +51,133 @@ def _has_narration_ratio_issue(report: QualityReport) -> bool:
     )
 
 
+def _is_refinable(issue: QualityIssue) -> bool:
+    if issue.code in REFINABLE_WARN_CODES:
+        return True
+    return issue.level == "error" and issue.code not in UNREFINABLE_ERROR_CODES
+
+
+def _failing_storyboards(report: QualityReport, storyboard_count: int) -> list[int]:
+    """按问题定位收集存在可修复问题的分镜；可修复问题都不在分镜内（全局问题）时退化为全部分镜
+
+    其余告警与重复文本等补强/修复无法消除，不会让分镜被反复重处理；没有可修复问题时返回空列表。
+    """
+    failing: set[int] = set()
+    has_global = False
+    for issue in report.issues:
+        if not _is_refinable(issue):
+            continue
+        match = STORYBOARD_LOCATION_RE.match(issue.location)
+        if match:
+            failing.add(int(match.group(1)))
+        else:
+            has_global = True
+    if failing:
+        return sorted(failing)
+    return list(range(storyboard_count)) if has_global else []
+
+
+def _segment_id_map(data: dict[str, Any]) -> dict[str, Any]:
+    return data["shared"]["pipeline_state"]["segment_id_map"]
+
+
+def _finish(
+    current: dict[str, Any],
+    id_map: dict[str, Any],
+    history: list[RefinementRound],
+    report: QualityReport,
+) -> RefinementResult:
+    # 各轮修复的 id 映射合成为“输入剧本 -> 最终剧本”的一份
+    current["shared"]["pipeline_state"]["segment_id_map"] = id_map
+    return RefinementResult(current, history, report)
+
+
 def refine_script_until_pass(
     script_data: dict[str, Any],
-    novel_text: str,
+    novel_text: str | NovelCorpus,
     min_narration_ratio: float = 0.40,
     max_rounds: int = 3,
+    ranking: str = "theme",
+    solver: str = "iterative",
 ) -> RefinementResult:
-    current = normalize_and_repair_script(script_data)
-    rebuild_asset_manifest(current)
+    """多轮“补旁白 + 结构修复”直到通过质量门禁或达到轮次上限
+
+    Args:
+        solver: `iterative` 先修复再逐轮补强（默认）；`closed_form` 直接按修复后的分句数求出各分镜缺口，
+            在原始剧本上一次补强、一次修复，通常首轮分析即通过，后续轮次仅作兜底
+    """
+    if solver not in REFINE_SOLVERS:
+        raise ValueError(f"unknown solver: {solver!r} (expected one of {REFINE_SOLVERS})")
+    predict_repair = solver == "closed_form"
+    # 求解目标取门禁实际判 error 的下限，避免补到阈值后仍因“严重不足”而多跑一轮
+    target_ratio = max(min_narration_ratio, NARRATION_RATIO_ERROR_FLOOR) if predict_repair else min_narration_ratio
+
+    # 小说只解析一次，各轮补强共享同一份候选索引
+    corpus = NovelCorpus.from_text(novel_text) if isinstance(novel_text, str) else novel_text
+
+    if predict_repair:
+        # 补强结果与调用方剧本共享未修改的分镜，修复时需要复制
+        enriched = enrich_narration_with_novel(
+            script_data,
+            corpus,
+            target_ratio=target_ratio,
+            ranking=ranking,
+            predict_repair=True,
+        )
+        current = normalize_and_repair_script(enriched)
+    else:
+        current = normalize_and_repair_script(script_data)
+    id_map = _segment_id_map(current)
 
     history: list[RefinementRound] = []
+    # 各轮之间复用分镜级检查缓存，只重算本轮被修改的分镜
+    analyzer = IncrementalQualityAnalyzer(min_narration_ratio=min_narration_ratio)
 
+    stalled: set[int] = set()
     for round_index in range(1, max_rounds + 1):
-        report = analyze_script_quality(current, min_narration_ratio=min_narration_ratio)
-        history.append(
-            RefinementRound(
-                round_index=round_index,
-                narration_ratio=report.stats.narration_ratio,
-                script_count=report.stats.script_count,
-                issue_count=len(report.issues),
-            )
+        t0 = time.perf_counter()
+        report = analyzer.analyze(current)
+        t1 = time.perf_counter()
+        record = RefinementRound(
+            round_index=round_index,
+            narration_ratio=report.stats.narration_ratio,
+            script_count=report.stats.script_count,
+            issue_count=len(report.issues),
+            analyze_seconds=t1 - t0,
         )
+        history.append(record)
 
         if report.passed and report.stats.narration_ratio >= min_narration_ratio and not _has_narration_ratio_issue(report):
-            return RefinementResult(current, history, report)
+            return _finish(current, id_map, history, report)
 
-        # 单轮策略：先补旁白，再结构修复。
-        enriched = enrich_narration_with_novel(current, novel_text, target_ratio=min_narration_ratio)
-        current = normalize_and_repair_script(enriched)
-        rebuild_asset_manifest(current)
+        # 单轮策略：先补旁白，再结构修复，只处理报告中定位到问题的分镜（其余分镜已修复且无需补强）。
+        # 补强结果与上一轮剧本共享未修改的分镜，上一轮剧本此后不再使用，可直接原地修复
+        # 上一轮处理后原样不变的分镜再处理也不会变化，不再选入
+        failing = [i for i in _failing_storyboards(report, len(current.get("storyboards", []))) if i not in stalled]
+        if not failing:
+            # 剩余问题都无法通过补强/修复消除，继续迭代不会有进展
+            return _finish(current, id_map, history, report)
+        before = [copy.deepcopy(current["storyboards"][i]) for i in failing]
+        enriched = enrich_narration_with_novel(
+            current,
+            corpus,
+            target_ratio=target_ratio,
+            ranking=ranking,
+            storyboard_indexes=failing,
+            predict_repair=predict_repair,
+        )
+        t2 = time.perf_counter()
+        current = normalize_and_repair_script(enriched, in_place=True, storyboard_indexes=failing)
+        id_map = merge_segment_id_maps(id_map, _segment_id_map(current))
+        t3 = time.perf_counter()
+        record.refined_storyboards = failing
+        record.enrich_seconds = t2 - t1
+        record.repair_seconds = t3 - t2
+        unchanged = {i for i, sb in zip(failing, before) if current["storyboards"][i] == sb}
+        if len(unchanged) == len(failing):
+            # 本轮没有改动任何分镜，后续轮次的结果也不会变化
+            return _finish(current, id_map, history, report)
+        stalled |= unchanged
 
-    final = analyze_script_quality(current, min_narration_ratio=min_narration_ratio)
-    return RefinementResult(current, history, final)
+    final = analyzer.analyze(current)
+    return _finish(current, id_map, history, final)
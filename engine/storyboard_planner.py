@@ -1,7 +1,25 @@
 from __future__ import annotations
 
+import heapq
+import json
+import mmap
 import re
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
+from itertools import islice
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Iterable, Iterator
+
+from engine.keyword_matcher import KeywordAutomaton
+
+try:
+    import numpy as np
+except ImportError:  # 可选依赖：缺失时无章节路径退化为堆选 top-k
+    np = None
+
+if TYPE_CHECKING:
+    from engine.novel_corpus import NovelCorpus
 
 
 @dataclass
@@ -10,6 +28,21 @@ class StoryboardDraft:
     title: str
     summary: str
     background_image: str
+    # 分镜取材的小说原文字符区间 [start, end)（换行规整后的全文偏移），供旁白补强就近取材
+    source_span: tuple[int, int] | None = None
+    # 词表实际命中的全部场景标签（按规则顺序，不含 story/scene 占位）与主地点标签，二者共同作为背景复用的签名
+    scene_tags: tuple[str, ...] = ()
+    scene_location: str = ""
+
+
+@dataclass
+class BackgroundAsset:
+    """去重后的背景资产：同一签名的分镜共用一张背景图"""
+
+    id: str
+    image: str
+    tags: tuple[str, ...]
+    storyboard_ids: list[str]
 
 
 CHAPTER_HEADING_RE = re.compile(r"^(?:###\s*)?(第[一二三四五六七八九十百0-9]+章)\s+(.+?)\s*$")
@@ -51,15 +84,190 @@ def _split_chapters(text: str) -> list[tuple[str, str]]:
     return normalized
 
 
-def _score_paragraph(paragraph: str) -> int:
-    score = 0
-    if any(k in paragraph for k in ["雨", "夜", "清晨", "黄昏", "黎明", "暮色"]):
-        score += 2
-    if any(k in paragraph for k in ["突然", "就在这时", "转折", "发现", "揭示", "真相"]):
-        score += 2
-    if len(paragraph) >= 120:
-        score += 1
-    return score
+DEFAULT_SCENE_TAG_RULES: list[tuple[str, list[str]]] = [
+    ("rain", ["雨", "雨夜", "雨幕"]),
+    ("night", ["夜", "深夜", "夜色"]),
+    ("morning", ["清晨", "晨雾", "黎明", "薄雾"]),
+    ("dock", ["渡口", "栈桥", "河岸", "码头"]),
+    ("boat", ["船", "渡船", "船舱", "暗河"]),
+    ("archive", ["警局", "档案室", "卷宗", "书店"]),
+    ("interior", ["木屋", "小屋", "室内", "炉火"]),
+    ("reveal", ["真相", "证据", "账本", "调查", "公开"]),
+]
+# 表示地点的场景标签：背景复用时不同地点的分镜不能共用一张图
+DEFAULT_LOCATION_TAGS = ["dock", "boat", "archive", "interior"]
+# 段落打分：命中任一关键词即加对应分值（每条规则只计一次）
+DEFAULT_SCORE_RULES: list[tuple[int, list[str]]] = [
+    (2, ["雨", "夜", "清晨", "黄昏", "黎明", "暮色"]),
+    (2, ["突然", "就在这时", "转折", "发现", "揭示", "真相"]),
+]
+LONG_PARAGRAPH_LENGTH = 120
+LONG_PARAGRAPH_SCORE = 1
+# 段落序号（从 0 起）的权重：默认不看位置，取负值则偏向靠前的段落
+POSITION_SCORE = 0.0
+
+
+class PlannerVocabulary:
+    """分镜规划关键词表：场景标签规则与段落打分规则编译为同一个关键词自动机
+
+    每段文本只扫描一次即可得到全部命中，词表扩充不会增加扫描次数。可从 JSON 加载：
+
+        {
+          "scene_tags": [{"tag": "rain", "keywords": ["雨", "雨夜"]}, ...],
+          "score_rules": [{"score": 2, "keywords": ["突然", "真相"]}, ...],
+          "long_paragraph": {"min_length": 120, "score": 1},
+          "position": {"score": 0.0},
+          "location_tags": ["dock", "archive", ...]
+        }
+
+    段落得分 = 各命中打分规则的分值 + 长段落分 + 段落序号 × 位置权重，即特征
+    （规则命中..., 是否长段落, 序号）与权重向量的内积。
+    """
+
+    def __init__(
+        self,
+        scene_tags: Iterable[tuple[str, Iterable[str]]] = DEFAULT_SCENE_TAG_RULES,
+        score_rules: Iterable[tuple[int, Iterable[str]]] = DEFAULT_SCORE_RULES,
+        long_paragraph_length: int = LONG_PARAGRAPH_LENGTH,
+        long_paragraph_score: float = LONG_PARAGRAPH_SCORE,
+        position_score: float = POSITION_SCORE,
+        location_tags: Iterable[str] = DEFAULT_LOCATION_TAGS,
+    ):
+        self.scene_tags = [(tag, list(keywords)) for tag, keywords in scene_tags]
+        self.location_tags = list(location_tags)
+        self.score_rules = [(score, list(keywords)) for score, keywords in score_rules]
+        self.long_paragraph_length = long_paragraph_length
+        self.long_paragraph_score = long_paragraph_score
+        self.position_score = position_score
+
+        # 关键词去重后编入自动机，每个关键词记录所属的标签规则与打分规则
+        keyword_ids: dict[str, int] = {}
+        self._tag_rules: list[list[int]] = []
+        self._score_rules: list[list[int]] = []
+
+        def register(keyword: str) -> int:
+            kw_id = keyword_ids.get(keyword)
+            if kw_id is None:
+                kw_id = keyword_ids[keyword] = len(keyword_ids)
+                self._tag_rules.append([])
+                self._score_rules.append([])
+            return kw_id
+
+        for rule_idx, (_, keywords) in enumerate(self.scene_tags):
+            for keyword in keywords:
+                self._tag_rules[register(keyword)].append(rule_idx)
+        for rule_idx, (_, keywords) in enumerate(self.score_rules):
+            for keyword in keywords:
+                self._score_rules[register(keyword)].append(rule_idx)
+        self._automaton = KeywordAutomaton(keyword_ids)
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> PlannerVocabulary:
+        long_paragraph = data.get("long_paragraph") or {}
+        position = data.get("position") or {}
+        return cls(
+            scene_tags=[(item["tag"], item["keywords"]) for item in data.get("scene_tags", [])],
+            score_rules=[(item["score"], item["keywords"]) for item in data.get("score_rules", [])],
+            long_paragraph_length=int(long_paragraph.get("min_length", LONG_PARAGRAPH_LENGTH)),
+            long_paragraph_score=long_paragraph.get("score", LONG_PARAGRAPH_SCORE),
+            position_score=position.get("score", POSITION_SCORE),
+            location_tags=data.get("location_tags", DEFAULT_LOCATION_TAGS),
+        )
+
+    @classmethod
+    def load(cls, path: str | Path) -> PlannerVocabulary:
+        return cls.from_dict(json.loads(Path(path).read_text(encoding="utf-8")))
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "scene_tags": [{"tag": tag, "keywords": keywords} for tag, keywords in self.scene_tags],
+            "score_rules": [{"score": score, "keywords": keywords} for score, keywords in self.score_rules],
+            "long_paragraph": {"min_length": self.long_paragraph_length, "score": self.long_paragraph_score},
+            "position": {"score": self.position_score},
+            "location_tags": self.location_tags,
+        }
+
+    def tag_rule_hits(self, text: str) -> set[int]:
+        """命中的场景标签规则下标"""
+        return {rule_idx for kw_id in self._automaton.find_all(text) for rule_idx in self._tag_rules[kw_id]}
+
+    def matched_tags(self, text: str) -> list[str]:
+        """命中的场景标签（按规则顺序）"""
+        return [self.scene_tags[rule_idx][0] for rule_idx in sorted(self.tag_rule_hits(text))]
+
+    def location(self, tags: Iterable[str], heading: str = "") -> str:
+        """主地点标签：标题命中的地点优先，否则取 `tags` 中第一个地点；都没有时返回空串"""
+        locations = set(self.location_tags)
+        for tag in (*self.matched_tags(heading), *tags):
+            if tag in locations:
+                return tag
+        return ""
+
+    def score_rule_hits(self, paragraph: str) -> set[int]:
+        """命中的打分规则下标"""
+        return {rule_idx for kw_id in self._automaton.find_all(paragraph) for rule_idx in self._score_rules[kw_id]}
+
+    def score(self, paragraph: str, position: int = 0) -> float:
+        score = sum(self.score_rules[rule_idx][0] for rule_idx in self.score_rule_hits(paragraph))
+        if len(paragraph) >= self.long_paragraph_length:
+            score += self.long_paragraph_score
+        if self.position_score:
+            score += self.position_score * position
+        return score
+
+    def weights(self) -> list[float]:
+        """与 `_paragraph_features` 各列对应的权重向量"""
+        return [score for score, _ in self.score_rules] + [self.long_paragraph_score, self.position_score]
+
+
+DEFAULT_VOCABULARY = PlannerVocabulary()
+
+
+def _score_paragraph(paragraph: str, vocabulary: PlannerVocabulary | None = None, position: int = 0) -> float:
+    return (vocabulary or DEFAULT_VOCABULARY).score(paragraph, position)
+
+
+def _paragraph_features(paragraphs: list[str], vocabulary: PlannerVocabulary) -> tuple[Any, Any]:
+    """段落特征矩阵（每条打分规则是否命中、是否长段落、序号）与段落长度向量"""
+    rule_count = len(vocabulary.score_rules)
+    lengths = np.fromiter((len(p) for p in paragraphs), dtype=np.int64, count=len(paragraphs))
+    features = np.zeros((len(paragraphs), rule_count + 2), dtype=np.float64)
+    for row, paragraph in enumerate(paragraphs):
+        hits = vocabulary.score_rule_hits(paragraph)
+        if hits:
+            features[row, list(hits)] = 1.0
+    features[:, rule_count] = lengths >= vocabulary.long_paragraph_length
+    features[:, rule_count + 1] = np.arange(len(paragraphs), dtype=np.float64)
+    return features, lengths
+
+
+def _top_paragraphs(paragraphs: list[str], k: int, vocabulary: PlannerVocabulary | None = None) -> list[int]:
+    """得分最高的 k 个段落下标（升序）；排序口径为 (得分, 长度) 降序，完全相同时靠前者优先
+
+    有 numpy 时对特征矩阵加权求分并用 `argpartition` 选出第 k 名，只对并列项排序；否则用堆选。
+    """
+    vocabulary = vocabulary or DEFAULT_VOCABULARY
+    n = len(paragraphs)
+    if k <= 0:
+        return []
+    if k >= n:
+        return list(range(n))
+    if np is None:
+        ranked = heapq.nlargest(
+            k,
+            range(n),
+            key=lambda idx: (vocabulary.score(paragraphs[idx], idx), len(paragraphs[idx]), -idx),
+        )
+        return sorted(ranked)
+
+    features, lengths = _paragraph_features(paragraphs, vocabulary)
+    scores = features @ np.asarray(vocabulary.weights(), dtype=np.float64)
+    kth = scores[np.argpartition(scores, n - k)[n - k]]
+    above = np.flatnonzero(scores > kth)
+    tied = np.flatnonzero(scores == kth)
+    # 第 k 名处的同分段落按长度降序、序号升序补足
+    tied = tied[np.lexsort((tied, -lengths[tied]))][: k - len(above)]
+    return sorted(np.concatenate([above, tied]).tolist())
 
 
 def _pick_title(paragraph: str, fallback: str) -> str:
@@ -69,21 +277,8 @@ def _pick_title(paragraph: str, fallback: str) -> str:
     return fallback
 
 
-def _infer_scene_tags(text: str) -> list[str]:
-    tags: list[str] = []
-    tag_rules = [
-        ("rain", ["雨", "雨夜", "雨幕"]),
-        ("night", ["夜", "深夜", "夜色"]),
-        ("morning", ["清晨", "晨雾", "黎明", "薄雾"]),
-        ("dock", ["渡口", "栈桥", "河岸", "码头"]),
-        ("boat", ["船", "渡船", "船舱", "暗河"]),
-        ("archive", ["警局", "档案室", "卷宗", "书店"]),
-        ("interior", ["木屋", "小屋", "室内", "炉火"]),
-        ("reveal", ["真相", "证据", "账本", "调查", "公开"]),
-    ]
-    for tag, keywords in tag_rules:
-        if any(keyword in text for keyword in keywords):
-            tags.append(tag)
+def _infer_scene_tags(text: str, vocabulary: PlannerVocabulary | None = None) -> list[str]:
+    tags = (vocabulary or DEFAULT_VOCABULARY).matched_tags(text)
 
     if not tags:
         tags.append("story")
@@ -92,9 +287,20 @@ def _infer_scene_tags(text: str) -> list[str]:
     return tags[:3]
 
 
-def _background_for_text(text: str, index: int) -> str:
-    slug = "_".join(_infer_scene_tags(text))
-    return f"assets/scene_{index}_{slug}.png"
+def _scene_background(
+    text: str,
+    index: int,
+    vocabulary: PlannerVocabulary | None = None,
+    heading: str = "",
+) -> tuple[str, tuple[str, ...], str]:
+    """背景路径、命中的全部场景标签与主地点标签（正文只扫描一次）"""
+    vocabulary = vocabulary or DEFAULT_VOCABULARY
+    matched = vocabulary.matched_tags(text)
+    tags = matched[:] or ["story"]
+    if len(tags) == 1:
+        tags.append("scene")
+    location = vocabulary.location(matched, heading)
+    return f"assets/scene_{index}_{'_'.join(tags[:3])}.png", tuple(matched), location
 
 
 def _chapter_summary(body: str) -> str:
@@ -109,46 +315,382 @@ def _chapter_summary(body: str) -> str:
     return summary[:100]
 
 
-def build_storyboard_drafts(novel_text: str, target_count: int = 6) -> list[StoryboardDraft]:
-    chapters = _split_chapters(novel_text)
+def _chapter_draft(
+    index: int,
+    title: str,
+    body: str,
+    span: tuple[int, int],
+    vocabulary: PlannerVocabulary | None = None,
+) -> StoryboardDraft:
+    background_image, scene_tags, location = _scene_background(title + "\n" + body, index, vocabulary, title)
+    return StoryboardDraft(
+        id=f"sb{index}",
+        title=title,
+        summary=_chapter_summary(body),
+        background_image=background_image,
+        source_span=span,
+        scene_tags=scene_tags,
+        scene_location=location,
+    )
+
+
+def _paragraph_draft(
+    index: int,
+    paragraph: str,
+    span: tuple[int, int],
+    vocabulary: PlannerVocabulary | None = None,
+) -> StoryboardDraft:
+    summary = re.sub(r"\s+", "", paragraph)
+    if len(summary) > 100:
+        summary = summary[:100]
+    background_image, scene_tags, location = _scene_background(paragraph, index, vocabulary)
+    return StoryboardDraft(
+        id=f"sb{index}",
+        title=_pick_title(paragraph, f"分镜{index}"),
+        summary=summary,
+        background_image=background_image,
+        source_span=span,
+        scene_tags=scene_tags,
+        scene_location=location,
+    )
+
+
+# ---- 章节不足时按场景切分长章节 ----
+
+# 每个切点只在“按字数均分的理想位置”前后若干段内搜索，保证线性复杂度
+SCENE_CUT_WINDOW = 4
+# 段落长度偏离均分的惩罚权重（相对标签突变的代价）
+SCENE_BALANCE_WEIGHT = 1.0
+
+
+def _paragraph_spans(text: str) -> list[tuple[int, int]]:
+    """与 `_split_paragraphs` 一致的段落区间（相对 `text`，`text` 已规整换行）"""
+    spans: list[tuple[int, int]] = []
+    pos = 0
+    for piece in text.split("\n\n"):
+        stripped = piece.strip()
+        if stripped:
+            start = pos + len(piece) - len(piece.lstrip())
+            spans.append((start, start + len(stripped)))
+        pos += len(piece) + 2
+    return spans
+
+
+def _allocate_segments(lengths: list[int], capacities: list[int], total: int) -> list[int]:
+    """把 `total` 个分镜分给各章节：每章至少 1 个，余下的逐个分给“每段平均字数”最大的章节（不超过段落数）"""
+    counts = [1] * len(lengths)
+    heap = [(-length, idx) for idx, length in enumerate(lengths) if capacities[idx] > 1]
+    heapq.heapify(heap)
+    for _ in range(total - len(lengths)):
+        if not heap:
+            break
+        _, idx = heapq.heappop(heap)
+        counts[idx] += 1
+        if counts[idx] < capacities[idx]:
+            heapq.heappush(heap, (-lengths[idx] / counts[idx], idx))
+    return counts
+
+
+def _segment_cuts(tag_hits: list[set[int]], lengths: list[int], parts: int, tag_count: int) -> list[int]:
+    """把 n 个段落切成 `parts` 段，返回边界下标 [0, c1, ..., n]
+
+    段内代价为标签向量的离差平方和（由前缀和 O(标签数) 求得）加上字数偏离均分的惩罚，
+    切点 j 只在按字数均分的理想位置 ±`SCENE_CUT_WINDOW` 段内取值，动态规划总耗时 O(段落数)。
+    """
+    n = len(lengths)
+    prefix_len = [0]
+    prefix_sq = [0]
+    prefix_tags = [[0] * tag_count]
+    for hits, length in zip(tag_hits, lengths):
+        prefix_len.append(prefix_len[-1] + length)
+        prefix_sq.append(prefix_sq[-1] + len(hits))
+        row = prefix_tags[-1][:]
+        for t in hits:
+            row[t] += 1
+        prefix_tags.append(row)
+
+    ideal_len = prefix_len[n] / parts
+
+    def cost(a: int, b: int) -> float:
+        size = b - a
+        spread = sum((hi - lo) ** 2 for hi, lo in zip(prefix_tags[b], prefix_tags[a])) / size
+        balance = (prefix_len[b] - prefix_len[a]) / ideal_len - 1.0 if ideal_len else 0.0
+        return (prefix_sq[b] - prefix_sq[a]) - spread + SCENE_BALANCE_WEIGHT * balance * balance
+
+    # 理想切点：前缀字数最接近 j/parts 处，并修正为严格递增、且给后续段落留足位置
+    ideal = [0] * (parts + 1)
+    ideal[parts] = n
+    for j in range(1, parts):
+        target = prefix_len[n] * j / parts
+        c = bisect_left(prefix_len, target)
+        if c > 0 and target - prefix_len[c - 1] <= prefix_len[c] - target:
+            c -= 1
+        ideal[j] = max(c, ideal[j - 1] + 1)
+    for j in range(parts - 1, 0, -1):
+        ideal[j] = min(ideal[j], ideal[j + 1] - 1)
+
+    candidates = [[0]]
+    for j in range(1, parts):
+        lo = max(j, ideal[j] - SCENE_CUT_WINDOW)
+        hi = min(n - (parts - j), ideal[j] + SCENE_CUT_WINDOW)
+        candidates.append(list(range(lo, hi + 1)))
+    candidates.append([n])
+
+    best: dict[int, float] = {0: 0.0}
+    back: list[dict[int, int]] = [{}]
+    for j in range(1, parts + 1):
+        layer: dict[int, float] = {}
+        choice: dict[int, int] = {}
+        for c in candidates[j]:
+            for prev, prev_cost in best.items():
+                if prev < c:
+                    total = prev_cost + cost(prev, c)
+                    if c not in layer or total < layer[c]:
+                        layer[c], choice[c] = total, prev
+        best = layer
+        back.append(choice)
+
+    cuts = [n]
+    for j in range(parts, 0, -1):
+        cuts.append(back[j][cuts[-1]])
+    return cuts[::-1]
+
+
+def _plan_sections(
+    chapters: list[tuple[str, str, tuple[int, int]]],
+    target_count: int,
+    vocabulary: PlannerVocabulary | None = None,
+) -> list[tuple[str, str, tuple[int, int]]]:
+    """章节数不少于目标时取前 `target_count` 章；不足时把长章节按场景切分，凑足目标数量"""
+    if len(chapters) >= target_count:
+        return chapters[:target_count]
+
+    vocabulary = vocabulary or DEFAULT_VOCABULARY
+    spans = [_paragraph_spans(body) for _, body, _ in chapters]
+    counts = _allocate_segments([len(body) for _, body, _ in chapters], [len(sp) for sp in spans], target_count)
+
+    sections: list[tuple[str, str, tuple[int, int]]] = []
+    for (title, body, span), para_spans, parts in zip(chapters, spans, counts):
+        if parts <= 1:
+            sections.append((title, body, span))
+            continue
+        start = span[0]
+        tag_hits = [vocabulary.tag_rule_hits(body[a:b]) for a, b in para_spans]
+        lengths = [b - a for a, b in para_spans]
+        cuts = _segment_cuts(tag_hits, lengths, parts, len(vocabulary.scene_tags))
+        for k, (lo, hi) in enumerate(zip(cuts, cuts[1:]), start=1):
+            a, b = para_spans[lo][0], para_spans[hi - 1][1]
+            sections.append((f"{title}（{k}）", body[a:b], (start + a, start + b)))
+    return sections
+
+
+def build_storyboard_drafts(
+    novel_text: str | NovelCorpus,
+    target_count: int = 6,
+    vocabulary: PlannerVocabulary | None = None,
+) -> list[StoryboardDraft]:
+    if isinstance(novel_text, str):
+        from engine.novel_corpus import NovelCorpus  # 避免循环导入
+
+        corpus = NovelCorpus.from_text(novel_text)
+    else:
+        # 传入 NovelCorpus 时复用其已建好的章节/段落索引，避免重复切分全文
+        corpus = novel_text
+
+    chapters = corpus.chapters()
     if chapters:
-        drafts: list[StoryboardDraft] = []
-        for i, (title, body) in enumerate(chapters[: max(1, target_count)], start=1):
-            drafts.append(
-                StoryboardDraft(
-                    id=f"sb{i}",
-                    title=title,
-                    summary=_chapter_summary(body),
-                    background_image=_background_for_text(title + "\n" + body, i),
-                )
-            )
-        return drafts
-
-    paragraphs = _split_paragraphs(novel_text)
+        spans = corpus.chapter_spans()
+        sections = _plan_sections(
+            [(title, body, span) for (title, body), span in zip(chapters, spans)],
+            max(1, target_count),
+            vocabulary,
+        )
+        return [
+            _chapter_draft(i, title, body, span, vocabulary)
+            for i, (title, body, span) in enumerate(sections, start=1)
+        ]
+
+    paragraphs = corpus.paragraphs()
+    paragraph_spans = corpus.paragraph_spans()
     if not paragraphs:
         return []
 
-    scored = [(idx, _score_paragraph(p), p) for idx, p in enumerate(paragraphs)]
-    scored.sort(key=lambda x: (x[1], len(x[2])), reverse=True)
-
-    selected = sorted(scored[: max(1, min(target_count, len(scored)))], key=lambda x: x[0])
-    drafts: list[StoryboardDraft] = []
-
-    for i, (_, _, paragraph) in enumerate(selected, start=1):
-        fallback = f"分镜{i}"
-        title = _pick_title(paragraph, fallback)
-        bg = _background_for_text(paragraph, i)
-        summary = re.sub(r"\s+", "", paragraph)
-        if len(summary) > 100:
-            summary = summary[:100]
-
-        drafts.append(
-            StoryboardDraft(
-                id=f"sb{i}",
-                title=title,
-                summary=summary,
-                background_image=bg,
-            )
-        )
+    selected = _top_paragraphs(paragraphs, max(1, target_count), vocabulary)
+    return [
+        _paragraph_draft(i, paragraphs[idx], paragraph_spans[idx], vocabulary)
+        for i, idx in enumerate(selected, start=1)
+    ]
+
 
-    return drafts
+# ---- 流式规划：逐行扫描小说文件，不整体载入全文 ----
+
+
+def _iter_lines(novel_path: str | Path) -> Iterator[tuple[int, str]]:
+    """mmap 逐行读取小说文件，产出 (行首在换行规整后全文中的字符偏移, 行内容)
+
+    行内容不含换行符；`\r\n` 视为换行（与 `text.replace("\r\n", "\n")` 口径一致）。
+    """
+    with open(novel_path, "rb") as fh:
+        try:
+            mapped = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # 空文件无法映射
+            yield 0, ""
+            return
+    with mapped:
+        offset = 0
+        pos = 0
+        size = len(mapped)
+        while True:
+            nl = mapped.find(b"\n", pos)
+            end = size if nl == -1 else nl
+            raw = mapped[pos:end]
+            if nl != -1 and raw.endswith(b"\r"):
+                raw = raw[:-1]
+            line = raw.decode("utf-8")
+            yield offset, line
+            if nl == -1:
+                return
+            offset += len(line) + 1
+            pos = nl + 1
+
+
+def _stripped_body(lines: list[str], start: int) -> tuple[str, tuple[int, int]] | None:
+    joined = "\n".join(lines)
+    body = joined.strip()
+    if not body:
+        return None
+    lead = len(joined) - len(joined.lstrip())
+    return body, (start + lead, start + lead + len(body))
+
+
+def iter_chapters(novel_path: str | Path) -> Iterator[tuple[str, str, tuple[int, int]]]:
+    """流式逐章产出 (标题, 正文, 正文字符区间)，与 `NovelCorpus.chapters()` / `chapter_spans()` 一致
+
+    同一时刻只在内存中保留当前章节的行。
+    """
+    title = ""
+    body_lines: list[str] = []
+    body_start = 0
+    for offset, line in _iter_lines(novel_path):
+        match = CHAPTER_HEADING_RE.match(line.strip())
+        if match:
+            if title:
+                chapter = _stripped_body(body_lines, body_start)
+                if chapter:
+                    yield title, chapter[0], chapter[1]
+            title = f"{match.group(1)} {match.group(2).strip()}"
+            body_lines = []
+            body_start = offset + len(line) + 1
+        elif title:
+            body_lines.append(line)
+
+    if title:
+        chapter = _stripped_body(body_lines, body_start)
+        if chapter:
+            yield title, chapter[0], chapter[1]
+
+
+def iter_paragraphs(novel_path: str | Path) -> Iterator[tuple[str, tuple[int, int]]]:
+    """流式逐段产出 (段落, 字符区间)，与 `NovelCorpus.paragraphs()` / `paragraph_spans()` 一致
+
+    按 `\n\n` 切分等价于以“空行”分组：连续空行之间的行拼接后去首尾空白，非空即为一段。
+    """
+    para_lines: list[str] = []
+    para_start = 0
+    for offset, line in _iter_lines(novel_path):
+        if line:
+            if not para_lines:
+                para_start = offset
+            para_lines.append(line)
+            continue
+        if para_lines:
+            paragraph = _stripped_body(para_lines, para_start)
+            if paragraph:
+                yield paragraph
+            para_lines = []
+
+    if para_lines:
+        paragraph = _stripped_body(para_lines, para_start)
+        if paragraph:
+            yield paragraph
+
+
+def _draft_job(job: tuple[Callable[..., StoryboardDraft], tuple[Any, ...]]) -> StoryboardDraft:
+    fn, args = job
+    return fn(*args)
+
+
+def _run_drafts(
+    jobs: Iterable[tuple[Callable[..., StoryboardDraft], tuple[Any, ...]]],
+    workers: int,
+) -> list[StoryboardDraft]:
+    if workers > 1:
+        # 摘要与场景标签在进程池中并行计算，结果按提交顺序返回
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(_draft_job, jobs))
+    return [_draft_job(job) for job in jobs]
+
+
+def build_storyboard_drafts_from_file(
+    novel_path: str | Path,
+    target_count: int = 6,
+    workers: int = 0,
+    vocabulary: PlannerVocabulary | None = None,
+) -> list[StoryboardDraft]:
+    """流式版 `build_storyboard_drafts`：结果与对同一文件内容调用 `build_storyboard_drafts` 完全一致
+
+    有章节时只扫描到第 `target_count` 个章节为止（章节不足时已读完全文，再按场景切分长章节）；
+    无章节时再流式扫描一遍段落，仅保留得分最高的 `target_count` 段。
+    `workers > 1` 时用进程池并行生成各分镜的摘要与场景标签。
+    """
+    limit = max(1, target_count)
+    chapters = list(islice(iter_chapters(novel_path), limit))
+    if chapters:
+        jobs = [
+            (_chapter_draft, (i, title, body, span, vocabulary))
+            for i, (title, body, span) in enumerate(_plan_sections(chapters, limit, vocabulary), start=1)
+        ]
+        return _run_drafts(jobs, workers)
+
+    def rank_key(item: tuple[int, str, tuple[int, int]]) -> tuple[int, int, int]:
+        # 与“按 (得分, 长度) 降序稳定排序”一致：同分同长时靠前的段落优先
+        idx, paragraph, _ = item
+        return _score_paragraph(paragraph, vocabulary, idx), len(paragraph), -idx
+
+    indexed = ((idx, paragraph, span) for idx, (paragraph, span) in enumerate(iter_paragraphs(novel_path)))
+    selected = sorted(heapq.nlargest(limit, indexed, key=rank_key))
+    jobs = [
+        (_paragraph_draft, (i, paragraph, span, vocabulary))
+        for i, (_, paragraph, span) in enumerate(selected, start=1)
+    ]
+    return _run_drafts(jobs, workers)
+
+
+# ---- 背景资产复用：同签名分镜共用一张背景图 ----
+
+
+def plan_background_assets(drafts: list[StoryboardDraft]) -> list[BackgroundAsset]:
+    """按“主地点 + 全部场景标签”签名聚类分镜，改写 `background_image` 为共享路径，并返回去重后的背景待生成清单
+
+    签名相同的分镜共用 `assets/scene_<地点>_<其余标签>.png`。识别不出地点的分镜无法判断是否
+    同一场景，保留各自的背景。清单按首次出现的分镜排序，每项只需生成一次。
+    """
+    assets: list[BackgroundAsset] = []
+    by_signature: dict[tuple[str, tuple[str, ...]], BackgroundAsset] = {}
+    for draft in drafts:
+        location = draft.scene_location
+        signature = (location, draft.scene_tags)
+        asset = by_signature.get(signature) if location else None
+        if asset is None:
+            if location:
+                tags = [location] + [tag for tag in draft.scene_tags if tag != location]
+                image = f"assets/scene_{'_'.join(tags)}.png"
+            else:
+                image = draft.background_image
+            asset = BackgroundAsset(id=Path(image).stem, image=image, tags=draft.scene_tags, storyboard_ids=[])
+            assets.append(asset)
+            if location:
+                by_signature[signature] = asset
+        asset.storyboard_ids.append(draft.id)
+        draft.background_image = asset.image
+    return assets
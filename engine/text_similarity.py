@@ -0,0 +1,251 @@
+"""文本相似度内核与索引
+
+- `TextFingerprint`：预计算的清洗文本 + Rabin-Karp 窗口哈希，相似度退化为集合成员判断。
+- `ShingleIndex`：为 `_calculate_similarity` 提供候选召回，避免全量两两比较（O(n²)）。
+- `SimilarityIndex`：在 `ShingleIndex` 之上提供 `add` / `has_similar` 的增量近重复判定。
+"""
+
+from __future__ import annotations
+
+import math
+import re
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from functools import cached_property
+
+SIMILARITY_STRIP_RE = re.compile(r'[\s，。！？：；、""''（）]')
+
+# 与 `_calculate_similarity` 的滑动窗口上限保持一致
+SIMILARITY_WINDOW = 20
+
+# shingle 长度：不超过窗口上限，清洗后短于该长度的文本走短文本兜底路径
+SHINGLE_SIZE = 6
+
+
+# Rabin-Karp 参数：梅森素数取模，碰撞概率可忽略
+_RK_MOD = (1 << 61) - 1
+_RK_BASE = 1_000_003
+_RK_LEAD = pow(_RK_BASE, SIMILARITY_WINDOW - 1, _RK_MOD)
+
+
+def clean_similarity_text(text: str) -> str:
+    """移除空格和标点，得到相似度比较用的文本"""
+    return SIMILARITY_STRIP_RE.sub("", text or "")
+
+
+def _rolling_window_hashes(clean: str) -> tuple[int, ...]:
+    size = SIMILARITY_WINDOW
+    if len(clean) < size:
+        return ()
+
+    codes = [ord(ch) for ch in clean]
+    h = 0
+    for code in codes[:size]:
+        h = (h * _RK_BASE + code) % _RK_MOD
+    hashes = [h]
+    for out_code, in_code in zip(codes, codes[size:]):
+        h = ((h - out_code * _RK_LEAD) * _RK_BASE + in_code) % _RK_MOD
+        hashes.append(h)
+    return tuple(hashes)
+
+
+@dataclass(frozen=True)
+class TextFingerprint:
+    """单段文本的相似度指纹
+
+    窗口哈希在首次参与精确比较时才计算并缓存（只被索引召回、从未比较的文本无需计算）。
+
+    Attributes:
+        clean: 清洗后的文本
+        window_hashes: 每个起点的 `SIMILARITY_WINDOW` 长度窗口哈希（文本不足窗口长度时为空）
+        window_set: 窗口哈希集合，用于 O(1) 成员判断
+    """
+
+    clean: str
+
+    @cached_property
+    def window_hashes(self) -> tuple[int, ...]:
+        return _rolling_window_hashes(self.clean)
+
+    @cached_property
+    def window_set(self) -> frozenset[int]:
+        return frozenset(self.window_hashes)
+
+
+def fingerprint_text(text: str) -> TextFingerprint:
+    """计算文本指纹；同一文本只需计算一次，可在多次比较间复用"""
+    return TextFingerprint(clean_similarity_text(text))
+
+
+def _count_occurrences(haystack: str, needle: str) -> int:
+    # 允许重叠匹配，与逐窗口比较口径一致
+    count = 0
+    start = haystack.find(needle)
+    while start != -1:
+        count += 1
+        start = haystack.find(needle, start + 1)
+    return count
+
+
+def fingerprint_similarity(fp1: TextFingerprint, fp2: TextFingerprint) -> float:
+    """基于指纹计算相似度，结果与 `_calculate_similarity` 的滑动窗口口径一致"""
+    len1, len2 = len(fp1.clean), len(fp2.clean)
+    if len1 == 0 or len2 == 0:
+        return 0.0
+
+    window_size = min(len1, len2, SIMILARITY_WINDOW)
+    if window_size == SIMILARITY_WINDOW:
+        window_set = fp2.window_set
+        matched = sum(1 for h in fp1.window_hashes if h in window_set)
+    elif len1 <= len2:
+        # 窗口即 clean1 全文，只有一个起点
+        matched = 1 if fp1.clean in fp2.clean else 0
+    else:
+        # 窗口长度等于 clean2，逐起点比较等价于统计 clean2 在 clean1 中的出现次数
+        matched = _count_occurrences(fp1.clean, fp2.clean)
+
+    overlap = matched * window_size
+    avg_len = (len1 + len2) / 2
+    return min(overlap / avg_len, 1.0)
+
+
+class ShingleIndex:
+    """基于 k-shingle 倒排表的相似候选索引
+
+    只做召回，不计算相似度；返回的候选是精确比较的超集，因此与全量比较结果一致：
+
+    - 两段文本清洗后长度都 >= k 时，窗口大小 w >= k，任一重叠窗口必然共享 k-shingle；
+      再按 q-gram 计数下界剔除共享 shingle 数不足以达到阈值的候选。
+    - 任一方短于 k 时，按长度桶/子串字典兜底，保证不漏召回。
+    """
+
+    def __init__(self, k: int = SHINGLE_SIZE):
+        self.k = k
+        self._lengths: list[int] = []
+        self._postings: dict[str, int | list[int]] = {}
+        self._short_by_text: dict[str, list[int]] = defaultdict(list)
+        self._short_by_len: dict[int, list[int]] = defaultdict(list)
+        self._short_texts: dict[int, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def add(self, clean: str) -> int:
+        """加入一段已清洗文本，返回其编号（按加入顺序递增）"""
+        item_id = len(self._lengths)
+        self._lengths.append(len(clean))
+        if len(clean) < self.k:
+            self._short_by_text[clean].append(item_id)
+            self._short_by_len[len(clean)].append(item_id)
+            self._short_texts[item_id] = clean
+            return item_id
+
+        # 绝大多数 shingle 只出现在一段文本中：单个编号直接存 int，出现第二次时再升级为列表
+        postings = self._postings
+        k = self.k
+        for shingle in {clean[i:i + k] for i in range(len(clean) - k + 1)}:
+            ids = postings.get(shingle)
+            if ids is None:
+                postings[shingle] = item_id
+            elif type(ids) is int:
+                postings[shingle] = [ids, item_id]
+            else:
+                ids.append(item_id)
+        return item_id
+
+    def candidates(self, clean: str, threshold: float) -> list[int]:
+        """返回可能与 `clean` 相似度 >= threshold 的已索引编号（升序）"""
+        if not clean or not self._lengths:
+            return []
+        if threshold <= 0:
+            return list(range(len(self._lengths)))
+
+        k = self.k
+        len1 = len(clean)
+        found: set[int] = set()
+
+        if len1 < k:
+            # 短查询：窗口即查询全文，对方若更长则相似度 <= 2*len1/(len1+len2)，可按长度截断
+            max_len = int(len1 * (2.0 - threshold) / threshold + 1e-9)
+            for item_id, len2 in enumerate(self._lengths):
+                if len2 > max_len and len2 >= len1:
+                    continue
+                found.add(item_id)
+            return sorted(found)
+
+        # 已索引的短文本：只有作为查询的子串出现时才会有重叠
+        if self._short_by_text:
+            for size in self._short_by_len:
+                if size == 0:
+                    continue
+                for i in range(len1 - size + 1):
+                    ids = self._short_by_text.get(clean[i:i + size])
+                    if ids:
+                        found.update(ids)
+
+        # 单编号直接收集，多编号列表交给 Counter.update 在 C 层计数
+        singles: list[int] = []
+        shared: list[list[int]] = []
+        postings = self._postings
+        for i in range(len1 - k + 1):
+            ids = postings.get(clean[i:i + k])
+            if ids is None:
+                continue
+            if type(ids) is int:
+                singles.append(ids)
+            else:
+                shared.append(ids)
+        hits = Counter(singles)
+        for ids in shared:
+            hits.update(ids)
+
+        # 与对方长度无关的下界：w <= 20 且 len2 >= w 时，所需窗口数 >= θ·len1/40 + θ/2
+        floor = max(1, math.ceil(threshold * (len1 / (2 * SIMILARITY_WINDOW) + 0.5) - 1e-9))
+        lengths = self._lengths
+        need_by_len: dict[int, int] = {}
+        for item_id, count in hits.items():
+            if count < floor:
+                continue
+            len2 = lengths[item_id]
+            need = need_by_len.get(len2)
+            if need is None:
+                w = min(len1, len2, SIMILARITY_WINDOW)
+                # 需要至少 m 个重叠窗口，m 个窗口至少覆盖 m + w - k 个 shingle 起点
+                need_windows = math.ceil(threshold * (len1 + len2) / 2 / w - 1e-9)
+                need = need_by_len[len2] = max(1, need_windows) + w - k
+            if count >= need:
+                found.add(item_id)
+        return sorted(found)
+
+
+class SimilarityIndex:
+    """可增量更新的近重复索引：`ShingleIndex` 召回 + 指纹精确比较
+
+    判定口径与逐一调用 `fingerprint_similarity(query, existing)` 完全一致，
+    只是跳过了召回不到、不可能达到阈值的已有文本。
+    """
+
+    def __init__(self, k: int = SHINGLE_SIZE):
+        self._index = ShingleIndex(k)
+        self._fingerprints: list[TextFingerprint] = []
+
+    def __len__(self) -> int:
+        return len(self._fingerprints)
+
+    def add(self, text: str | TextFingerprint) -> int:
+        """加入一段文本（或已计算的指纹），返回其编号（按加入顺序递增）"""
+        fp = text if isinstance(text, TextFingerprint) else fingerprint_text(text)
+        self._fingerprints.append(fp)
+        return self._index.add(fp.clean)
+
+    def find_similar(self, text: str | TextFingerprint, threshold: float) -> tuple[int, float] | None:
+        """返回最早加入的、相似度 >= threshold 的文本编号及相似度；没有则返回 None"""
+        fp = text if isinstance(text, TextFingerprint) else fingerprint_text(text)
+        for item_id in self._index.candidates(fp.clean, threshold):
+            similarity = fingerprint_similarity(fp, self._fingerprints[item_id])
+            if similarity >= threshold:
+                return item_id, similarity
+        return None
+
+    def has_similar(self, text: str | TextFingerprint, threshold: float) -> bool:
+        return self.find_similar(text, threshold) is not None
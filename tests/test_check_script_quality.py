@@ -0,0 +1,81 @@
+import contextlib
+import io
+import json
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from tools import check_script_quality
+
+
+GOOD_SCRIPT = {
+    "storyboards": [
+        {
+            "id": "sb1",
+            "title": "渡口",
+            "background": {"image": "assets/a.png"},
+            "scripts": [
+                {"id": "s1", "speaker": "旁白", "text": "雨夜里木门轻响。", "character_image": None},
+                {"id": "s2", "speaker": "甲", "text": "先进去看看。", "character_image": "x"},
+                {"id": "s3", "speaker": "旁白", "text": "屋里只剩一盏灯。", "character_image": None},
+            ],
+        }
+    ]
+}
+
+
+def _run(*argv: str) -> tuple[int, str]:
+    out = io.StringIO()
+    with mock.patch("sys.argv", ["check_script_quality.py", *argv]), contextlib.redirect_stdout(out):
+        code = check_script_quality.main()
+    return code, out.getvalue()
+
+
+class CheckScriptQualityToolTests(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = Path(tmp.name)
+        for name, payload in (("good", GOOD_SCRIPT), ("broken", {"storyboards": [1]})):
+            script_dir = self.root / name
+            script_dir.mkdir()
+            (script_dir / "script.json").write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+        (self.root / "good" / "notes.json").write_text("{}", encoding="utf-8")
+
+    def test_expand_targets_dedupes_directories_and_globs(self):
+        good = self.root / "good" / "script.json"
+        paths = check_script_quality._expand_targets(
+            [str(self.root), str(self.root / "*" / "script.json"), str(good)]
+        )
+        self.assertEqual([p.resolve() for p in paths], [(self.root / "broken" / "script.json").resolve(), good.resolve()])
+
+    def test_combined_report_and_exit_code(self):
+        code, out = _run(str(self.root / "good"), "--json", "--no-cache")
+        self.assertEqual(code, 0)
+        self.assertEqual(json.loads(out)["checked"], 1)
+
+        # 结构非法的脚本记为失败行，不影响其他脚本的结果
+        for jobs in ("1", "2"):
+            code, out = _run(str(self.root), "--json", "--no-cache", "--jobs", jobs)
+            payload = json.loads(out)
+            self.assertEqual(code, 1)
+            self.assertEqual((payload["passed"], payload["checked"], payload["failed"]), (False, 2, 1))
+            broken, good = payload["scripts"]
+            self.assertTrue(broken["error"].startswith("AttributeError"))
+            self.assertTrue(good["passed"])
+
+        code, out = _run(str(self.root), "--no-cache")
+        self.assertEqual(code, 1)
+        self.assertIn("checked=2 failed=1", out)
+
+    def test_no_scripts_found(self):
+        err = io.StringIO()
+        with contextlib.redirect_stderr(err):
+            code, _ = _run(str(self.root / "missing*"))
+        self.assertEqual(code, 1)
+        self.assertIn("no script.json found", err.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
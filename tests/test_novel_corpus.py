@@ -0,0 +1,69 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from engine.novel_corpus import NovelCorpus
+from engine.script_quality import _extract_narration_candidates
+from engine.storyboard_planner import _split_chapters, _split_paragraphs, build_storyboard_drafts
+
+
+SAMPLE_NOVEL = (
+    "序言：这座城一直在下雨。\r\n\r\n"
+    "### 第一章 雨夜回访\n\n"
+    "雨丝斜斜划过青石板路，沈砚在旧渡口下车。他撑开伞，看见码头尽头的灯还亮着。\n\n\n"
+    "　顾行舟站在屋檐下，递来一只旧怀表。　\n"
+    "### 第二章 空章\n"
+    "第三章 旧案重提\r\n"
+    "木屋里炉火噼啪作响，卷宗的纸页已经发黄。\n\n"
+    "警局里有人阻拦调查，渡口地皮交易浮出水面。"
+)
+
+
+class NovelCorpusTests(unittest.TestCase):
+    def test_from_text_matches_legacy_splitters(self):
+        corpus = NovelCorpus.from_text(SAMPLE_NOVEL)
+        self.assertEqual(corpus.chapters(), _split_chapters(SAMPLE_NOVEL))
+        self.assertEqual(corpus.paragraphs(), _split_paragraphs(SAMPLE_NOVEL))
+        self.assertEqual(list(corpus.narration_candidates()), list(_extract_narration_candidates(SAMPLE_NOVEL)))
+        self.assertEqual(corpus.chapter_count, 2)
+
+        empty = NovelCorpus.from_text("")
+        self.assertEqual(empty.chapters(), [])
+        self.assertEqual(list(empty.narration_candidates()), list(_extract_narration_candidates("")))
+
+    def test_planner_accepts_corpus(self):
+        corpus = NovelCorpus.from_text(SAMPLE_NOVEL)
+        self.assertEqual(build_storyboard_drafts(corpus), build_storyboard_drafts(SAMPLE_NOVEL))
+        # 有章节时规划只用章节区间，不触发段落与旁白候选的切分
+        self.assertNotIn("para_starts", corpus._arrays)
+        self.assertIsNone(corpus._chunk_blob)
+
+    def test_sidecar_index_round_trip_and_invalidation(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            novel_path = Path(tmp) / "novel_full.md"
+            novel_path.write_text(SAMPLE_NOVEL, encoding="utf-8")
+            expected = NovelCorpus.from_text(SAMPLE_NOVEL)
+
+            first = NovelCorpus.load(novel_path)
+            index_path = NovelCorpus.index_path_for(novel_path)
+            self.assertTrue(index_path.is_file())
+
+            with NovelCorpus.load(novel_path) as mapped:
+                self.assertIsNotNone(mapped._mmap)
+                self.assertEqual(mapped.chapters(), expected.chapters())
+                self.assertEqual(mapped.paragraphs(), expected.paragraphs())
+                self.assertEqual(list(mapped.narration_candidates()), list(first.narration_candidates()))
+
+            # 小说内容变化后旧索引失效，重新构建
+            novel_path.write_text(SAMPLE_NOVEL + "\n\n新增的一段结尾。", encoding="utf-8")
+            reloaded = NovelCorpus.load(novel_path)
+            self.assertIsNone(reloaded._mmap)
+            self.assertEqual(reloaded.paragraphs()[-1], "新增的一段结尾。")
+
+            # 损坏的索引同样回退为重建
+            index_path.write_bytes(b"garbage")
+            self.assertEqual(NovelCorpus.load(novel_path).paragraphs(), reloaded.paragraphs())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,28 @@
+import json
+import tempfile
 import unittest
+from pathlib import Path
+from unittest import mock
 
-from engine.script_quality import analyze_script_quality, enrich_narration_with_novel, normalize_and_repair_script
+from engine.script_quality import (
+    IncrementalQualityAnalyzer,
+    NarrationCandidateIndex,
+    _calculate_similarity,
+    _check_duplicate_text,
+    analyze_script_file,
+    analyze_script_quality,
+    chunk_many,
+    enrich_narration_with_novel,
+    expensive_rules,
+    iter_storyboards,
+    merge_segment_id_maps,
+    normalize_and_repair_script,
+    plan_narration_enrichment,
+    rebuild_asset_manifest,
+    update_asset_manifest,
+)
+from engine.storyboard_planner import build_storyboard_drafts
+from engine.text_similarity import SimilarityIndex, fingerprint_similarity, fingerprint_text
 
 
 class ScriptQualityTests(unittest.TestCase):
@@ -49,6 +71,273 @@ class ScriptQualityTests(unittest.TestCase):
         after = analyze_script_quality(enriched, min_narration_ratio=0.4)
         self.assertLess(before.stats.narration_ratio, after.stats.narration_ratio)
 
+    def test_candidate_index_ranks_theme_matches_first(self):
+        texts = ["码头空无一人。", "雨落在伞面上。", "灯还亮着。", "夜色很深。", "雨夜里有人敲门。"]
+        index = NarrationCandidateIndex(texts)
+
+        self.assertEqual(index.rank_by_theme("第一章 雨夜"), [1, 3, 4, 0, 2])
+        # 相关候选已足够时截断，只保留截断点之前的无关候选
+        self.assertEqual(index.rank_by_theme("雨夜", max_relevant=2), [1, 3, 0, 2])
+        self.assertEqual(index.rank_by_theme(""), [0, 1, 2, 3, 4])
+        self.assertEqual(index.rank_by_theme("风"), [0, 1, 2, 3, 4])
+        self.assertIs(index.fingerprint(1), index.fingerprint(1))
+
+    def test_enrichment_plan_applies_linearly_and_as_json_patch(self):
+        data = {
+            "storyboards": [
+                {
+                    "id": "sb1",
+                    "title": "雨夜",
+                    "scripts": [
+                        {"id": "sb1_1", "speaker": "沈砚", "text": "你来了。"},
+                        {"id": "sb1_2", "speaker": "顾行舟", "text": "雨太大了。"},
+                        {"id": "sb1_3", "speaker": "沈砚", "text": "进屋说。"},
+                    ],
+                }
+            ]
+        }
+        novel = "雨丝斜斜划过青石板路，沈砚在旧渡口下车。\n\n夜色里，码头的灯还亮着。\n\n顾行舟撑伞走过长街。"
+        snapshot = json.loads(json.dumps(data))
+
+        plan = plan_narration_enrichment(data, novel, target_ratio=0.5)
+        enriched = enrich_narration_with_novel(data, novel, target_ratio=0.5)
+        self.assertEqual(data, snapshot)
+        self.assertEqual(plan.apply(data), enriched)
+
+        patched = json.loads(json.dumps(data))
+        for op in plan.to_json_patch():
+            self.assertEqual(op["op"], "add")
+            _, _, sb_idx, _, index = op["path"].split("/")
+            patched["storyboards"][int(sb_idx)]["scripts"].insert(int(index), op["value"])
+        self.assertEqual(patched, enriched)
+        self.assertEqual(enriched["storyboards"][0]["scripts"][0]["speaker"], "旁白")
+
+    def test_bm25_ranking_prefers_storyboard_related_candidates(self):
+        try:
+            import numpy  # noqa: F401
+        except ImportError:
+            self.skipTest("numpy not installed")
+
+        novel = (
+            "码头的灯还亮着，渡船靠在岸边。\n\n"
+            "卷宗堆满了木桌，纸页早已发黄。\n\n"
+            "暗河入口藏在渡口的石阶下面。"
+        )
+        index = NarrationCandidateIndex(["码头的灯还亮着，渡船靠在岸边。", "卷宗堆满了木桌，纸页早已发黄。"])
+        self.assertEqual(index.rank_by_relevance(["翻卷宗", "毫不相干"], top_k=1), [[1, 0], [0, 1]])
+
+        data = {
+            "storyboards": [
+                {
+                    "id": "sb1",
+                    "title": "第二章 旧案",
+                    "scripts": [
+                        {"id": "s1", "speaker": "沈砚", "text": "暗河入口在哪？"},
+                        {"id": "s2", "speaker": "顾行舟", "text": "就在渡口石阶下面。"},
+                    ],
+                }
+            ]
+        }
+        plan = plan_narration_enrichment(data, novel, target_ratio=0.5, ranking="bm25")
+        self.assertEqual(plan.insertions[0].segment["text"], "暗河入口藏在渡口的石阶下面。")
+        with self.assertRaises(ValueError):
+            plan_narration_enrichment(data, novel, ranking="unknown")
+
+    def test_enrichment_draws_from_storyboard_chapter_first(self):
+        novel = (
+            "### 第一章 渡口\n\n码头的灯还亮着，渡船靠在岸边。\n\n"
+            "### 第二章 旧案\n\n卷宗堆满了木桌，纸页早已发黄。\n\n"
+            "### 第三章 暗河\n\n暗河入口藏在石阶下面，水声很沉。"
+        )
+        drafts = build_storyboard_drafts(novel)
+        self.assertEqual(novel[drafts[1].source_span[0]:drafts[1].source_span[1]], "卷宗堆满了木桌，纸页早已发黄。")
+
+        def storyboard(existing_narration: str) -> dict:
+            return {
+                "storyboards": [
+                    {
+                        "id": "sb1",
+                        "title": "调查",
+                        "source_span": list(drafts[1].source_span),
+                        "scripts": [
+                            {"id": "s1", "speaker": "旁白", "text": existing_narration},
+                            {"id": "s2", "speaker": "沈砚", "text": "线索在哪里？"},
+                            {"id": "s3", "speaker": "顾行舟", "text": "都在这里。"},
+                        ],
+                    }
+                ]
+            }
+
+        plan = plan_narration_enrichment(storyboard("夜很静。"), novel, target_ratio=0.5)
+        self.assertEqual([i.segment["text"] for i in plan.insertions], ["卷宗堆满了木桌，纸页早已发黄。"])
+
+        # 本章候选已重复时，扩展到相邻章节
+        plan = plan_narration_enrichment(storyboard("卷宗堆满了木桌，纸页早已发黄。"), novel, target_ratio=0.5)
+        texts = [i.segment["text"] for i in plan.insertions]
+        self.assertEqual(len(texts), 1)
+        self.assertIn(texts[0], {"码头的灯还亮着，渡船靠在岸边。", "暗河入口藏在石阶下面，水声很沉。"})
+
+    def test_chunk_many_matches_sentence_packing(self):
+        long_text = "雨夜。" * 30 + "灯" * 100
+        chunked = chunk_many(["  短句。  ", "", long_text, "  短句。  "], max_len=80)
+        self.assertEqual(chunked[0], ["短句。"])
+        self.assertEqual(chunked[1], [""])
+        self.assertEqual(chunked[3], ["短句。"])
+        # 句子按长度上限打包，超长句子硬切分
+        self.assertEqual(chunked[2], ["雨夜。" * 26, "雨夜。" * 4, "灯" * 80, "灯" * 20])
+
+    def test_repair_in_place_matches_copying_repair(self):
+        data = {
+            "shared": {"pipeline_state": {"stage": "2"}},
+            "storyboards": [
+                {
+                    "id": "sb1",
+                    "title": "测试",
+                    "scripts": [
+                        {"id": "", "speaker": "我", "text": "（低声）" + "雨夜。" * 40, "character_image": "x"},
+                        {"id": "s1", "speaker": "旁白", "text": "风停了。", "character_image": "y"},
+                    ],
+                }
+            ],
+        }
+        snapshot = json.loads(json.dumps(data))
+
+        copied = normalize_and_repair_script(data)
+        self.assertEqual(data, snapshot)
+
+        repaired = normalize_and_repair_script(data, in_place=True)
+        self.assertIs(repaired, data)
+        self.assertEqual(repaired, copied)
+
+    def test_repair_keeps_segment_ids_stable_and_reports_id_map(self):
+        data = {
+            "storyboards": [
+                {
+                    "id": "sb1",
+                    "scripts": [
+                        {"id": "s1", "speaker": "旁白", "text": "风停了。"},
+                        {"id": "s2", "speaker": "沈砚", "text": "雨夜。" * 40, "character_image": "x"},
+                        {"id": "", "speaker": "旁白", "text": "灯灭了。"},
+                        {"id": "s3", "speaker": "沈砚", "text": "（低声）"},
+                        {"id": "s1", "speaker": "顾行舟", "text": "走。"},
+                    ],
+                },
+                {"id": "sb2", "scripts": [{"id": "s2_2", "speaker": "旁白", "text": "夜深。"}]},
+            ]
+        }
+        repaired = normalize_and_repair_script(data)
+        ids = [[sc["id"] for sc in sb["scripts"]] for sb in repaired["storyboards"]]
+        # 拆分后首句沿用原 id，派生 id 避开已存在的 s2_2；无 id 与重复 id 从最大编号之后分配
+        self.assertEqual(ids, [["s1", "s2", "s2_3", "s4", "s5"], ["s2_2"]])
+        id_map = repaired["shared"]["pipeline_state"]["segment_id_map"]
+        self.assertEqual(id_map, {"renamed": {"s2": ["s2", "s2_3"], "s3": []}, "added": ["s4", "s5"]})
+
+        # 已修复的剧本再次修复时 id 不变、映射为空
+        again = normalize_and_repair_script(repaired)
+        self.assertEqual([[sc["id"] for sc in sb["scripts"]] for sb in again["storyboards"]], ids)
+        self.assertEqual(again["shared"]["pipeline_state"]["segment_id_map"], {"renamed": {}, "added": []})
+
+        merged = merge_segment_id_maps(
+            id_map,
+            {"renamed": {"s2_3": ["s2_3", "s2_3_2"], "s5": [], "s7": []}, "added": ["s6"]},
+        )
+        self.assertEqual(
+            merged,
+            {"renamed": {"s2": ["s2", "s2_3", "s2_3_2"], "s3": [], "s7": []}, "added": ["s4", "s6"]},
+        )
+
+    def test_asset_index_deduplicates_and_updates_incrementally(self):
+        data = {
+            "storyboards": [
+                {
+                    "id": "sb1",
+                    "background": {"image": "assets/bg_dock.png"},
+                    "scripts": [
+                        {"id": "s1", "speaker": "旁白", "text": "夜。", "character_image": None},
+                        {"id": "s2", "speaker": "沈砚", "text": "走。", "character_image": "assets/char_a.png"},
+                        {"id": "s3", "speaker": "沈砚", "text": "快。", "character_image": "assets/char_a.png"},
+                    ],
+                },
+                {
+                    "id": "sb2",
+                    "background": {"image": "assets/bg_dock.png"},
+                    "scripts": [
+                        {"id": "s4", "speaker": "顾行舟", "text": "嗯。", "character_image": "assets/char_b.png"},
+                    ],
+                },
+            ]
+        }
+        rebuild_asset_manifest(data)
+        index = data["shared"]["asset_index"]
+        self.assertEqual(
+            [(a["kind"], a["path"], a["refs"]) for a in index["assets"]],
+            [
+                ("background", "assets/bg_dock.png", 4),
+                ("character", "assets/char_a.png", 2),
+                ("character", "assets/char_b.png", 1),
+            ],
+        )
+        self.assertEqual(index["storyboards"][0]["segments"], [["s1", None], ["s2", 1], ["s3", 1]])
+        self.assertEqual(len(data["shared"]["asset_manifest"]), 4)
+        self.assertEqual(data["shared"]["pipeline_state"]["asset_manifest_count"], 4)
+
+        # 模块3回写第二个分镜后只增量更新该分镜
+        data["storyboards"][1]["background"]["image"] = "assets/bg_river.png"
+        data["storyboards"][1]["scripts"].append(
+            {"id": "s5", "speaker": "沈砚", "text": "看。", "character_image": "assets/char_a.png"}
+        )
+        update_asset_manifest(data, [1])
+        incremental = json.loads(json.dumps(data["shared"]))
+
+        rebuild_asset_manifest(data)
+        self.assertEqual(incremental["asset_manifest"], data["shared"]["asset_manifest"])
+        live = {(a["kind"], a["path"], a["refs"]) for a in incremental["asset_index"]["assets"] if a["refs"] > 0}
+        rebuilt = {(a["kind"], a["path"], a["refs"]) for a in data["shared"]["asset_index"]["assets"]}
+        self.assertEqual(live, rebuilt)
+
+    def test_update_asset_manifest_rewrites_only_changed_rows(self):
+        def storyboard(sb_id: str, bg: str, *seg_ids: str) -> dict:
+            return {
+                "id": sb_id,
+                "background": {"image": bg},
+                "scripts": [
+                    {"id": seg_id, "speaker": "沈砚", "text": "走。", "character_image": "assets/char_a.png"}
+                    for seg_id in seg_ids
+                ],
+            }
+
+        data = {
+            "storyboards": [
+                storyboard("sb1", "assets/bg_a.png", "s1", "s2"),
+                storyboard("sb2", "assets/bg_b.png", "s3"),
+                storyboard("sb3", "assets/bg_c.png"),
+                storyboard("sb4", "assets/bg_d.png", "s4", "s5"),
+            ]
+        }
+        rebuild_asset_manifest(data)
+        # 没有段落的分镜仍计 1 次背景引用
+        refs = {a["path"]: a["refs"] for a in data["shared"]["asset_index"]["assets"]}
+        self.assertEqual(refs["assets/bg_c.png"], 1)
+
+        before = list(data["shared"]["asset_manifest"])
+        data["storyboards"][1]["scripts"].append(
+            {"id": "s6", "speaker": "旁白", "text": "夜。", "character_image": None}
+        )
+        data["storyboards"][2]["background"]["image"] = "assets/bg_e.png"
+        update_asset_manifest(data, [1, 2])
+        manifest = data["shared"]["asset_manifest"]
+        self.assertEqual([row["segment_id"] for row in manifest], ["s1", "s2", "s3", "s6", "s4", "s5"])
+        # 未改动分镜的行原样保留（未重新生成）
+        self.assertIs(manifest[0], before[0])
+        self.assertIs(manifest[-1], before[-1])
+        self.assertEqual(data["shared"]["pipeline_state"]["asset_manifest_count"], 6)
+
+        expected = json.loads(json.dumps(data["shared"]))
+        rebuild_asset_manifest(data)
+        self.assertEqual(expected["asset_manifest"], data["shared"]["asset_manifest"])
+        live = {(a["kind"], a["path"], a["refs"]) for a in expected["asset_index"]["assets"] if a["refs"] > 0}
+        self.assertEqual(live, {(a["kind"], a["path"], a["refs"]) for a in data["shared"]["asset_index"]["assets"]})
+
     def test_repair_removes_stage_prefix_and_chapter_heading(self):
         data = {
             "storyboards": [
@@ -87,6 +376,198 @@ class ScriptQualityTests(unittest.TestCase):
         self.assertTrue(all(not t.startswith("（") for t in texts))
         self.assertTrue(all("第一章" not in t for t in texts))
 
+    def test_duplicate_index_matches_bruteforce(self):
+        base = [
+            "雨水顺着屋檐滴落，沈砚站在旧渡口的栈桥上等船。",
+            "顾行舟翻开卷宗，纸页边缘已经被潮气泡得发软。",
+            "魏伯把账本推到桌角，炉火映着他发白的指节。",
+            "暗河入口藏在废弃船坞背后。",
+        ]
+        texts = [
+            base[0],
+            base[1],
+            base[0] + "灯影摇晃。",  # 追加少量文本
+            "河面起雾。" + base[3] + "无人知晓。",  # 包含短文本
+            base[2],
+            base[3],
+            base[1][:-3],  # 截断
+            "清晨薄雾里，三人顺着暗河找到了黑船。",
+            base[2].replace("炉火", "灯火"),  # 局部替换
+            "短句。",
+        ]
+        data = {
+            "storyboards": [
+                {"id": "sb1", "scripts": [{"text": t} for t in texts[:5]]},
+                {"id": "sb2", "scripts": [{"text": t} for t in texts[5:]]},
+            ]
+        }
+        indexed = _check_duplicate_text(data, threshold=0.85)
+        brute = _check_duplicate_text(data, threshold=0.85, use_index=False)
+        self.assertEqual(indexed, brute)
+        self.assertEqual(
+            [i.location for i in indexed],
+            ["storyboards[0].scripts[2]", "storyboards[1].scripts[1]"],
+        )
+        self.assertTrue(all(i.code == "DUPLICATE_TEXT" for i in indexed))
+
+    def test_similarity_scores_unchanged(self):
+        long_text = "雨水顺着屋檐滴落，沈砚站在旧渡口的栈桥上等船。"
+        short_text = "暗河入口藏在废弃船坞背后。"
+        self.assertEqual(_calculate_similarity(long_text + "灯影摇晃。", long_text), 1.0)
+        self.assertEqual(_calculate_similarity(short_text, "河面起雾。" + short_text + "无人知晓。"), 0.75)
+        self.assertAlmostEqual(_calculate_similarity(long_text[:-3], long_text), 0.95)
+        self.assertEqual(_calculate_similarity("ab", "ababab"), 0.5)
+        self.assertEqual(_calculate_similarity("ababab", "ab"), 1.0)
+        self.assertEqual(_calculate_similarity("", long_text), 0.0)
+        self.assertEqual(_calculate_similarity("，。", long_text), 0.0)
+
+    def test_similarity_index_matches_pairwise_precheck(self):
+        existing = [
+            "雨丝斜斜划过青石板路，沈砚在旧渡口下车。",
+            "灯",
+            "顾行舟带他去翻卷宗，木屋里炉火噼啪作响。",
+        ]
+        queries = [
+            "雨丝斜斜划过青石板路，沈砚在旧渡口下车了。",
+            "渡口的灯",
+            "清晨薄雾里，三人顺着暗河找到了黑船。",
+            "",
+        ]
+        index = SimilarityIndex()
+        for text in existing:
+            index.add(text)
+        for query in queries:
+            fp = fingerprint_text(query)
+            expected = any(fingerprint_similarity(fp, fingerprint_text(t)) >= 0.85 for t in existing)
+            self.assertEqual(index.has_similar(query, 0.85), expected, query)
+        self.assertTrue(index.has_similar(queries[0], 0.85))
+
+    def test_incremental_analyzer_recomputes_changed_storyboards_only(self):
+        data = {
+            "storyboards": [
+                {
+                    "id": f"sb{i}",
+                    "scripts": [
+                        {"id": f"s{i}a", "speaker": "旁白", "text": f"第{i}段旁白，雨水敲在栈桥上。", "character_image": None},
+                        {"id": f"s{i}b", "speaker": "甲", "text": "走吧。", "character_image": "a.png"},
+                    ],
+                }
+                for i in range(1, 4)
+            ]
+        }
+        analyzer = IncrementalQualityAnalyzer(min_narration_ratio=0.4)
+        first = analyzer.analyze(data)
+        self.assertEqual(analyzer.last_recomputed, 3)
+        self.assertEqual(first.to_dict(), analyze_script_quality(data, min_narration_ratio=0.4).to_dict())
+
+        # 修改一个分镜：制造段落 id 重复（全局检查）与对话缺立绘（局部检查）
+        data["storyboards"][2]["scripts"][1]["id"] = "s1a"
+        data["storyboards"][2]["scripts"][1]["character_image"] = None
+        second = analyzer.analyze(data)
+        self.assertEqual(analyzer.last_recomputed, 1)
+        self.assertEqual(second.to_dict(), analyze_script_quality(data, min_narration_ratio=0.4).to_dict())
+        codes = {i.code for i in second.issues}
+        self.assertIn("SEG_ID_DUP", codes)
+        self.assertIn("DIALOGUE_NO_IMAGE", codes)
+
+    def test_rule_engine_skips_rules_and_records_timings(self):
+        text = "雨水顺着屋檐滴落，沈砚站在旧渡口的栈桥上等船。"
+        data = {
+            "storyboards": [
+                {
+                    "id": "sb1",
+                    "scripts": [
+                        {"id": "s1", "speaker": "旁白", "text": text, "character_image": None},
+                        {"id": "s2", "speaker": "旁白", "text": text, "character_image": None},
+                    ],
+                }
+            ]
+        }
+        full = analyze_script_quality(data)
+        self.assertIn("DUPLICATE_TEXT", {i.code for i in full.issues})
+        self.assertIn("duplicate_text", full.rule_timings)
+        self.assertNotIn("rule_timings", full.to_dict())
+
+        fast = analyze_script_quality(data, skip_rules=expensive_rules())
+        self.assertNotIn("DUPLICATE_TEXT", {i.code for i in fast.issues})
+        self.assertNotIn("duplicate_text", fast.rule_timings)
+        self.assertTrue(fast.passed)
+
+        with self.assertRaises(ValueError):
+            analyze_script_quality(data, skip_rules=["no_such_rule"])
+
+    def test_report_cache_answers_unchanged_file_without_parsing(self):
+        data = {
+            "storyboards": [
+                {
+                    "id": "sb1",
+                    "scripts": [
+                        {"id": "s1", "speaker": "旁白", "text": "雨水敲在栈桥上。", "character_image": None},
+                        {"id": "s2", "speaker": "甲", "text": "走吧。", "character_image": None},
+                    ],
+                }
+            ]
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            script_path = Path(tmp) / "script.json"
+            script_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+
+            first = analyze_script_file(script_path, min_narration_ratio=0.4, use_cache=True)
+            self.assertEqual(len(list((Path(tmp) / ".cache").glob("quality_*.json"))), 1)
+
+            with mock.patch("engine.script_quality.analyze_script_quality", side_effect=AssertionError):
+                cached = analyze_script_file(script_path, min_narration_ratio=0.4, use_cache=True)
+            self.assertEqual(cached.to_dict(), first.to_dict())
+
+            # 阈值变化或文件内容变化都应重新分析
+            data["storyboards"][0]["scripts"][1]["character_image"] = "a.png"
+            script_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+            changed = analyze_script_file(script_path, min_narration_ratio=0.4, use_cache=True)
+            self.assertNotIn("DIALOGUE_NO_IMAGE", {i.code for i in changed.issues})
+            # 同一脚本、同一参数只保留最新内容的缓存；其他参数的条目不受影响
+            analyze_script_file(script_path, min_narration_ratio=0.5, use_cache=True)
+            self.assertEqual(len(list((Path(tmp) / ".cache").glob("quality_*.json"))), 2)
+            data["storyboards"][0]["title"] = "栈桥"
+            script_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+            analyze_script_file(script_path, min_narration_ratio=0.4, use_cache=True)
+            self.assertEqual(len(list((Path(tmp) / ".cache").glob("quality_*.json"))), 2)
+
+            with mock.patch("engine.script_quality.ANALYZER_VERSION", "next"):
+                analyze_script_file(script_path, min_narration_ratio=0.4, use_cache=True)
+            self.assertEqual(
+                [p.name.startswith("quality_vnext_") for p in (Path(tmp) / ".cache").glob("quality_*.json")],
+                [True],
+            )
+
+    def test_streaming_storyboards_match_full_load(self):
+        data = {
+            "shared": {"pipeline_state": {"stage": "module2_completed"}, "asset_manifest": [1, 2.5, None]},
+            "storyboards": [
+                {
+                    "id": f"sb{i}",
+                    "title": "第一章 雨夜回访",
+                    "scripts": [
+                        {"id": f"s{i}a", "speaker": "旁白", "text": f"第{i}段旁白，雨水敲在栈桥上。", "character_image": None},
+                        {"id": f"s{i}b", "speaker": "甲", "text": "走吧\"。", "character_image": "a.png", "speed": 55},
+                    ],
+                }
+                for i in range(1, 4)
+            ],
+            "version": 0.125,
+        }
+        with tempfile.TemporaryDirectory() as tmp:
+            script_path = Path(tmp) / "script.json"
+            script_path.write_text(json.dumps(data, ensure_ascii=False, indent=2), encoding="utf-8")
+            for chunk_size in (1, 5, 1 << 16):
+                self.assertEqual(list(iter_storyboards(script_path, chunk_size=chunk_size)), data["storyboards"])
+
+            streamed = analyze_script_quality(iter_storyboards(script_path, chunk_size=7), min_narration_ratio=0.4)
+            self.assertEqual(streamed.to_dict(), analyze_script_quality(data, min_narration_ratio=0.4).to_dict())
+
+            script_path.write_text(json.dumps({"shared": {}}), encoding="utf-8")
+            empty = analyze_script_quality(iter_storyboards(script_path))
+            self.assertEqual([i.code for i in empty.issues], ["STORYBOARDS_EMPTY"])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -53,6 +53,161 @@ class ScriptRefinerTests(unittest.TestCase):
         issue_codes = {issue.code for issue in result.final_report.issues}
         self.assertNotIn("SB_NARRATION_RATIO_LOW", issue_codes)
 
+    def test_refine_rounds_only_touch_failing_storyboards(self):
+        passing = {
+            "id": "sb1",
+            "title": "渡口",
+            "background": {"image": "assets/a.png"},
+            "scripts": [
+                {"id": "s1", "speaker": "旁白", "text": "雨夜里木门轻响。", "character_image": None},
+                {"id": "s2", "speaker": "甲", "text": "先进去看看。", "character_image": "x"},
+                {"id": "s3", "speaker": "旁白", "text": "屋里只剩一盏灯。", "character_image": None},
+            ],
+        }
+        failing = {
+            "id": "sb2",
+            "title": "旧案",
+            "background": {"image": "assets/b.png"},
+            "scripts": [
+                {"id": "s4", "speaker": "乙", "text": "都准备好了。", "character_image": "y"},
+                {"id": "s5", "speaker": "丙", "text": "马上动手。", "character_image": "z"},
+            ],
+        }
+        novel = "\n\n".join(
+            [
+                "雨水顺着屋檐滴落，渡口的灯火在风里摇晃。",
+                "卷宗的纸页已经发黄，旧案的线索散落在码头。",
+                "警笛在远处响起，潮湿的空气里浮着铁锈味。",
+                "炉火噼啪作响，怀表的指针停在了午夜。",
+            ]
+        )
+        result = refine_script_until_pass({"storyboards": [passing, failing]}, novel, min_narration_ratio=0.4)
+
+        first = result.rounds[0]
+        self.assertEqual(first.refined_storyboards, [1])
+        self.assertGreaterEqual(first.enrich_seconds, 0.0)
+        self.assertGreaterEqual(first.repair_seconds, 0.0)
+        untouched = [(sc["id"], sc["text"]) for sc in result.output["storyboards"][0]["scripts"]]
+        self.assertEqual(untouched, [(sc["id"], sc["text"]) for sc in passing["scripts"]])
+        self.assertNotIn("SB_NARRATION_RATIO_LOW", {issue.code for issue in result.final_report.issues})
+        self.assertEqual(result.rounds[-1].refined_storyboards, [])
+
+    def test_refine_skips_unrefinable_issues(self):
+        novel = "雨水顺着屋檐滴落，渡口的灯火在风里摇晃。\n\n卷宗的纸页已经发黄，旧案的线索散落在码头。"
+        storyboards = [
+            {
+                "id": f"sb{i}",
+                "title": "渡口",
+                "background": {"image": "assets/a.png"},
+                "scripts": [
+                    {"id": f"s{i}_1", "speaker": "旁白", "text": f"第{i}盏灯在雨里亮着。", "character_image": None},
+                    {"id": f"s{i}_2", "speaker": "甲", "text": f"去第{i}个码头看看。", "character_image": None},
+                    {"id": f"s{i}_3", "speaker": "旁白", "text": f"第{i}条船靠了岸。", "character_image": None},
+                ],
+            }
+            for i in range(1, 4)
+        ]
+        # 每个分镜都有对白缺立绘的告警，只有 sb3 旁白不足
+        storyboards[2]["scripts"] = storyboards[2]["scripts"][1:2] + [
+            {"id": "s3_4", "speaker": "乙", "text": "船上没有人。", "character_image": None},
+        ]
+        result = refine_script_until_pass({"storyboards": storyboards}, novel, min_narration_ratio=0.4)
+        self.assertEqual(result.rounds[0].refined_storyboards, [2])
+        self.assertIn("DIALOGUE_NO_IMAGE", {issue.code for issue in result.final_report.issues})
+
+        # 重复文本无法靠补强/修复消除：首轮分析后即停止
+        dup = "他把那本泛黄的账本推到桌角，说这就是当年渡口地皮交易的全部证据。"
+        data = {
+            "storyboards": [
+                {
+                    "id": f"sb{i}",
+                    "title": "渡口",
+                    "background": {"image": "assets/a.png"},
+                    "scripts": [
+                        {"id": f"d{i}_1", "speaker": "旁白", "text": f"第{i}个夜晚，雨停了。", "character_image": None},
+                        {"id": f"d{i}_2", "speaker": "旁白", "text": dup, "character_image": None},
+                    ],
+                }
+                for i in range(1, 3)
+            ]
+        }
+        result = refine_script_until_pass(data, novel, min_narration_ratio=0.4, max_rounds=3)
+        self.assertEqual(len(result.rounds), 1)
+        self.assertEqual({issue.code for issue in result.final_report.issues}, {"DUPLICATE_TEXT"})
+
+    def test_iterative_solver_adds_opening_narration(self):
+        # 旁白占比已达标，但首段是对白
+        data = {
+            "storyboards": [
+                {
+                    "id": "sb1",
+                    "title": "渡口",
+                    "background": {"image": "assets/a.png"},
+                    "scripts": [
+                        {"id": "s1", "speaker": "甲", "text": "先进去看看。", "character_image": "x"},
+                        {"id": "s2", "speaker": "旁白", "text": "雨夜里木门轻响。", "character_image": None},
+                        {"id": "s3", "speaker": "旁白", "text": "屋里只剩一盏灯。", "character_image": None},
+                    ],
+                }
+            ]
+        }
+        novel = "雨水顺着屋檐滴落，渡口的灯火在风里摇晃。\n\n卷宗的纸页已经发黄，旧案的线索散落在码头。"
+        result = refine_script_until_pass(data, novel, min_narration_ratio=0.4, max_rounds=3)
+        self.assertTrue(result.final_report.passed)
+        self.assertEqual(len(result.rounds), 2)
+        self.assertEqual(result.output["storyboards"][0]["scripts"][0]["speaker"], "旁白")
+
+    def test_closed_form_solver_converges_in_one_round(self):
+        # 超长对白修复后会拆成多句，闭式求解按拆分后的段数补足旁白
+        data = {
+            "storyboards": [
+                {
+                    "id": "sb1",
+                    "title": "渡口",
+                    "scripts": [
+                        {
+                            "id": "s1",
+                            "speaker": "甲",
+                            "text": "（低声）" + "".join(f"第{n}条船天亮前必须离港。" for n in range(12)),
+                            "character_image": "x",
+                        },
+                        {"id": "s2", "speaker": "乙", "text": "走。", "character_image": "y"},
+                    ],
+                },
+                {
+                    "id": "sb2",
+                    "title": "旧案",
+                    "scripts": [
+                        {"id": "s3", "speaker": "乙", "text": "卷宗在这里。", "character_image": "y"},
+                        {"id": "s4", "speaker": "旁白", "text": "灯影晃了一下。", "character_image": None},
+                    ],
+                },
+            ]
+        }
+        novel = "\n\n".join(
+            f"第{i}夜，{place}的{thing}在雨里{state}。"
+            for i, (place, thing, state) in enumerate(
+                [
+                    ("渡口", "灯火", "摇晃"),
+                    ("码头", "缆绳", "绷紧"),
+                    ("警局", "卷宗", "发黄"),
+                    ("木屋", "炉火", "噼啪作响"),
+                    ("长街", "铁门", "吱呀作响"),
+                    ("河岸", "芦苇", "起伏"),
+                    ("钟楼", "指针", "停摆"),
+                    ("巷口", "积水", "泛着微光"),
+                ]
+            )
+        )
+        result = refine_script_until_pass(data, novel, min_narration_ratio=0.4, solver="closed_form")
+
+        self.assertEqual(len(result.rounds), 1)
+        self.assertTrue(result.final_report.passed)
+        self.assertNotIn("SB_NARRATION_RATIO_LOW", {issue.code for issue in result.final_report.issues})
+
+        with self.assertRaises(ValueError):
+            refine_script_until_pass(data, novel, solver="newton")
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,6 +1,21 @@
+import json
+import tempfile
 import unittest
+from pathlib import Path
+from unittest import mock
 
-from engine.storyboard_planner import build_storyboard_drafts
+from engine.keyword_matcher import KeywordAutomaton
+from engine.storyboard_planner import (
+    DEFAULT_VOCABULARY,
+    PlannerVocabulary,
+    _infer_scene_tags,
+    _score_paragraph,
+    _top_paragraphs,
+    build_storyboard_drafts,
+    build_storyboard_drafts_from_file,
+    iter_chapters,
+    plan_background_assets,
+)
 
 
 class StoryboardPlannerTests(unittest.TestCase):
@@ -27,6 +42,116 @@ class StoryboardPlannerTests(unittest.TestCase):
         self.assertEqual(len({d.title for d in drafts}), 6)
         self.assertTrue(all(d.background_image.startswith("assets/") for d in drafts))
         self.assertTrue(all("scene_" in d.background_image for d in drafts))
+        self.assertEqual(text[slice(*drafts[0].source_span)], "雨丝斜斜划过青石板路，沈砚在旧渡口下车。")
+        self.assertEqual(text[slice(*drafts[-1].source_span)], "雨夜里，证据公开，渡口的灯重新亮起。")
+
+    def test_streaming_planner_matches_in_memory_planner(self):
+        chapters = "序言。\r\n\r\n### 第一章 雨夜回访\r\n\r\n　雨丝划过青石板。\n\n\n### 第二章 空章\n第三章 旧案重提\n卷宗发黄。"
+        paragraphs = "\n\n".join(["渡口的灯还亮着。", " \n雨夜里，真相突然浮现。" * 3, "", "炉火噼啪作响。\r\n木门轻响。"])
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "novel_full.md"
+            for text in (chapters, paragraphs, ""):
+                path.write_bytes(text.encode("utf-8"))
+                for target_count in (1, 2, 6):
+                    expected = build_storyboard_drafts(text, target_count=target_count)
+                    self.assertEqual(build_storyboard_drafts_from_file(path, target_count=target_count), expected)
+
+            path.write_bytes(chapters.encode("utf-8"))
+            self.assertEqual([title for title, _, _ in iter_chapters(path)], ["第一章 雨夜回访", "第三章 旧案重提"])
+            expected = build_storyboard_drafts(chapters)
+            self.assertEqual(build_storyboard_drafts_from_file(path, workers=2), expected)
+
+    def test_keyword_automaton_matches_substring_checks(self):
+        keywords = ["雨", "雨夜", "夜色", "he", "she", "hers", "his", "", "a]b", "^"]
+        automaton = KeywordAutomaton(keywords)
+        for text in ["", "雨夜色", "ushers", "this a]b^", "夜", "her", "xyz"]:
+            expected = {i for i, keyword in enumerate(keywords) if keyword in text}
+            self.assertEqual(automaton.find_all(text), expected, text)
+
+    def test_vocabulary_scores_and_tags_like_rule_tables(self):
+        text = "雨夜里突然发现暗河入口，警局的卷宗被公开。"
+        self.assertEqual(_score_paragraph(text), 4)
+        self.assertEqual(_score_paragraph("清晨" + "字" * 120), 3)
+        self.assertEqual(_infer_scene_tags(text), ["rain", "night", "boat"])
+        self.assertEqual(_infer_scene_tags("码头"), ["dock", "scene"])
+        self.assertEqual(_infer_scene_tags("平静"), ["story", "scene"])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            rules = DEFAULT_VOCABULARY.to_dict()
+            rules["scene_tags"].insert(0, {"tag": "neon", "keywords": ["霓虹"]})
+            rules["score_rules"].append({"score": 5, "keywords": ["霓虹"]})
+            path = Path(tmp) / "planner_vocabulary.json"
+            path.write_text(json.dumps(rules, ensure_ascii=False), encoding="utf-8")
+            vocabulary = PlannerVocabulary.load(path)
+
+        self.assertEqual(_infer_scene_tags("霓虹雨夜", vocabulary), ["neon", "rain", "night"])
+        self.assertEqual(_score_paragraph("霓虹雨夜", vocabulary), 7)
+        drafts = build_storyboard_drafts("霓虹灯下。\n\n雨停了。", target_count=1, vocabulary=vocabulary)
+        self.assertEqual(drafts[0].background_image, "assets/scene_1_neon_scene.png")
+
+    def test_top_paragraphs_matches_full_sort(self):
+        paragraphs = ["雨", "平静", "突然下雨", "夜", "平静的水面", "真相", "字" * 130, "平静", "雨夜突然"] * 3
+
+        def full_sort(vocabulary: PlannerVocabulary, k: int) -> list[int]:
+            order = sorted(
+                range(len(paragraphs)),
+                key=lambda i: (-vocabulary.score(paragraphs[i], i), -len(paragraphs[i]), i),
+            )
+            return sorted(order[:k])
+
+        vocabularies = [DEFAULT_VOCABULARY, PlannerVocabulary(position_score=-0.5, long_paragraph_score=4)]
+        for vocabulary in vocabularies:
+            for k in (0, 1, 4, 7, 30):
+                expected = full_sort(vocabulary, k)
+                self.assertEqual(_top_paragraphs(paragraphs, k, vocabulary), expected)
+                with mock.patch("engine.storyboard_planner.np", None):
+                    self.assertEqual(_top_paragraphs(paragraphs, k, vocabulary), expected)
+
+    def test_long_chapter_is_segmented_at_scene_changes(self):
+        rain = ["雨夜里他撑伞走过长街，积水映着路灯。"] * 3
+        dock = ["渡口的码头停着一艘旧渡船。"] * 3
+        archive = ["警局档案室里，卷宗的纸页已经发黄。"] * 2
+        text = "### 第一章 雨夜\n\n" + "\n\n".join(rain + dock + archive) + "\n\n### 第二章 清晨\n\n清晨薄雾散开。"
+        drafts = build_storyboard_drafts(text, target_count=4)
+        self.assertEqual([d.title for d in drafts], ["第一章 雨夜（1）", "第一章 雨夜（2）", "第一章 雨夜（3）", "第二章 清晨"])
+        self.assertEqual(text[slice(*drafts[0].source_span)], "\n\n".join(rain))
+        self.assertEqual(text[slice(*drafts[1].source_span)], "\n\n".join(dock))
+        self.assertEqual(text[slice(*drafts[2].source_span)], "\n\n".join(archive))
+        self.assertEqual(text[slice(*drafts[3].source_span)], "清晨薄雾散开。")
+        self.assertEqual(len({d.background_image for d in drafts}), 4)
+
+        # 章节数已足够时不切分
+        self.assertEqual([d.title for d in build_storyboard_drafts(text, target_count=2)], ["第一章 雨夜", "第二章 清晨"])
+
+    def test_plan_background_assets_shares_same_scene(self):
+        text = (
+            "### 第一章 雨夜渡口\n\n雨夜里他撑伞走到渡口。\n\n"
+            "### 第二章 雨夜木屋\n\n雨夜里木屋的炉火还亮着。\n\n"
+            "### 第三章 又到渡口\n\n夜里又下起了雨，渡口空无一人。\n\n"
+            "### 第四章 雨夜\n\n雨夜里他在街上走。\n\n"
+            "### 第五章 又是雨夜\n\n雨夜里她在街上走。"
+        )
+        drafts = build_storyboard_drafts(text, target_count=5)
+        self.assertEqual(drafts[0].scene_tags, ("rain", "night", "dock"))
+        self.assertEqual(drafts[0].scene_location, "dock")
+        self.assertEqual(drafts[1].scene_location, "interior")
+        self.assertEqual(drafts[3].scene_location, "")
+
+        assets = plan_background_assets(drafts)
+        self.assertEqual(
+            [(a.id, a.storyboard_ids) for a in assets],
+            [
+                ("scene_dock_rain_night", ["sb1", "sb3"]),
+                ("scene_interior_rain_night", ["sb2"]),
+                ("scene_4_rain_night", ["sb4"]),
+                ("scene_5_rain_night", ["sb5"]),
+            ],
+        )
+        self.assertEqual(drafts[0].background_image, "assets/scene_dock_rain_night.png")
+        self.assertEqual(drafts[2].background_image, drafts[0].background_image)
+        # 天气相同、地点不同的分镜不合并；识别不出地点的分镜也不合并
+        self.assertNotEqual(drafts[1].background_image, drafts[0].background_image)
+        self.assertNotEqual(drafts[3].background_image, drafts[4].background_image)
 
 
 if __name__ == "__main__":
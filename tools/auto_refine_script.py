@@ -6,8 +6,9 @@ ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
-from engine.script_quality import load_json, save_json
-from engine.script_refiner import refine_script_until_pass
+from engine.novel_corpus import NovelCorpus
+from engine.script_quality import NARRATION_RANKINGS, load_json, save_json
+from engine.script_refiner import REFINE_SOLVERS, refine_script_until_pass
 
 
 def main() -> int:
@@ -17,22 +18,38 @@ def main() -> int:
     parser.add_argument("--min-narration-ratio", type=float, default=0.40)
     parser.add_argument("--max-rounds", type=int, default=3)
     parser.add_argument("--in-place", action="store_true")
+    parser.add_argument(
+        "--ranking",
+        choices=NARRATION_RANKINGS,
+        default="theme",
+        help="Narration candidate ranking: title keywords (theme) or bigram BM25 top-k (bm25, needs numpy)",
+    )
+    parser.add_argument(
+        "--solver",
+        choices=REFINE_SOLVERS,
+        default="iterative",
+        help="iterative: repair then enrich round by round; closed_form: predict post-split counts and enrich once",
+    )
     args = parser.parse_args()
 
     data = load_json(args.script_path)
-    novel = Path(args.novel_path).read_text(encoding="utf-8")
+    novel = NovelCorpus.load(args.novel_path)
 
     result = refine_script_until_pass(
         data,
         novel,
         min_narration_ratio=args.min_narration_ratio,
         max_rounds=args.max_rounds,
+        ranking=args.ranking,
+        solver=args.solver,
     )
 
     for item in result.rounds:
         print(
             f"round={item.round_index} narration_ratio={item.narration_ratio:.3f} "
-            f"scripts={item.script_count} issues={item.issue_count}"
+            f"scripts={item.script_count} issues={item.issue_count} "
+            f"refined_storyboards={len(item.refined_storyboards)} "
+            f"analyze={item.analyze_seconds:.3f}s enrich={item.enrich_seconds:.3f}s repair={item.repair_seconds:.3f}s"
         )
 
     print(f"final_passed={result.final_report.passed}")
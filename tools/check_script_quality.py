@@ -1,37 +1,201 @@
 import argparse
+import glob
 import json
 import sys
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from pathlib import Path
+from typing import Any, Iterable, Iterator
 
 ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
-from engine.script_quality import analyze_script_quality, load_json
+from engine.script_quality import analyze_script_file, expensive_rules, registered_rules
+
+GLOB_CHARS = "*?["
+
+
+def _expand_targets(targets: list[str]) -> list[Path]:
+    """展开文件/目录/glob 为 script.json 列表（去重并保持顺序）"""
+    out: list[Path] = []
+    seen: set[Path] = set()
+
+    def add(path: Path) -> None:
+        if path.is_dir():
+            for found in sorted(path.rglob("script.json")):
+                add(found)
+            return
+        key = path.resolve()
+        if key not in seen:
+            seen.add(key)
+            out.append(path)
+
+    for target in targets:
+        if any(ch in target for ch in GLOB_CHARS):
+            for match in sorted(glob.glob(target, recursive=True)):
+                add(Path(match))
+        else:
+            add(Path(target))
+    return out
+
+
+def _check_one(path: str, min_narration_ratio: float, skip_rules: list[str], use_cache: bool) -> dict[str, Any]:
+    """子进程入口：返回可序列化的单脚本结果"""
+    try:
+        report = analyze_script_file(
+            path,
+            min_narration_ratio=min_narration_ratio,
+            skip_rules=skip_rules,
+            use_cache=use_cache,
+        )
+    except Exception as exc:  # 单个脚本损坏（如结构非法）只记为该行失败，不中断整批检查
+        return {"path": path, "passed": False, "error": f"{type(exc).__name__}: {exc}"}
+    return {"path": path, **report.to_dict()}
+
+
+def _iter_results(
+    paths: list[Path],
+    jobs: int,
+    min_narration_ratio: float,
+    skip_rules: list[str],
+    use_cache: bool,
+) -> Iterator[dict[str, Any]]:
+    """按完成顺序产出结果；进行中的任务数不超过 2*jobs，内存占用与脚本库规模无关"""
+    if jobs <= 1:
+        for path in paths:
+            yield _check_one(str(path), min_narration_ratio, skip_rules, use_cache)
+        return
+
+    pending_paths = iter(paths)
+    max_in_flight = jobs * 2
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        in_flight = set()
+        for path in pending_paths:
+            in_flight.add(pool.submit(_check_one, str(path), min_narration_ratio, skip_rules, use_cache))
+            if len(in_flight) >= max_in_flight:
+                break
+        while in_flight:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+                next_path = next(pending_paths, None)
+                if next_path is not None:
+                    in_flight.add(pool.submit(_check_one, str(next_path), min_narration_ratio, skip_rules, use_cache))
+
+
+def _summary_row(result: dict[str, Any]) -> dict[str, Any]:
+    """汇总表只保留统计与计数，不持有完整 issue 列表"""
+    row = {"path": result["path"], "passed": result["passed"], "error": result.get("error")}
+    if row["error"] is None:
+        issues = result["issues"]
+        row["errors"] = sum(1 for i in issues if i["level"] == "error")
+        row["warns"] = len(issues) - row["errors"]
+        row["scripts"] = result["stats"]["script_count"]
+        row["ratio"] = result["stats"]["narration_ratio"]
+    return row
+
+
+def _print_summary(rows: Iterable[dict[str, Any]]) -> None:
+    print(f"{'status':<6}  {'errors':>6}  {'warns':>5}  {'scripts':>7}  {'ratio':>5}  path")
+    for row in rows:
+        status = "pass" if row["passed"] else "FAIL"
+        if row["error"]:
+            print(f"{status:<6}  {'-':>6}  {'-':>5}  {'-':>7}  {'-':>5}  {row['path']}  ({row['error']})")
+            continue
+        print(
+            f"{status:<6}  {row['errors']:>6}  {row['warns']:>5}  {row['scripts']:>7}  "
+            f"{row['ratio']:>5.2f}  {row['path']}"
+        )
+
+
+def _print_single(report: dict[str, Any]) -> None:
+    stats = report["stats"]
+    print(f"storyboards={stats['storyboard_count']}")
+    print(f"scripts={stats['script_count']}")
+    print(f"narration_ratio={stats['narration_ratio']:.3f}")
+    print(f"max_text_len={stats['max_text_len']}")
+    for issue in report["issues"]:
+        print(f"[{issue['level']}] {issue['code']} @ {issue['location']}: {issue['message']}")
 
 
 def main() -> int:
     parser = argparse.ArgumentParser(description="Check script.json quality gates")
-    parser.add_argument("script_path", help="Path to script.json")
+    parser.add_argument(
+        "script_paths",
+        nargs="+",
+        help="script.json files, directories (searched recursively for script.json) or glob patterns",
+    )
     parser.add_argument("--min-narration-ratio", type=float, default=0.40)
-    parser.add_argument("--json", action="store_true", dest="as_json")
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument("--json", action="store_true", dest="as_json")
+    output.add_argument("--jsonl", action="store_true", help="Emit one JSON report per line as scripts finish")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of worker processes for multi-script checks")
+    parser.add_argument("--fast", action="store_true", help="Skip expensive rules (e.g. duplicate_text) for quick pre-checks")
+    parser.add_argument(
+        "--skip-rule",
+        action="append",
+        default=[],
+        choices=registered_rules(),
+        help="Disable a rule by name (repeatable)",
+    )
+    parser.add_argument("--timings", action="store_true", help="Print per-rule wall time (single script only, implies --no-cache)")
+    parser.add_argument("--no-cache", action="store_true", help="Ignore and do not write the .cache/ report cache")
     args = parser.parse_args()
 
-    data = load_json(args.script_path)
-    report = analyze_script_quality(data, min_narration_ratio=args.min_narration_ratio)
+    skip_rules = set(args.skip_rule)
+    if args.fast:
+        skip_rules.update(expensive_rules())
+    skip_rules = sorted(skip_rules)
+    use_cache = not (args.no_cache or args.timings)
+
+    single = len(args.script_paths) == 1 and Path(args.script_paths[0]).is_file()
+    if single and not args.jsonl:
+        report = analyze_script_file(
+            args.script_paths[0],
+            min_narration_ratio=args.min_narration_ratio,
+            skip_rules=skip_rules,
+            use_cache=use_cache,
+        )
+        if args.as_json:
+            payload = report.to_dict()
+            if args.timings:
+                payload["rule_timings"] = report.rule_timings
+            print(json.dumps(payload, ensure_ascii=False, indent=2))
+        else:
+            _print_single(report.to_dict())
+            if args.timings:
+                for name, seconds in sorted(report.rule_timings.items(), key=lambda x: x[1], reverse=True):
+                    print(f"rule_time {name}={seconds * 1000:.2f}ms")
+        return 0 if report.passed else 1
+
+    paths = _expand_targets(args.script_paths)
+    if not paths:
+        print("no script.json found", file=sys.stderr)
+        return 1
+
+    checked = 0
+    failed = 0
+    summary: list[dict[str, Any]] = []
+    for result in _iter_results(paths, args.jobs, args.min_narration_ratio, skip_rules, use_cache):
+        checked += 1
+        failed += 0 if result["passed"] else 1
+        if args.jsonl:
+            print(json.dumps(result, ensure_ascii=False), flush=True)
+        elif args.as_json:
+            summary.append(result)
+        else:
+            summary.append(_summary_row(result))
 
     if args.as_json:
-        print(json.dumps(report.to_dict(), ensure_ascii=False, indent=2))
-    else:
-        print(f"storyboards={report.stats.storyboard_count}")
-        print(f"scripts={report.stats.script_count}")
-        print(f"narration_ratio={report.stats.narration_ratio:.3f}")
-        print(f"max_text_len={report.stats.max_text_len}")
-        for issue in report.issues:
-            print(f"[{issue.level}] {issue.code} @ {issue.location}: {issue.message}")
-
-    has_error = any(i.level == "error" for i in report.issues)
-    return 1 if has_error else 0
+        summary.sort(key=lambda r: r["path"])
+        payload = {"passed": failed == 0, "checked": checked, "failed": failed, "scripts": summary}
+        print(json.dumps(payload, ensure_ascii=False, indent=2))
+    elif not args.jsonl:
+        summary.sort(key=lambda r: r["path"])
+        _print_summary(summary)
+        print(f"checked={checked} failed={failed}")
+
+    return 1 if failed else 0
 
 
 if __name__ == "__main__":
@@ -1,4 +1,5 @@
 import argparse
+import json
 import sys
 from pathlib import Path
 
@@ -6,12 +7,13 @@ ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
+from engine.novel_corpus import NovelCorpus
 from engine.script_quality import (
+    NARRATION_RANKINGS,
     analyze_script_quality,
-    enrich_narration_with_novel,
     load_json,
     normalize_and_repair_script,
-    rebuild_asset_manifest,
+    plan_narration_enrichment,
     save_json,
 )
 
@@ -22,23 +24,42 @@ def main() -> int:
     parser.add_argument("novel_path", help="Path to novel_full.md/txt")
     parser.add_argument("--target-ratio", type=float, default=0.40)
     parser.add_argument("--in-place", action="store_true", help="Write changes back to script_path")
+    parser.add_argument(
+        "--ranking",
+        choices=NARRATION_RANKINGS,
+        default="theme",
+        help="Narration candidate ranking: title keywords (theme) or bigram BM25 top-k (bm25, needs numpy)",
+    )
+    parser.add_argument(
+        "--patch-out",
+        help="Also write the narration insertions as a JSON Patch (RFC 6902) file for review",
+    )
     args = parser.parse_args()
 
     script_path = Path(args.script_path)
     novel_path = Path(args.novel_path)
     data = load_json(script_path)
-    novel_text = novel_path.read_text(encoding="utf-8")
+    corpus = NovelCorpus.load(novel_path)
 
     before = analyze_script_quality(data, min_narration_ratio=args.target_ratio)
-    enriched = enrich_narration_with_novel(data, novel_text, target_ratio=args.target_ratio)
-    repaired = normalize_and_repair_script(enriched)
-    rebuild_asset_manifest(repaired)
+    plan = plan_narration_enrichment(data, corpus, target_ratio=args.target_ratio, ranking=args.ranking)
+    if args.patch_out:
+        patch_text = json.dumps(plan.to_json_patch(), ensure_ascii=False, indent=2)
+        Path(args.patch_out).write_text(patch_text, encoding="utf-8")
+        print(f"patch={args.patch_out} ops={len(plan)}")
+    enriched = plan.apply(data)
+    repaired = normalize_and_repair_script(enriched, in_place=True)
 
     shared = repaired.setdefault("shared", {})
     ps = shared.setdefault("pipeline_state", {})
     ps["stage"] = "module2_completed"
     ps["module2_result"] = "pass_narrative_enriched"
-    ps["module3_result"] = "pending_rebind_after_module2"
+    # 段落 id 保持稳定，模块3只需按 segment_id_map 重绑拆分/新增的段落
+    id_map = ps["segment_id_map"]
+    if id_map["renamed"] or id_map["added"]:
+        ps["module3_result"] = "pending_partial_rebind_after_module2"
+    else:
+        ps["module3_result"] = "up_to_date"
     ps["updated_at"] = "2026-03-11"
 
     after = analyze_script_quality(repaired, min_narration_ratio=args.target_ratio)
@@ -47,6 +68,8 @@ def main() -> int:
     print(f"after_ratio={after.stats.narration_ratio:.3f}")
     print(f"before_scripts={before.stats.script_count}")
     print(f"after_scripts={after.stats.script_count}")
+    print(f"renamed_segments={len(id_map['renamed'])}")
+    print(f"added_segments={len(id_map['added'])}")
 
     out = script_path if args.in_place else script_path.with_name(script_path.stem + ".enriched.json")
     save_json(out, repaired)
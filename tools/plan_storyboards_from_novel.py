@@ -7,7 +7,13 @@ ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
-from engine.storyboard_planner import build_storyboard_drafts
+from engine.novel_corpus import NovelCorpus
+from engine.storyboard_planner import (
+    PlannerVocabulary,
+    build_storyboard_drafts,
+    build_storyboard_drafts_from_file,
+    plan_background_assets,
+)
 
 
 def main() -> int:
@@ -15,10 +21,46 @@ def main() -> int:
     parser.add_argument("novel_path", help="Path to novel_full.md/txt")
     parser.add_argument("--target-count", type=int, default=6)
     parser.add_argument("--output", help="Optional output json path")
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Scan the novel file line by line (mmap) and stop after the needed chapters; skips the sidecar index",
+    )
+    parser.add_argument("--workers", type=int, default=0, help="With --stream, build drafts in a process pool")
+    parser.add_argument(
+        "--vocabulary",
+        help="JSON file with scene tag / paragraph score keyword rules (defaults to the built-in tables)",
+    )
+    parser.add_argument(
+        "--asset-worklist",
+        help="Share one background among drafts with the same scene tags and write the deduplicated background list here",
+    )
     args = parser.parse_args()
 
-    text = Path(args.novel_path).read_text(encoding="utf-8")
-    drafts = build_storyboard_drafts(text, target_count=args.target_count)
+    vocabulary = PlannerVocabulary.load(args.vocabulary) if args.vocabulary else None
+    if args.stream:
+        drafts = build_storyboard_drafts_from_file(
+            args.novel_path,
+            target_count=args.target_count,
+            workers=args.workers,
+            vocabulary=vocabulary,
+        )
+    else:
+        corpus = NovelCorpus.load(args.novel_path)
+        drafts = build_storyboard_drafts(corpus, target_count=args.target_count, vocabulary=vocabulary)
+
+    if args.asset_worklist:
+        assets = plan_background_assets(drafts)
+        worklist = [
+            {"id": a.id, "image": a.image, "tags": list(a.tags), "storyboards": a.storyboard_ids}
+            for a in assets
+        ]
+        Path(args.asset_worklist).write_text(json.dumps(worklist, ensure_ascii=False, indent=2), encoding="utf-8")
+        # 未指定 --output 时分镜 JSON 打印到 stdout，统计行走 stderr 以免混入
+        print(
+            f"asset_worklist={args.asset_worklist} backgrounds={len(assets)} storyboards={len(drafts)}",
+            file=sys.stdout if args.output else sys.stderr,
+        )
 
     payload = [
         {
@@ -26,6 +68,7 @@ def main() -> int:
             "title": d.title,
             "summary": d.summary,
             "background": {"image": d.background_image},
+            "source_span": list(d.source_span) if d.source_span else None,
         }
         for d in drafts
     ]